@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Time compressing file submissions of various types with gzip at the
+maximum level, as every upload used to be, and at the level chosen for
+them by `store.compression_level`.
+
+The files are generated in memory; nothing is written to disk and gpg
+isn't involved. From the securedrop directory, run:
+
+    python -m benchmarks.compression [--size 16] [--runs 3]
+"""
+
+import argparse
+import os
+import time
+import zipfile
+
+from cStringIO import StringIO
+
+from store import COMPRESS_MAX, GzipStream, compression_level
+
+DICTIONARIES = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), 'dictionaries')
+
+
+def make_files(size):
+    """Return (name, contents) pairs of roughly `size` bytes, one for each
+    kind of file we expect to be uploaded."""
+    with open(os.path.join(DICTIONARIES, 'nouns.txt')) as f:
+        words = f.read().split()
+    text = []
+    length = 0
+    n = 0
+    while length < size:
+        word = words[n % len(words)] + (' ' if n % 13 else '.\n')
+        text.append(word)
+        length += len(word)
+        n += 7919
+    text = ''.join(text)[:size]
+
+    archive = StringIO()
+    with zipfile.ZipFile(archive, 'w', zipfile.ZIP_DEFLATED) as z:
+        z.writestr('leak.txt', text)
+        z.writestr('leak.bin', os.urandom(size // 2))
+
+    # PDFs mix compressed streams (such as images) with plain text
+    pdf = ['%PDF-1.4\n']
+    while sum(len(part) for part in pdf) < size:
+        pdf.append(text[:4096])
+        pdf.append(os.urandom(16384))
+    pdf = ''.join(pdf)[:size]
+
+    return [
+        ('leak.txt', text),
+        ('leak.csv', ''.join('{},{},{}\n'.format(n, n * 7, n % 97)
+                             for n in range(size // 16))[:size]),
+        ('leak.pdf', pdf),
+        ('leak.zip', archive.getvalue()),
+        ('leak.jpg', '\xff\xd8\xff\xe0' + os.urandom(size - 4)),
+        ('leak.mp4', '\x00\x00\x00\x18ftypmp42' + os.urandom(size - 12)),
+        ('leak.bin', os.urandom(size)),
+    ]
+
+
+def time_gzip(name, data, level, runs):
+    """Return the best throughput, in MB/s, of compressing `data` at
+    `level`, and the compressed size as a fraction of the original."""
+    times = []
+    for _ in range(runs):
+        stream = GzipStream(StringIO(data), name, compresslevel=level)
+        start = time.time()
+        length = 0
+        while True:
+            buf = stream.read(GzipStream.CHUNK_SIZE)
+            if not buf:
+                break
+            length += len(buf)
+        times.append(time.time() - start)
+    return (len(data) / (1024.0 * 1024) / max(min(times), 1e-6),
+            length / float(len(data)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--size', type=int, default=16,
+                        help='size of each file in MiB')
+    parser.add_argument('--runs', type=int, default=3,
+                        help='times to compress each file, the best counts')
+    args = parser.parse_args()
+
+    print('{:<10}{:>7}{:>12}{:>8}{:>12}{:>8}'.format(
+        'file', 'level', 'max MB/s', 'ratio', 'MB/s', 'ratio'))
+    for name, data in make_files(args.size * 1024 * 1024):
+        level = compression_level(data[:GzipStream.CHUNK_SIZE])
+        max_speed, max_ratio = time_gzip(name, data, COMPRESS_MAX, args.runs)
+        speed, ratio = time_gzip(name, data, level, args.runs)
+        print('{:<10}{:>7}{:>12.1f}{:>8.3f}{:>12.1f}{:>8.3f}'.format(
+            name, level, max_speed, max_ratio, speed, ratio))
+
+
+if __name__ == '__main__':  # pragma: no cover
+    main()
@@ -0,0 +1,191 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Time the hot database queries of the journalist and source interfaces
+on a large SQLite database, with and without the indexes added by the
+first schema migration.
+
+The database is built in a temporary directory and thrown away afterwards;
+the configured SecureDrop database isn't touched. From the securedrop
+directory, run:
+
+    python -m benchmarks.db_queries [--sources 10000] [--submissions 10]
+"""
+
+import argparse
+import datetime
+import os
+import random
+import shutil
+import tempfile
+import time
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.sql.expression import false
+
+import migrations
+from db import db
+from models import (Journalist, JournalistLoginAttempt, Reply, Source,
+                    Submission)
+
+DICTIONARIES = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), 'dictionaries')
+
+
+def populate(engine, num_sources, num_submissions, num_replies,
+             num_login_attempts):
+    with open(os.path.join(DICTIONARIES, 'adjectives.txt')) as f:
+        adjectives = f.read().split()
+    with open(os.path.join(DICTIONARIES, 'nouns.txt')) as f:
+        nouns = f.read().split()
+    now = datetime.datetime.utcnow()
+
+    engine.execute(Journalist.__table__.insert(),
+                   [{'id': 1, 'username': 'journalist'}])
+
+    sources = []
+    submissions = []
+    replies = []
+    for source_id in range(1, num_sources + 1):
+        designation = '{} {}'.format(random.choice(adjectives),
+                                     random.choice(nouns))
+        sources.append({
+            'id': source_id,
+            'filesystem_id': '{:096x}'.format(source_id),
+            'journalist_designation': designation,
+            'last_updated': now - datetime.timedelta(minutes=source_id),
+            'pending': False,
+            'interaction_count': num_submissions + num_replies,
+        })
+        journalist_filename = designation.replace(' ', '_')
+        for n in range(1, num_submissions + 1):
+            submissions.append({
+                'source_id': source_id,
+                'interaction_index': n,
+                'filename': '{}-{}-msg.gpg'.format(n, journalist_filename),
+                'size': 1024,
+                # Most submissions have been read already
+                'downloaded': n < num_submissions,
+            })
+        for n in range(num_submissions + 1,
+                       num_submissions + num_replies + 1):
+            replies.append({
+                'journalist_id': 1,
+                'source_id': source_id,
+                'interaction_index': n,
+                'filename': '{}-{}-reply.gpg'.format(n, journalist_filename),
+                'size': 1024,
+            })
+
+    engine.execute(Source.__table__.insert(), sources)
+    engine.execute(Submission.__table__.insert(), submissions)
+    engine.execute(Reply.__table__.insert(), replies)
+    engine.execute(JournalistLoginAttempt.__table__.insert(), [
+        {'journalist_id': 1,
+         'timestamp': now - datetime.timedelta(minutes=n)}
+        for n in range(num_login_attempts)])
+
+    return sources, submissions, replies
+
+
+def hot_queries(session, sources, submissions, replies):
+    """Return (name, function) pairs for the queries to time. Each function
+    runs its query once, for a random row."""
+    def unread_submissions():
+        source = random.choice(sources)
+        session.query(Submission).filter(
+            Submission.downloaded == false(),
+            Submission.source_id == source['id']).all()
+
+    def submission_by_filename():
+        submission = random.choice(submissions)
+        session.query(Submission).filter(
+            Submission.filename == submission['filename']).one()
+
+    def reply_by_filename():
+        reply = random.choice(replies)
+        session.query(Reply).filter(
+            Reply.filename == reply['filename']).one()
+
+    def source_replies():
+        source = random.choice(sources)
+        session.query(Reply).filter(Reply.source_id == source['id']).all()
+
+    def recent_login_attempts():
+        period = datetime.datetime.utcnow() - datetime.timedelta(seconds=60)
+        session.query(JournalistLoginAttempt).filter(
+            JournalistLoginAttempt.timestamp > period).all()
+
+    def designation_prefix():
+        prefix = random.choice(sources)['journalist_designation'][:3]
+        upper = prefix[:-1] + unichr(ord(prefix[-1]) + 1)
+        session.query(Source).filter(
+            Source.journalist_designation >= prefix,
+            Source.journalist_designation < upper).all()
+
+    return [('unread submissions of a source', unread_submissions),
+            ('submission by filename', submission_by_filename),
+            ('reply by filename', reply_by_filename),
+            ('replies of a source', source_replies),
+            ('recent login attempts', recent_login_attempts),
+            ('source designation prefix', designation_prefix)]
+
+
+def time_query(query, repeat):
+    """Return the median time of `query` in milliseconds."""
+    times = []
+    for _ in range(repeat):
+        start = time.time()
+        query()
+        times.append((time.time() - start) * 1000)
+    times.sort()
+    return times[len(times) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--sources', type=int, default=10000)
+    parser.add_argument('--submissions', type=int, default=10,
+                        help='submissions per source')
+    parser.add_argument('--replies', type=int, default=2,
+                        help='replies per source')
+    parser.add_argument('--login-attempts', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=50,
+                        help='runs of each query to take the median of')
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    try:
+        engine = create_engine('sqlite:///' +
+                               os.path.join(directory, 'db.sqlite'))
+        db.Model.metadata.create_all(engine)
+
+        print('Creating {} sources with {} submissions and {} replies '
+              'each...'.format(args.sources, args.submissions, args.replies))
+        rows = populate(engine, args.sources, args.submissions, args.replies,
+                        args.login_attempts)
+        indexes = migrations.MIGRATIONS[0]
+        with engine.begin() as connection:
+            for statement in indexes.downgrade:
+                connection.execute(statement)
+        session = sessionmaker(bind=engine)()
+        queries = hot_queries(session, *rows)
+
+        before = [time_query(query, args.repeat) for _, query in queries]
+        with engine.begin() as connection:
+            for statement in indexes.upgrade:
+                connection.execute(statement)
+            connection.execute('ANALYZE')
+        after = [time_query(query, args.repeat) for _, query in queries]
+
+        print('{:<32}{:>18}{:>18}'.format('query (median ms)',
+                                          'without indexes', 'with indexes'))
+        for (name, _), b, a in zip(queries, before, after):
+            print('{:<32}{:>18.3f}{:>18.3f}'.format(name, b, a))
+        session.close()
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':  # pragma: no cover
+    main()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Time generating source reply keypairs, and encrypting and decrypting
+replies with them, for each of the reply key profiles and crypto backends.
+
+Keys are generated in a temporary keyring which is thrown away afterwards;
+the configured SecureDrop keyring isn't touched. Generating RSA keys may
+block waiting for entropy. From the securedrop directory, run:
+
+    python -m benchmarks.reply_keys [--keys 5] [--messages 20] [--backend pgpy]
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+from crypto_util import (CRYPTO_BACKENDS, FingerprintIndex,
+                         REPLY_KEY_PROFILES, gen_reply_keypair,
+                         get_crypto_backend)
+
+
+def median(times):
+    times = sorted(times)
+    return times[len(times) // 2]
+
+
+def time_profile(backend, fingerprint_index, profile, num_keys, num_messages,
+                 message):
+    """Return the median times, in milliseconds, for `backend` to generate
+    a keypair of `profile`, encrypt `message` to it and decrypt it again."""
+    passphrase = 'correct horse battery staple'
+    keygen_times = []
+    fingerprints = []
+    for n in range(num_keys):
+        start = time.time()
+        fingerprint = gen_reply_keypair(backend, fingerprint_index,
+                                        '{}{}'.format(profile.upper(), n),
+                                        passphrase,
+                                        REPLY_KEY_PROFILES[profile])
+        keygen_times.append((time.time() - start) * 1000)
+        if not fingerprint:
+            raise RuntimeError("failed to generate a {} key".format(profile))
+        fingerprints.append(fingerprint)
+
+    encrypt_times = []
+    decrypt_times = []
+    for n in range(num_messages):
+        fingerprint = fingerprints[n % len(fingerprints)]
+        start = time.time()
+        ciphertext = backend.encrypt(message, [fingerprint])
+        encrypt_times.append((time.time() - start) * 1000)
+
+        start = time.time()
+        plaintext = backend.decrypt(ciphertext, passphrase)
+        decrypt_times.append((time.time() - start) * 1000)
+        if plaintext != message:
+            raise RuntimeError("{} round trip failed".format(profile))
+
+    return median(keygen_times), median(encrypt_times), median(decrypt_times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--keys', type=int, default=5,
+                        help='keypairs to generate per profile')
+    parser.add_argument('--messages', type=int, default=20,
+                        help='messages to encrypt and decrypt per profile')
+    parser.add_argument('--size', type=int, default=1024,
+                        help='size of each message in bytes')
+    parser.add_argument('--profile', action='append',
+                        choices=sorted(REPLY_KEY_PROFILES),
+                        help='profile to time, may be repeated '
+                             '(default: all of them)')
+    parser.add_argument('--backend', action='append',
+                        choices=sorted(CRYPTO_BACKENDS),
+                        help='crypto backend to time, may be repeated '
+                             '(default: gnupg)')
+    args = parser.parse_args()
+
+    message = os.urandom(args.size)
+    directory = tempfile.mkdtemp()
+    try:
+        fingerprint_index = FingerprintIndex.for_keyring(directory)
+
+        results = []
+        for backend_name in args.backend or ['gnupg']:
+            backend = get_crypto_backend(backend_name, directory)
+            for profile in args.profile or sorted(REPLY_KEY_PROFILES):
+                name = '{} {}'.format(backend_name, profile)
+                print('Timing {}...'.format(name))
+                results.append((name, time_profile(
+                    backend, fingerprint_index, profile, args.keys,
+                    args.messages, message)))
+
+        print('{:<22}{:>12}{:>12}{:>12}'.format('median ms', 'keygen',
+                                                'encrypt', 'decrypt'))
+        for name, (keygen, encrypt, decrypt) in results:
+            print('{:<22}{:>12.1f}{:>12.1f}{:>12.1f}'.format(
+                name, keygen, encrypt, decrypt))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':  # pragma: no cover
+    main()
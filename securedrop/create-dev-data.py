@@ -50,7 +50,9 @@ def create_source_and_submissions(num_submissions=2):
 
         # Generate submissions directory and generate source key
         os.mkdir(app.storage.path(source.filesystem_id))
-        app.crypto_util.genkeypair(source.filesystem_id, codename)
+        app.crypto_util.genkeypair(
+            source.filesystem_id,
+            app.crypto_util.derive_passphrase(codename))
 
         # Generate some test submissions
         for _ in range(num_submissions):
@@ -1,15 +1,30 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import errno
+import fcntl
 import gnupg
+import json
 import os
-import scrypt
-import subprocess
+import re
+import scrypt_pool
+import tempfile
+import threading
 
 from base64 import b32encode
+from contextlib import contextmanager
 from Cryptodome.Random import random
 from flask import current_app
 from gnupg._util import _is_stream, _make_binary_stream
+from multiprocessing.pool import ThreadPool
+
+try:
+    import pgpy
+    from pgpy.constants import (CompressionAlgorithm, EllipticCurveOID,
+                                HashAlgorithm, KeyFlags, PubKeyAlgorithm,
+                                SymmetricKeyAlgorithm)
+except ImportError:  # pragma: no cover
+    pgpy = None
 
 import typing
 # https://www.python.org/dev/peps/pep-0484/#runtime-or-type-checking
@@ -18,7 +33,7 @@ if typing.TYPE_CHECKING:
     # That is why all type annotation relative import
     # statements has to be marked as noqa.
     # http://flake8.pycqa.org/en/latest/user/error-codes.html?highlight=f401stream
-    from typing import Dict, List, Text  # noqa: F401
+    from typing import Dict, List, Set, Text  # noqa: F401
 
 # to fix gpg error #78 on production
 os.environ['USERNAME'] = 'www-data'
@@ -28,9 +43,494 @@ class CryptoException(Exception):
     pass
 
 
+# Parameters for gpg's unattended generation of source reply keypairs, by
+# the name of the REPLY_KEY_PROFILE selecting them. Curve25519 keys are much
+# faster to generate and use than RSA ones, but need GnuPG 2.1 or later.
+REPLY_KEY_PROFILES = {
+    'rsa4096': {'key_type': 'RSA', 'key_length': 4096},
+    'curve25519': {'key_type': 'EDDSA', 'key_curve': 'ed25519',
+                   'subkey_type': 'ECDH', 'subkey_curve': 'cv25519'},
+}  # type: Dict[str, Dict[str, object]]
+DEFAULT_REPLY_KEY_PROFILE = 'rsa4096'
+
+DEFAULT_CRYPTO_BACKEND = 'gnupg'
+DEFAULT_CRYPTO_BATCH_THREADS = 4
+
+# GPG user ids have the form "Name <email>"; reply keypairs use the source's
+# filesystem id as the email part.
+KEY_UID_EMAIL = re.compile(r'<([^>]+)>').search
+
+
+class FingerprintIndex(object):
+    """Persistent mapping of source filesystem ids to the fingerprints of
+    their reply keypairs.
+
+    Finding a source's key by scanning the keyring means running gpg and
+    parsing every key it holds, once per lookup. The index is a small JSON
+    file kept next to the keyring instead, re-read only when another process
+    has replaced it, so that lookups are a dict access. Updates are
+    serialized across processes with an exclusive lock and written
+    atomically.
+
+    On a keyring that predates the index, the first lookup or update builds
+    it with `scan`, which returns the whole mapping (see
+    :func:`scan_keyring`), so that no existing key is left out of it.
+    """
+
+    def __init__(self, path, scan=None):
+        self.path = path
+        self.__lock_path = path + '.lock'
+        self.__scan = scan
+        self.__index = {}  # type: Dict[str, str]
+        self.__stat = None
+
+    @classmethod
+    def for_keyring(cls, gpg_key_dir, scan=None):
+        return cls(os.path.join(gpg_key_dir, 'fingerprints.json'), scan)
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def get(self, filesystem_id):
+        if self.__scan is not None and not self.exists():
+            with self.__locked():
+                self.__build()
+        self.__reload()
+        return self.__index.get(filesystem_id)
+
+    def set(self, filesystem_id, fingerprint):
+        with self.__locked():
+            self.__build()
+            self.__reload()
+            index = dict(self.__index)
+            index[filesystem_id] = fingerprint
+            self.__write(index)
+
+    def delete(self, filesystem_id):
+        self.delete_many([filesystem_id])
+
+    def delete_many(self, filesystem_ids):
+        with self.__locked():
+            self.__build()
+            self.__reload()
+            index = dict(self.__index)
+            for filesystem_id in filesystem_ids:
+                index.pop(filesystem_id, None)
+            if len(index) == len(self.__index):
+                return
+            self.__write(index)
+
+    def replace(self, index):
+        with self.__locked():
+            self.__write(dict(index))
+
+    def __build(self):
+        # Must be called with the lock held
+        if self.__scan is not None and not self.exists():
+            self.__write(dict(self.__scan()))
+
+    def __reload(self):
+        try:
+            st = os.stat(self.path)
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                raise
+            self.__index, self.__stat = {}, None
+            return
+        stat = (st.st_ino, st.st_size, st.st_mtime)
+        if stat != self.__stat:
+            with open(self.path) as f:
+                self.__index = dict((str(k), str(v))
+                                    for k, v in json.load(f).items())
+            self.__stat = stat
+
+    def __write(self, index):
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(self.path),
+                                        prefix='.fingerprints-')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(index, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.rename(tmp_path, self.path)
+        except Exception:
+            os.remove(tmp_path)
+            raise
+        self.__index = index
+        self.__stat = None
+
+    @contextmanager
+    def __locked(self):
+        with open(self.__lock_path, 'a') as f:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+class GnuPGBackend(object):
+    """OpenPGP operations run by gpg2, through python-gnupg. Each operation
+    starts a gpg2 process.
+    """
+
+    NAME = 'gnupg'
+    # Operations are independent gpg2 processes, so they can run at once
+    CONCURRENT = True
+
+    def __init__(self, gpg_key_dir):
+        self.gpg = gnupg.GPG(binary='gpg2', homedir=gpg_key_dir)
+
+    @staticmethod
+    def supports(key_params):
+        """Return whether keys with parameters from `REPLY_KEY_PROFILES`
+        can be generated."""
+        return True
+
+    def gen_key(self, name, passphrase, key_params):
+        """Generate a keypair whose user id has the email address `name`,
+        with parameters from `REPLY_KEY_PROFILES`. Returns its fingerprint,
+        or None if generation failed."""
+        genkey_obj = self.gpg.gen_key(self.gpg.gen_key_input(
+            passphrase=passphrase,
+            name_email=name,
+            **key_params
+        ))
+        return genkey_obj.fingerprint or None
+
+    def list_keys(self):
+        """Return (fingerprint, user ids) pairs for the keys in the
+        keyring."""
+        return [(key['fingerprint'], key['uids'])
+                for key in self.gpg.list_keys()]
+
+    def import_keys(self, key_data):
+        """Import armored keys. Returns their fingerprints."""
+        return self.gpg.import_keys(key_data).fingerprints
+
+    def export_key(self, fingerprint, secret=False):
+        return self.gpg.export_keys(fingerprint, secret=secret)
+
+    def delete_key(self, fingerprint):
+        self.delete_keys([fingerprint])
+
+    def delete_keys(self, fingerprints):
+        """Delete the keypairs `fingerprints`, with one gpg2 run for their
+        private keys and one for their public keys."""
+        if not fingerprints:
+            return
+        # The private key needs to be deleted before the public key can be
+        # deleted. http://pythonhosted.org/python-gnupg/#deleting-keys
+        self.gpg.delete_keys(list(fingerprints), True)  # private keys
+        self.gpg.delete_keys(list(fingerprints))  # public keys
+
+    def encrypt(self, plaintext, fingerprints, output=None, compress=True):
+        """Encrypt `plaintext`, a string or stream, to all of
+        `fingerprints`, writing the ciphertext to the file `output` if it's
+        given. Unless `compress` is true, the plaintext isn't compressed
+        first, which is a waste of time if it's compressed already. Returns
+        the ciphertext."""
+        if not _is_stream(plaintext):
+            plaintext = _make_binary_stream(plaintext, "utf_8")
+
+        out = self.gpg.encrypt(plaintext,
+                               *fingerprints,
+                               output=output,
+                               always_trust=True,
+                               armor=False,
+                               compress_algo=('ZLIB' if compress
+                                              else 'Uncompressed'))
+        if out.ok:
+            return out.data
+        else:
+            raise CryptoException(out.stderr)
+
+    def decrypt(self, ciphertext, passphrase=None):
+        """Return the plaintext of `ciphertext`, or an empty string if no
+        key it can be decrypted with is available."""
+        return self.gpg.decrypt(ciphertext, passphrase=passphrase).data
+
+
+class PGPyBackend(object):
+    """OpenPGP operations done in process by PGPy, without running gpg, so
+    they don't pay for starting a process each time. Messages are
+    interoperable with gpg's, but are held in memory while they're
+    encrypted, so streams (like file submissions) to keys gpg has are
+    encrypted by gpg instead. Streams to keys only this backend has are
+    read into memory whole.
+
+    Keys generated or imported by this backend are kept in the keyring
+    directory as armored files, one per key. Keys in gpg's own keyring
+    files are read too, so that keys made before switching backends, like
+    the journalist's, keep working. Curve25519 keys need PGPy 0.5 or later.
+    """
+
+    NAME = 'pgpy'
+    # Pure Python, so threads would only contend for the GIL
+    CONCURRENT = False
+
+    def __init__(self, gpg_key_dir):
+        if pgpy is None:
+            raise CryptoException("the pgpy crypto backend needs PGPy")
+        self.__gpg_key_dir = gpg_key_dir
+        self.__key_dir = os.path.join(gpg_key_dir, 'pgpy')
+        self.__lock = threading.Lock()
+        # fingerprint -> key, secret rather than public where we have both
+        self.__keys = {}  # type: Dict[str, pgpy.PGPKey]
+        # fingerprints of the keys read from gpg's keyring files
+        self.__gpg_keys = set()  # type: Set[str]
+        self.__gnupg = None
+        self.__load_gpg_keyrings()
+
+    @staticmethod
+    def supports(key_params):
+        """See :meth:`GnuPGBackend.supports`."""
+        return key_params['key_type'] == 'RSA' or \
+            (key_params['key_type'] == 'EDDSA' and
+             hasattr(PubKeyAlgorithm, 'EdDSA'))
+
+    def gen_key(self, name, passphrase, key_params):
+        """See :meth:`GnuPGBackend.gen_key`."""
+        key_type = key_params['key_type']
+        if key_type == 'RSA':
+            key = pgpy.PGPKey.new(PubKeyAlgorithm.RSAEncryptOrSign,
+                                  key_params['key_length'])
+        elif self.supports(key_params):
+            key = pgpy.PGPKey.new(PubKeyAlgorithm.EdDSA,
+                                  EllipticCurveOID.Ed25519)
+        else:
+            raise CryptoException(
+                "unsupported key type for the pgpy backend: {}".format(
+                    key_type))
+
+        usage = set([KeyFlags.Certify, KeyFlags.Sign])
+        encryption = set([KeyFlags.EncryptCommunications,
+                          KeyFlags.EncryptStorage])
+        if 'subkey_type' not in key_params:
+            usage |= encryption
+        # gpg names keys it generates the same way
+        key.add_uid(pgpy.PGPUID.new('Autogenerated Key', email=name),
+                    usage=usage,
+                    hashes=[HashAlgorithm.SHA512, HashAlgorithm.SHA256],
+                    ciphers=[SymmetricKeyAlgorithm.AES256],
+                    compression=[CompressionAlgorithm.ZLIB,
+                                 CompressionAlgorithm.Uncompressed])
+        if 'subkey_type' in key_params:
+            key.add_subkey(pgpy.PGPKey.new(PubKeyAlgorithm.ECDH,
+                                           EllipticCurveOID.Curve25519),
+                           usage=encryption)
+        key.protect(passphrase, SymmetricKeyAlgorithm.AES256,
+                    HashAlgorithm.SHA256)
+        return self.__store(key)
+
+    def list_keys(self):
+        """See :meth:`GnuPGBackend.list_keys`."""
+        with self.__lock:
+            self.__reload()
+            return [(fingerprint,
+                     ['{} <{}>'.format(uid.name, uid.email)
+                      for uid in key.userids])
+                    for fingerprint, key in self.__keys.items()]
+
+    def import_keys(self, key_data):
+        """See :meth:`GnuPGBackend.import_keys`."""
+        key, others = pgpy.PGPKey.from_blob(key_data)
+        return [self.__store(k) for k in [key] + list(others.values())]
+
+    def export_key(self, fingerprint, secret=False):
+        key = self.__get(fingerprint)
+        if key is None:
+            return ''
+        if secret:
+            return '' if key.is_public else str(key)
+        return str(key if key.is_public else key.pubkey)
+
+    def delete_key(self, fingerprint):
+        self.delete_keys([fingerprint])
+
+    def delete_keys(self, fingerprints):
+        """See :meth:`GnuPGBackend.delete_keys`."""
+        with self.__lock:
+            gpg_keys = []
+            for fingerprint in fingerprints:
+                self.__keys.pop(fingerprint, None)
+                if fingerprint in self.__gpg_keys:
+                    self.__gpg_keys.discard(fingerprint)
+                    gpg_keys.append(fingerprint)
+                try:
+                    os.remove(self.__path(fingerprint))
+                except OSError as e:
+                    if e.errno != errno.ENOENT:
+                        raise
+            if gpg_keys:
+                # We can't edit gpg's keyring files ourselves
+                self.__get_gnupg().delete_keys(gpg_keys)
+
+    def encrypt(self, plaintext, fingerprints, output=None, compress=True):
+        """See :meth:`GnuPGBackend.encrypt`."""
+        if _is_stream(plaintext):
+            if not any(os.path.exists(self.__path(fingerprint))
+                       for fingerprint in fingerprints):
+                # Streamed through gpg rather than read into memory
+                return self.__get_gnupg().encrypt(plaintext, fingerprints,
+                                                  output, compress=compress)
+            plaintext = plaintext.read()
+        if isinstance(plaintext, unicode):
+            plaintext = plaintext.encode('utf-8')
+        message = pgpy.PGPMessage.new(
+            bytearray(plaintext),
+            compression=(CompressionAlgorithm.ZIP if compress
+                         else CompressionAlgorithm.Uncompressed))
+
+        # Every recipient gets the same session key
+        cipher = SymmetricKeyAlgorithm.AES256
+        session_key = cipher.gen_key()
+        for fingerprint in fingerprints:
+            key = self.__get(fingerprint)
+            if key is None:
+                raise CryptoException(
+                    "no public key for {}".format(fingerprint))
+            if not key.is_public:
+                key = key.pubkey
+            message = key.encrypt(message, cipher=cipher,
+                                  sessionkey=session_key)
+        del session_key
+
+        # bytes() is str() on Python 2, which would give the armored form
+        data = bytes(message.__bytes__())
+        if output:
+            with open(output, 'wb') as f:
+                f.write(data)
+        return data
+
+    def decrypt(self, ciphertext, passphrase=None):
+        """See :meth:`GnuPGBackend.decrypt`."""
+        try:
+            message = pgpy.PGPMessage.from_blob(ciphertext)
+        except (ValueError, pgpy.errors.PGPError):
+            return ''
+        for key in self.__secret_keys(message.encrypters):
+            try:
+                if key.is_protected:
+                    if passphrase is None:
+                        continue
+                    with key.unlock(passphrase):
+                        plaintext = key.decrypt(message).message
+                else:
+                    plaintext = key.decrypt(message).message
+            except (pgpy.errors.PGPError, pgpy.errors.PGPDecryptionError):
+                # A wrong passphrase, or a key for another message
+                continue
+            if isinstance(plaintext, unicode):
+                return plaintext.encode('utf-8')
+            return bytes(plaintext)
+        return ''
+
+    def __path(self, fingerprint):
+        return os.path.join(self.__key_dir, fingerprint + '.asc')
+
+    def __get_gnupg(self):
+        if self.__gnupg is None:
+            self.__gnupg = GnuPGBackend(self.__gpg_key_dir)
+        return self.__gnupg
+
+    def __store(self, key):
+        fingerprint = str(key.fingerprint).replace(' ', '')
+        with self.__lock:
+            existing = self.__keys.get(fingerprint)
+            if existing is not None and key.is_public and \
+                    not existing.is_public:
+                return fingerprint
+            if not os.path.isdir(self.__key_dir):
+                os.mkdir(self.__key_dir, 0o700)
+            fd, tmp_path = tempfile.mkstemp(dir=self.__key_dir,
+                                            prefix='.key-')
+            try:
+                with os.fdopen(fd, 'w') as f:
+                    f.write(str(key))
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.rename(tmp_path, self.__path(fingerprint))
+            except Exception:
+                os.remove(tmp_path)
+                raise
+            self.__keys[fingerprint] = key
+        return fingerprint
+
+    def __get(self, fingerprint):
+        with self.__lock:
+            key = self.__keys.get(fingerprint)
+            if key is None:
+                # Another process may have generated it
+                self.__reload()
+                key = self.__keys.get(fingerprint)
+            return key
+
+    def __secret_keys(self, key_ids):
+        """Return the secret keys with a (sub)key id in `key_ids`."""
+        with self.__lock:
+            self.__reload()
+            keys = list(self.__keys.values())
+        return [key for key in keys
+                if not key.is_public and
+                (key.fingerprint.keyid in key_ids or
+                 any(key_id in key_ids for key_id in key.subkeys))]
+
+    def __reload(self):
+        """Pick up the key files added or removed by other processes.
+        Must be called with the lock held."""
+        try:
+            names = os.listdir(self.__key_dir)
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                raise
+            names = []
+        stored = set(name[:-len('.asc')] for name in names
+                     if name.endswith('.asc'))
+        for fingerprint in list(self.__keys):
+            if fingerprint not in stored and \
+                    fingerprint not in self.__gpg_keys:
+                del self.__keys[fingerprint]
+        for fingerprint in stored - set(self.__keys):
+            key, _ = pgpy.PGPKey.from_file(self.__path(fingerprint))
+            self.__keys[fingerprint] = key
+
+    def __load_gpg_keyrings(self):
+        # gpg 2.1 and later keep public keys in pubring.kbx and secret ones
+        # in private-keys-v1.d, neither of which PGPy reads
+        for name in ('pubring.gpg', 'secring.gpg'):
+            path = os.path.join(self.__gpg_key_dir, name)
+            if not os.path.exists(path) or os.path.getsize(path) == 0:
+                continue
+            key, others = pgpy.PGPKey.from_file(path)
+            for k in [key] + list(others.values()):
+                fingerprint = str(k.fingerprint).replace(' ', '')
+                existing = self.__keys.get(fingerprint)
+                if existing is None or existing.is_public:
+                    self.__keys[fingerprint] = k
+                self.__gpg_keys.add(fingerprint)
+        with self.__lock:
+            self.__reload()
+
+
+CRYPTO_BACKENDS = {
+    GnuPGBackend.NAME: GnuPGBackend,
+    PGPyBackend.NAME: PGPyBackend,
+}
+
+
+def get_crypto_backend(name, gpg_key_dir):
+    """Return the crypto backend called `name`, with its keys in
+    `gpg_key_dir`."""
+    try:
+        backend = CRYPTO_BACKENDS[name]
+    except KeyError:
+        raise CryptoException("unknown crypto backend: {}".format(name))
+    return backend(gpg_key_dir)
+
+
 class CryptoUtil:
 
-    GPG_KEY_TYPE = "RSA"
     DEFAULT_WORDS_IN_RANDOM_ID = 8
 
     def __init__(self,
@@ -41,17 +541,25 @@ class CryptoUtil:
                  word_list,
                  nouns_file,
                  adjectives_file,
-                 gpg_key_dir):
+                 gpg_key_dir,
+                 reply_key_profile=DEFAULT_REPLY_KEY_PROFILE,
+                 crypto_backend=DEFAULT_CRYPTO_BACKEND,
+                 batch_threads=DEFAULT_CRYPTO_BATCH_THREADS):
         self.__securedrop_root = securedrop_root
         self.__word_list = word_list
 
+        if reply_key_profile not in REPLY_KEY_PROFILES:
+            raise CryptoException(
+                "unknown reply key profile: {}".format(reply_key_profile))
+        self.reply_key_params = dict(REPLY_KEY_PROFILES[reply_key_profile])
+
         if os.environ.get('SECUREDROP_ENV') == 'test':
             # Optimize crypto to speed up tests (at the expense of security
             # DO NOT use these settings in production)
-            self.__gpg_key_length = 1024
+            if self.reply_key_params['key_type'] == 'RSA':
+                self.reply_key_params['key_length'] = 1024
             self.scrypt_params = dict(N=2**1, r=1, p=1)
         else:  # pragma: no cover
-            self.__gpg_key_length = 4096
             self.scrypt_params = scrypt_params
 
         self.scrypt_id_pepper = scrypt_id_pepper
@@ -59,7 +567,23 @@ class CryptoUtil:
 
         self.do_runtime_tests()
 
-        self.gpg = gnupg.GPG(binary='gpg2', homedir=gpg_key_dir)
+        self.gpg_key_dir = gpg_key_dir
+        self.backend = get_crypto_backend(crypto_backend, gpg_key_dir)
+        if not self.backend.supports(self.reply_key_params):
+            raise CryptoException(
+                "the {} crypto backend can't generate {} reply keys".format(
+                    crypto_backend, reply_key_profile))
+
+        # threads running the operations of `encrypt_many` and
+        # `decrypt_many`, started on first use
+        self.batch_threads = batch_threads
+        self.__pool = None
+        self.__pool_pid = None
+        self.__pool_lock = threading.Lock()
+
+        # filesystem id -> reply keypair fingerprint, see `getkey`
+        self.fingerprint_index = FingerprintIndex.for_keyring(
+            gpg_key_dir, scan=lambda: scan_keyring(self.backend))
 
         # map code for a given language to a localized wordlist
         self.__language2words = {}  # type: Dict[Text, List[str]]
@@ -70,16 +594,16 @@ class CryptoUtil:
         with open(adjectives_file) as f:
             self.adjectives = f.read().splitlines()
 
+    @property
+    def gpg(self):
+        """The python-gnupg :class:`GPG` of the gnupg backend."""
+        return self.backend.gpg
+
     # Make sure these pass before the app can run
     # TODO: Add more tests
     def do_runtime_tests(self):
         if self.scrypt_id_pepper == self.scrypt_gpg_pepper:
             raise AssertionError('scrypt_id_pepper == scrypt_gpg_pepper')
-        # crash if we don't have srm:
-        try:
-            subprocess.check_call(['srm'], stdout=subprocess.PIPE)
-        except subprocess.CalledProcessError:
-            pass
 
     def get_wordlist(self, locale):
         # type: (Text) -> List[str]
@@ -131,59 +655,95 @@ class CryptoUtil:
         """
         if salt is None:
             salt = self.scrypt_id_pepper
-        return b32encode(scrypt.hash(clean(codename),
-                         salt,
-                         **self.scrypt_params))
-
-    def genkeypair(self, name, secret):
-        """Generate a GPG key through batch file key generation. A source's
-        codename is salted with SCRYPT_GPG_PEPPER and hashed with scrypt to
-        provide the passphrase used to encrypt their private key. Their name
-        should be their filesystem id.
-
-        >>> if not gpg.list_keys(hash_codename('randomid')):
-        ...     genkeypair(hash_codename('randomid'), 'randomid').type
-        ... else:
-        ...     u'P'
-        u'P'
+        return b32encode(scrypt_pool.hash(clean(codename),
+                                          salt,
+                                          **self.scrypt_params))
+
+    def derive_passphrase(self, codename):
+        """Derive the passphrase protecting a source's reply key from their
+        codename, by salting it with SCRYPT_GPG_PEPPER and hashing it with
+        scrypt. This is as slow as :meth:`hash_codename`, so callers should
+        derive it once and hand it to :meth:`genkeypair`, :meth:`decrypt` and
+        :meth:`decrypt_many` rather than deriving it for each call.
+
+        :param str codename: A source's codename.
+        :returns: A base32 encoded string; the source's key passphrase.
+        """
+        return self.hash_codename(codename, salt=self.scrypt_gpg_pepper)
+
+    def genkeypair(self, name, passphrase):
+        """Generate a GPG key through batch file key generation, of the type
+        given by the reply key profile. Their name should be their filesystem
+        id.
 
         :param str name: The source's filesystem id (their codename, salted
                          with SCRYPT_ID_PEPPER, and hashed with scrypt).
-        :param str secret: The source's codename.
-        :returns: a :class:`GenKey <gnupg._parser.GenKey>` object, on which
-                  the ``__str__()`` method may be called to return the
-                  generated key's fingeprint.
+        :param str passphrase: The passphrase to encrypt their private key
+                               with, from :meth:`derive_passphrase`.
+        :returns: the generated key's fingerprint, or None if generation
+                  failed.
 
         """
-        name = clean(name)
-        secret = self.hash_codename(secret, salt=self.scrypt_gpg_pepper)
-        return self.gpg.gen_key(self.gpg.gen_key_input(
-            key_type=self.GPG_KEY_TYPE,
-            key_length=self.__gpg_key_length,
-            passphrase=secret,
-            name_email=name
-        ))
+        return gen_reply_keypair(
+            self.backend,
+            self.fingerprint_index,
+            name,
+            passphrase,
+            self.reply_key_params)
 
     def delete_reply_keypair(self, source_filesystem_id):
-        key = self.getkey(source_filesystem_id)
-        # If this source was never flagged for review, they won't have a reply
+        self.delete_reply_keypairs([source_filesystem_id])
+
+    def delete_reply_keypairs(self, source_filesystem_ids):
+        """Delete the reply keypairs of the sources whose filesystem ids are
+        `source_filesystem_ids`, in one operation on the keyring and one
+        update of the fingerprint index."""
+        # If a source was never flagged for review, they won't have a reply
         # keypair
-        if not key:
+        keys = [key for key in (self.getkey(filesystem_id)
+                                for filesystem_id in source_filesystem_ids)
+                if key]
+        if not keys:
             return
-        # The private key needs to be deleted before the public key can be
-        # deleted. http://pythonhosted.org/python-gnupg/#deleting-keys
-        self.gpg.delete_keys(key, True)  # private key
-        self.gpg.delete_keys(key)  # public key
+        self.backend.delete_keys(keys)
+        self.fingerprint_index.delete_many(source_filesystem_ids)
         # TODO: srm?
 
     def getkey(self, name):
-        for key in self.gpg.list_keys():
-            for uid in key['uids']:
-                if name in uid:
-                    return key['fingerprint']
-        return None
+        """Return the fingerprint of the reply keypair for the source whose
+        filesystem id is `name`, or None if they don't have one.
+
+        Lookups are served from the fingerprint index. The first lookup on a
+        keyring that predates the index builds it with a full scan.
+        """
+        return self.fingerprint_index.get(name)
+
+    def rebuild_fingerprint_index(self):
+        """Scan the whole keyring and replace the fingerprint index with
+        what it finds. Returns the number of keys indexed.
+        """
+        index = scan_keyring(self.backend)
+        self.fingerprint_index.replace(index)
+        return len(index)
+
+    def encrypt(self, plaintext, fingerprints, output=None, compress=True):
+        fingerprints, output = self.__check_recipients(fingerprints, output)
+        return self.backend.encrypt(plaintext, fingerprints, output,
+                                    compress=compress)
+
+    def encrypt_many(self, messages):
+        """Encrypt `messages`, a list of (plaintext, fingerprints, output)
+        tuples taking the same values as the arguments of :meth:`encrypt`
+        (`output` may be None).
+        Independent messages are encrypted concurrently. Returns the
+        ciphertexts, in order.
+        """
+        messages = [(plaintext,) + self.__check_recipients(fingerprints,
+                                                           output)
+                    for plaintext, fingerprints, output in messages]
+        return self.__map(lambda m: self.backend.encrypt(*m), messages)
 
-    def encrypt(self, plaintext, fingerprints, output=None):
+    def __check_recipients(self, fingerprints, output=None):
         # Verify the output path
         if output:
             current_app.storage.verify(output)
@@ -194,32 +754,79 @@ class CryptoUtil:
         # with spaces for readability, but requires the spaces to be removed
         # when using fingerprints to specify recipients.
         fingerprints = [fpr.replace(' ', '') for fpr in fingerprints]
+        return fingerprints, output
 
-        if not _is_stream(plaintext):
-            plaintext = _make_binary_stream(plaintext, "utf_8")
-
-        out = self.gpg.encrypt(plaintext,
-                               *fingerprints,
-                               output=output,
-                               always_trust=True,
-                               armor=False)
-        if out.ok:
-            return out.data
-        else:
-            raise CryptoException(out.stderr)
-
-    def decrypt(self, secret, ciphertext):
+    def decrypt(self, passphrase, ciphertext):
         """
         >>> crypto = current_app.crypto_util
-        >>> key = crypto.genkeypair('randomid', 'randomid')
+        >>> passphrase = crypto.derive_passphrase('randomid')
+        >>> key = crypto.genkeypair('randomid', passphrase)
         >>> message = u'Buenos días, mundo hermoso!'
         >>> ciphertext = crypto.encrypt(message, str(key))
-        >>> crypto.decrypt('randomid', ciphertext) == message.encode('utf-8')
+        >>> crypto.decrypt(passphrase, ciphertext) == message.encode('utf-8')
         True
         """
-        hashed_codename = self.hash_codename(secret,
-                                             salt=self.scrypt_gpg_pepper)
-        return self.gpg.decrypt(ciphertext, passphrase=hashed_codename).data
+        return self.backend.decrypt(ciphertext, passphrase=passphrase)
+
+    def decrypt_many(self, passphrase, ciphertexts):
+        """Decrypt `ciphertexts` with the key of the source whose key
+        passphrase (see :meth:`derive_passphrase`) is `passphrase`,
+        concurrently. Returns the plaintexts, in order.
+        """
+        return self.__map(
+            lambda ciphertext: self.backend.decrypt(
+                ciphertext, passphrase=passphrase),
+            ciphertexts)
+
+    def __map(self, function, items):
+        items = list(items)
+        if len(items) < 2 or self.batch_threads < 2 or \
+                not self.backend.CONCURRENT:
+            return [function(item) for item in items]
+        return self.__get_pool().map(function, items)
+
+    def __get_pool(self):
+        with self.__pool_lock:
+            # A forked child can't use its parent's threads
+            if self.__pool is None or self.__pool_pid != os.getpid():
+                self.__pool = ThreadPool(self.batch_threads)
+                self.__pool_pid = os.getpid()
+            return self.__pool
+
+    def export_pubkey(self, fingerprint):
+        """Return the armored public key with `fingerprint`."""
+        return self.backend.export_key(fingerprint)
+
+
+def scan_keyring(backend):
+    """Return the mapping of source filesystem ids to the fingerprints of
+    their reply keypairs in the keyring of the crypto `backend`, for
+    :class:`FingerprintIndex`."""
+    index = {}
+    for fingerprint, uids in backend.list_keys():
+        for uid in uids:
+            match = KEY_UID_EMAIL(uid)
+            if match:
+                index[match.group(1)] = fingerprint
+    return index
+
+
+def gen_reply_keypair(backend, fingerprint_index, name, passphrase,
+                      key_params):
+    """Generate a reply keypair for the source whose filesystem id is `name`
+    with the crypto `backend`, protecting its private key with `passphrase`
+    (the source's codename, already hashed with SCRYPT_GPG_PEPPER), and
+    record its fingerprint in `fingerprint_index`. `key_params` are those
+    of one of the `REPLY_KEY_PROFILES`.
+
+    This is :meth:`CryptoUtil.genkeypair` for callers that don't have a
+    :class:`CryptoUtil`, like the key generation job run by the worker.
+    """
+    name = clean(name)
+    fingerprint = backend.gen_key(name, passphrase, key_params)
+    if fingerprint:
+        fingerprint_index.set(name, fingerprint)
+    return fingerprint
 
 
 def clean(s, also=''):
@@ -1,5 +1,90 @@
 # -*- coding: utf-8 -*-
 
+import os
+import threading
+
+from contextlib import contextmanager
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import create_engine
+from sqlalchemy.orm import scoped_session, sessionmaker
+from sqlalchemy.pool import QueuePool
 
 db = SQLAlchemy()
+
+# How long, in seconds, a background task waits for another connection to
+# release its lock on the SQLite database before giving up
+SQLITE_BUSY_TIMEOUT = 30
+
+_session_factories = {}  # type: ignore
+_session_factories_lock = threading.Lock()
+
+
+def get_database_uri(config):
+    """Return the SQLAlchemy URI of the database described by `config`."""
+    if config.DATABASE_ENGINE == "sqlite":
+        return (config.DATABASE_ENGINE + ":///" +
+                config.DATABASE_FILE)
+    else:
+        return (
+            config.DATABASE_ENGINE + '://' +
+            config.DATABASE_USERNAME + ':' +
+            config.DATABASE_PASSWORD + '@' +
+            config.DATABASE_HOST + '/' +
+            config.DATABASE_NAME
+        )
+
+
+def _create_background_engine(db_uri):
+    if db_uri.startswith('sqlite'):
+        # Pooled connections are handed to one thread at a time, so they
+        # don't need to be tied to the thread that opened them
+        return create_engine(db_uri,
+                             connect_args={'timeout': SQLITE_BUSY_TIMEOUT,
+                                           'check_same_thread': False},
+                             poolclass=QueuePool,
+                             pool_size=2,
+                             max_overflow=8)
+    return create_engine(db_uri, pool_size=2, max_overflow=8,
+                         pool_pre_ping=True)
+
+
+def _get_session_factory(db_uri):
+    key = (os.getpid(), db_uri)
+    with _session_factories_lock:
+        factory = _session_factories.get(key)
+        if factory is None:
+            # Connections inherited from the parent of a forked process (e.g.
+            # an rq work horse) can't be used
+            for other in list(_session_factories):
+                if other[0] != key[0]:
+                    del _session_factories[other]
+            engine = _create_background_engine(db_uri)
+            factory = scoped_session(sessionmaker(bind=engine))
+            _session_factories[key] = factory
+        return factory
+
+
+@contextmanager
+def background_session(db_uri):
+    """Provide a session for database work outside of a request, such as in
+    a thread or an rq job. The session is committed if the block succeeds,
+    rolled back if it raises, and closed either way::
+
+        with background_session(db_uri) as session:
+            source = session.query(Source).filter(...).one()
+            source.last_updated = datetime.utcnow()
+
+    Sessions for the same database share a per-process engine and
+    connection pool rather than connecting anew every time. Within a thread,
+    blocks can't be nested.
+    """
+    factory = _get_session_factory(db_uri)
+    session = factory()
+    try:
+        yield session
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        factory.remove()
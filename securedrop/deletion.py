@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+"""Secure deletion of submissions and collections, a batch at a time.
+
+Rather than a worker job for each file or collection a journalist deletes,
+their paths are appended to a list in Redis, and deleted by one job at a
+time on the deletion queue, up to `BATCH_SIZE` of them together. When a
+batch is done, the job schedules the next one if there are paths left.
+
+Batches are run at idle I/O priority, so that overwriting files doesn't
+hold up sources' submissions being written to the same disk, and at no more
+than `SECURE_DELETE_MAX_RATE` bytes per second if that's set. The progress
+of the batch being run is kept in its job's meta, for the admin interface.
+
+While a batch runs, it keeps renewing a short lease on `BATCH_KEY`, so that
+if its worker is killed, the next call to `schedule` takes over within
+`LEASE` seconds. One that rq marks as failed is taken over right away.
+"""
+
+import logging
+import os
+import threading
+import uuid
+
+import psutil
+
+from redis.exceptions import ConnectionError as RedisConnectionError
+from redis.exceptions import WatchError
+from rq import get_current_job
+from rq.exceptions import NoSuchJobError
+from rq.job import Job, JobStatus
+
+import worker
+
+from rm import srm_batch
+
+PENDING_KEY = 'securedrop:deletion:pending'
+# The id of the batch job that's queued or running, if there is one
+BATCH_KEY = 'securedrop:deletion:batch'
+
+BATCH_SIZE = 50
+# Overwriting 50 large collections 38 times at a limited rate takes a while
+BATCH_TIMEOUT = 6 * 60 * 60
+# How long `BATCH_KEY` outlives a running batch that stops renewing it
+LEASE = 5 * 60
+
+
+def _if_batch(redis, batch_id, command, *args):
+    # Run the Redis `command` on `BATCH_KEY` if it's still `batch_id`
+    with redis.pipeline() as pipe:
+        try:
+            pipe.watch(BATCH_KEY)
+            if pipe.get(BATCH_KEY) == batch_id:
+                pipe.multi()
+                getattr(pipe, command)(BATCH_KEY, *args)
+                pipe.execute()
+        except WatchError:
+            # Changed hands in the meantime
+            pass
+
+
+def _schedule_batch(passes, threads, max_rate):
+    redis = worker.get_connection()
+    batch_id = str(uuid.uuid4())
+    for _ in range(2):
+        if redis.set(BATCH_KEY, batch_id, nx=True, ex=BATCH_TIMEOUT):
+            try:
+                return worker.enqueue(worker.DELETION,
+                                      delete_batch,
+                                      passes,
+                                      threads,
+                                      max_rate,
+                                      batch_id,
+                                      job_id=batch_id,
+                                      timeout=BATCH_TIMEOUT)
+            except Exception:
+                _if_batch(redis, batch_id, 'delete')
+                raise
+
+        job_id = redis.get(BATCH_KEY)
+        if job_id is None:
+            # It has just finished, and scheduled the next batch if need be
+            return None
+        try:
+            job = Job.fetch(job_id, connection=redis)
+        except NoSuchJobError:
+            # Run in process, see `worker.enqueue`
+            return None
+        if job.get_status() != JobStatus.FAILED:
+            return job
+        # Killed, or timed out, before it could schedule the next batch
+        logging.getLogger(__name__).warning(
+            "deletion: taking over from failed batch {}".format(job_id))
+        _if_batch(redis, job_id, 'delete')
+    return None
+
+
+def schedule(paths, passes, threads, max_rate=0):
+    """Securely delete `paths` (see :func:`rm.srm_batch`) in the next batch
+    that has room for them. Returns the batch job that's queued or running,
+    which deletes them or schedules the batch that does, or None if there
+    isn't one right now.
+
+    If Redis is unavailable, the paths are deleted by a job of their own,
+    run in process (see `worker.enqueue`) unless Redis is back by then."""
+    try:
+        if paths:
+            worker.get_connection().rpush(PENDING_KEY, *paths)
+        return _schedule_batch(passes, threads, max_rate)
+    except RedisConnectionError:
+        return worker.enqueue(worker.DELETION,
+                              srm_batch,
+                              paths,
+                              passes,
+                              threads,
+                              max_rate,
+                              timeout=BATCH_TIMEOUT)
+
+
+def status():
+    """Return how many files and directories are waiting to be deleted,
+    including the batch being deleted, and the progress of that batch: the
+    `files`, `bytes_total`, `bytes_done` and `bytes_per_sec` of its job's
+    meta, or None if there isn't one running. While Redis is unavailable,
+    it's how many deletion jobs are waiting to be run in process instead."""
+    redis = worker.get_connection()
+    try:
+        pending = redis.llen(PENDING_KEY)
+        job_id = redis.get(BATCH_KEY)
+    except RedisConnectionError:
+        return dict(pending=worker.get_local_worker().pending(worker.DELETION),
+                    batch=None)
+    batch = None
+    if job_id is not None:
+        try:
+            job = Job.fetch(job_id, connection=redis)
+        except NoSuchJobError:
+            pass
+        else:
+            if job.meta.get('files'):
+                batch = job.meta
+    return dict(pending=pending, batch=batch)
+
+
+def set_idle_io_priority():
+    try:
+        psutil.Process().ionice(psutil.IOPRIO_CLASS_IDLE)
+    except (AttributeError, psutil.Error) as e:
+        # Only Linux has I/O scheduling classes
+        logging.getLogger(__name__).warning(
+            "deletion: couldn't set idle I/O priority: {}".format(e))
+
+
+def _keep_lease(redis, batch_id, done):
+    while not done.wait(LEASE // 3):
+        try:
+            _if_batch(redis, batch_id, 'expire', LEASE)
+        except Exception as e:
+            logging.getLogger(__name__).warning(
+                "deletion: couldn't renew the lease of {}: {}".format(
+                    batch_id, e))
+
+
+def delete_batch(passes, threads, max_rate, batch_id=None):
+    """Worker job deleting the next `BATCH_SIZE` paths waiting to be
+    deleted, as the batch `batch_id`. See :func:`schedule`."""
+    redis = worker.get_connection()
+    job = get_current_job()
+    if batch_id is None and job is not None:
+        batch_id = job.id
+    # Set before `srm_batch` starts its threads, which inherit it
+    set_idle_io_priority()
+
+    # Paths are left on the list until they've been deleted, in case the
+    # worker is killed
+    paths = redis.lrange(PENDING_KEY, 0, BATCH_SIZE - 1)
+    deleted = paths
+    failed = False
+    done = threading.Event()
+    if batch_id is not None:
+        _if_batch(redis, batch_id, 'expire', LEASE)
+        lease = threading.Thread(target=_keep_lease,
+                                 args=(redis, batch_id, done))
+        lease.daemon = True
+        lease.start()
+    try:
+        if job is not None:
+            job.meta['files'] = len(paths)
+            job.save_meta()
+        return srm_batch(paths, passes, threads, max_rate)
+    except Exception as e:
+        logging.getLogger(__name__).error(
+            "delete_batch: failed to delete {}: {}".format(paths, e))
+        failed = True
+        # Those it didn't get to are left for the next batch
+        deleted = [path for path in paths if not os.path.lexists(path)]
+        raise
+    finally:
+        done.set()
+        with redis.pipeline() as pipe:
+            for path in deleted:
+                pipe.lrem(PENDING_KEY, path, 1)
+            pipe.execute()
+        if batch_id is None:
+            redis.delete(BATCH_KEY)
+        else:
+            _if_batch(redis, batch_id, 'delete')
+        # After a failure, what's left is retried by the next batch that
+        # `schedule` is asked for, rather than failing over and over
+        if not failed and redis.llen(PENDING_KEY):
+            _schedule_batch(passes, threads, max_rate)
@@ -1,21 +1,26 @@
 # -*- coding: utf-8 -*-
 
 from datetime import datetime, timedelta
-from flask import Flask, session, redirect, url_for, flash, g, request
+from flask import (Flask, session, redirect, url_for, flash, g, request,
+                   render_template)
 from flask_assets import Environment
 from flask_babel import gettext
 from flask_wtf.csrf import CSRFProtect, CSRFError
 from os import path
 
 import i18n
+import scrypt_pool
 import template_filters
 import version
 
-from crypto_util import CryptoUtil
-from db import db
+from crypto_util import (CryptoUtil, DEFAULT_CRYPTO_BACKEND,
+                         DEFAULT_CRYPTO_BATCH_THREADS,
+                         DEFAULT_REPLY_KEY_PROFILE)
+from db import db, get_database_uri
 from journalist_app import account, admin, main, col
 from journalist_app.utils import get_source, logged_in
 from models import Journalist
+from rm import DEFAULT_PASSES, DEFAULT_THREADS
 from store import Storage
 
 import typing
@@ -42,25 +47,24 @@ def create_app(config):
     CSRFProtect(app)
     Environment(app)
 
-    if config.DATABASE_ENGINE == "sqlite":
-        db_uri = (config.DATABASE_ENGINE + ":///" +
-                  config.DATABASE_FILE)
-    else:
-        db_uri = (
-            config.DATABASE_ENGINE + '://' +
-            config.DATABASE_USERNAME + ':' +
-            config.DATABASE_PASSWORD + '@' +
-            config.DATABASE_HOST + '/' +
-            config.DATABASE_NAME
-        )
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-    app.config['SQLALCHEMY_DATABASE_URI'] = db_uri
+    app.config['SQLALCHEMY_DATABASE_URI'] = get_database_uri(config)
+    app.config['SECURE_DELETE_PASSES'] = getattr(
+        config, 'SECURE_DELETE_PASSES', DEFAULT_PASSES)
+    app.config['SECURE_DELETE_THREADS'] = getattr(
+        config, 'SECURE_DELETE_THREADS', DEFAULT_THREADS)
+    app.config['SECURE_DELETE_MAX_RATE'] = getattr(
+        config, 'SECURE_DELETE_MAX_RATE', 0)
     db.init_app(app)
 
     app.storage = Storage(config.STORE_DIR,
                           config.TEMP_DIR,
                           config.JOURNALIST_KEY)
 
+    scrypt_pool.configure(
+        processes=getattr(config, 'SCRYPT_POOL_PROCESSES', 0),
+        max_queue=getattr(config, 'SCRYPT_POOL_MAX_QUEUE', 0))
+
     app.crypto_util = CryptoUtil(
         scrypt_params=config.SCRYPT_PARAMS,
         scrypt_id_pepper=config.SCRYPT_ID_PEPPER,
@@ -70,6 +74,12 @@ def create_app(config):
         nouns_file=config.NOUNS,
         adjectives_file=config.ADJECTIVES,
         gpg_key_dir=config.GPG_KEY_DIR,
+        reply_key_profile=getattr(config, 'REPLY_KEY_PROFILE',
+                                  DEFAULT_REPLY_KEY_PROFILE),
+        crypto_backend=getattr(config, 'CRYPTO_BACKEND',
+                               DEFAULT_CRYPTO_BACKEND),
+        batch_threads=getattr(config, 'CRYPTO_BATCH_THREADS',
+                              DEFAULT_CRYPTO_BATCH_THREADS),
     )
 
     @app.errorhandler(CSRFError)
@@ -80,6 +90,12 @@ def create_app(config):
         flash(msg, 'error')
         return redirect(url_for('main.login'))
 
+    @app.errorhandler(503)
+    def service_unavailable(error):
+        # Such as when too many logins are being hashed at once, see
+        # `scrypt_pool`
+        return render_template('error.html'), 503
+
     i18n.setup_app(config, app)
 
     app.jinja_env.trim_blocks = True
@@ -8,6 +8,8 @@ from flask_babel import gettext
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm.exc import NoResultFound
 
+import deletion
+
 from db import db
 from models import Journalist, InvalidUsernameException, PasswordError
 from journalist_app.decorators import admin_required
@@ -23,7 +25,8 @@ def make_blueprint(config):
     @admin_required
     def index():
         users = Journalist.query.all()
-        return render_template("admin.html", users=users)
+        return render_template("admin.html", users=users,
+                               deletions=deletion.status())
 
     @view.route('/config', methods=('GET', 'POST'))
     @admin_required
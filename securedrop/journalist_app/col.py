@@ -11,7 +11,7 @@ from journalist_app.forms import ReplyForm
 from journalist_app.utils import (make_star_true, make_star_false, get_source,
                                   delete_collection, col_download_unread,
                                   col_download_all, col_star, col_un_star,
-                                  col_delete)
+                                  col_delete, index_url)
 
 
 def make_blueprint(config):
@@ -21,13 +21,13 @@ def make_blueprint(config):
     def add_star(filesystem_id):
         make_star_true(filesystem_id)
         db.session.commit()
-        return redirect(url_for('main.index'))
+        return redirect(index_url())
 
     @view.route("/remove_star/<filesystem_id>", methods=('POST',))
     def remove_star(filesystem_id):
         make_star_false(filesystem_id)
         db.session.commit()
-        return redirect(url_for('main.index'))
+        return redirect(index_url())
 
     @view.route('/<filesystem_id>')
     def col(filesystem_id):
@@ -54,7 +54,7 @@ def make_blueprint(config):
                    'un-star': col_un_star, 'delete': col_delete}
         if 'cols_selected' not in request.form:
             flash(gettext('No collections selected.'), 'error')
-            return redirect(url_for('main.index'))
+            return redirect(index_url())
 
         # getlist is cgi.FieldStorage.getlist
         cols_selected = request.form.getlist('cols_selected')
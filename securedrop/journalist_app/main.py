@@ -7,10 +7,11 @@ from flask_babel import gettext
 from sqlalchemy.sql.expression import false
 
 from db import db
-from models import Source, SourceStar, Submission, Reply
+from models import Source, Submission, Reply
 from journalist_app.forms import ReplyForm
 from journalist_app.utils import (validate_user, bulk_delete, download,
-                                  confirm_bulk_delete, get_source)
+                                  confirm_bulk_delete, get_source,
+                                  source_index, SOURCE_SORT_KEYS)
 
 
 def make_blueprint(config):
@@ -45,28 +46,30 @@ def make_blueprint(config):
 
     @view.route('/')
     def index():
+        sort = request.args.get('sort')
+        if sort not in SOURCE_SORT_KEYS:
+            sort = 'last_updated'
+        prefix = request.args.get('filter', u'').strip().lower()
+
+        page = source_index(sort, prefix).paginate(
+            request.args.get('page', 1, type=int),
+            getattr(config, 'SOURCES_PER_PAGE', 100),
+            error_out=False)
+
         unstarred = []
         starred = []
-
-        # Long SQLAlchemy statements look best when formatted according to
-        # the Pocoo style guide, IMHO:
-        # http://www.pocoo.org/internal/styleguide/
-        sources = Source.query.filter_by(pending=False) \
-                              .order_by(Source.last_updated.desc()) \
-                              .all()
-        for source in sources:
-            star = SourceStar.query.filter_by(source_id=source.id).first()
-            if star and star.starred:
+        for source in page.items:
+            if source.star and source.star.starred:
                 starred.append(source)
             else:
                 unstarred.append(source)
-            source.num_unread = len(
-                Submission.query.filter_by(source_id=source.id,
-                                           downloaded=False).all())
 
         return render_template('index.html',
                                unstarred=unstarred,
-                               starred=starred)
+                               starred=starred,
+                               page=page,
+                               sort=sort,
+                               filter=prefix)
 
     @view.route('/reply', methods=('POST',))
     def reply():
@@ -1,20 +1,22 @@
 # -*- coding: utf-8 -*-
 
 from datetime import datetime
-from flask import (g, flash, current_app, abort, send_file, redirect, url_for,
-                   render_template, Markup)
+from flask import (g, flash, current_app, abort, redirect, url_for,
+                   render_template, Markup, Response, request)
 from flask_babel import gettext, ngettext
+from sqlalchemy import func
+from sqlalchemy.orm import contains_eager
 from sqlalchemy.sql.expression import false
 
+import deletion
 import i18n
-import worker
 
 from db import db
 from models import (get_one_or_else, Source, Journalist,
                     InvalidUsernameException, WrongPasswordException,
                     LoginThrottledException, BadTokenException, SourceStar,
-                    PasswordError, Submission)
-from rm import srm
+                    PasswordError, Submission, Reply)
+from rm import srm_options
 
 import typing
 # https://www.python.org/dev/peps/pep-0484/#runtime-or-type-checking
@@ -64,6 +66,47 @@ def get_source(filesystem_id):
     return source
 
 
+# The orderings the source index can be sorted by, most recent first within
+# equal keys
+SOURCE_SORT_KEYS = ('last_updated', 'unread', 'starred')
+
+
+def source_index(sort='last_updated', prefix=None):
+    """Return a query for the sources listed on the journalist index, with
+    their star already loaded.
+
+    :param str sort: One of :data:`SOURCE_SORT_KEYS`.
+    :param str prefix: If given, only sources whose designation starts with
+                       it are included.
+    """
+    query = Source.query.outerjoin(SourceStar) \
+                        .options(contains_eager(Source.star)) \
+                        .filter(Source.pending == false())
+
+    if prefix:
+        # A range rather than LIKE, so that the designation index is used
+        upper = prefix[:-1] + unichr(ord(prefix[-1]) + 1)
+        query = query.filter(Source.journalist_designation >= prefix,
+                             Source.journalist_designation < upper)
+
+    if sort == 'unread':
+        query = query.order_by(Source.num_unread.desc())
+    elif sort == 'starred':
+        query = query.order_by(
+            func.coalesce(SourceStar.starred, false()).desc())
+    return query.order_by(Source.last_updated.desc(), Source.id.desc())
+
+
+def index_url():
+    """Return the URL of the page of the source index that the current form
+    was submitted from, so that bulk actions return to it."""
+    args = {}
+    for arg in ('sort', 'filter', 'page'):
+        if request.form.get(arg):
+            args[arg] = request.form[arg]
+    return url_for('main.index', **args)
+
+
 def validate_user(username, password, token, error_message=None):
     """
     Validates the user by calling the login and handling exceptions
@@ -146,17 +189,16 @@ def validate_hotp_secret(user, otp_secret):
 
 def download(zip_basename, submissions):
     """Send client contents of ZIP-file *zip_basename*-<timestamp>.zip
-    containing *submissions*. The ZIP-file, being a
-    :class:`tempfile.NamedTemporaryFile`, is stored on disk only
-    temporarily.
+    containing *submissions*. The ZIP-file is streamed to the client as it
+    is generated, and is never stored on disk.
 
     :param str zip_basename: The basename of the ZIP-file download.
 
     :param list submissions: A list of :class:`models.Submission`s to
                              include in the ZIP-file.
     """
-    zf = current_app.storage.get_bulk_archive(submissions,
-                                              zip_directory=zip_basename)
+    archive = current_app.storage.get_bulk_archive(submissions,
+                                                   zip_directory=zip_basename)
     attachment_filename = "{}--{}.zip".format(
         zip_basename, datetime.utcnow().strftime("%Y-%m-%d--%H-%M-%S"))
 
@@ -165,15 +207,16 @@ def download(zip_basename, submissions):
         submission.downloaded = True
     db.session.commit()
 
-    return send_file(zf.name, mimetype="application/zip",
-                     attachment_filename=attachment_filename,
-                     as_attachment=True)
+    return Response(archive, mimetype="application/zip", headers={
+        'Content-Disposition':
+            'attachment; filename="{}"'.format(attachment_filename)})
 
 
 def bulk_delete(filesystem_id, items_selected):
+    deletion.schedule([current_app.storage.path(filesystem_id, item.filename)
+                       for item in items_selected],
+                      **srm_options(current_app.config))
     for item in items_selected:
-        item_path = current_app.storage.path(filesystem_id, item.filename)
-        worker.enqueue(srm, item_path)
         db.session.delete(item)
     db.session.commit()
 
@@ -214,7 +257,7 @@ def col_star(cols_selected):
         make_star_true(filesystem_id)
 
     db.session.commit()
-    return redirect(url_for('main.index'))
+    return redirect(index_url())
 
 
 def col_un_star(cols_selected):
@@ -222,7 +265,7 @@ def col_un_star(cols_selected):
         make_star_false(filesystem_id)
 
     db.session.commit()
-    return redirect(url_for('main.index'))
+    return redirect(index_url())
 
 
 def col_delete(cols_selected):
@@ -230,14 +273,13 @@ def col_delete(cols_selected):
     if len(cols_selected) < 1:
         flash(gettext("No collections selected for deletion."), "error")
     else:
-        for filesystem_id in cols_selected:
-            delete_collection(filesystem_id)
+        delete_collections(cols_selected)
         num = len(cols_selected)
         flash(ngettext('{num} collection deleted', '{num} collections deleted',
                        num).format(num=num),
               "notification")
 
-    return redirect(url_for('main.index'))
+    return redirect(index_url())
 
 
 def make_password(config):
@@ -254,15 +296,38 @@ def make_password(config):
 
 
 def delete_collection(filesystem_id):
-    # Delete the source's collection of submissions
-    job = worker.enqueue(srm, current_app.storage.path(filesystem_id))
+    return delete_collections([filesystem_id])
 
-    # Delete the source's reply keypair
-    current_app.crypto_util.delete_reply_keypair(filesystem_id)
 
-    # Delete their entry in the db
-    source = get_source(filesystem_id)
-    db.session.delete(source)
+def delete_collections(filesystem_ids):
+    """Delete the sources whose filesystem ids are `filesystem_ids`, their
+    collections and their reply keypairs. Returns the deletion job their
+    collections are wiped by (see :func:`deletion.schedule`)."""
+    sources = Source.query.filter(
+        Source.filesystem_id.in_(filesystem_ids)).all()
+    if not sources:
+        return None
+    source_ids = [source.id for source in sources]
+    filesystem_ids = [source.filesystem_id for source in sources]
+
+    # Delete the sources' collections of submissions
+    job = deletion.schedule([current_app.storage.path(filesystem_id)
+                             for filesystem_id in filesystem_ids],
+                            **srm_options(current_app.config))
+
+    # Delete the sources' reply keypairs
+    current_app.crypto_util.delete_reply_keypairs(filesystem_ids)
+
+    # Delete their entries in the db, and everything of theirs, at once
+    for model in (Submission, Reply, SourceStar):
+        model.query.filter(model.source_id.in_(source_ids)).delete(
+            synchronize_session=False)
+    Source.query.filter(Source.id.in_(source_ids)).delete(
+        synchronize_session=False)
+    # Like sources deleted one at a time, what's been loaded of them can
+    # still be read once they're gone
+    for source in sources:
+        db.session.expunge(source)
     db.session.commit()
     return job
 
@@ -306,7 +371,7 @@ def col_download_unread(cols_selected):
     if submissions == []:
         flash(gettext("No unread submissions in selected collections."),
               "error")
-        return redirect(url_for('main.index'))
+        return redirect(index_url())
     return download("unread", submissions)
 
 
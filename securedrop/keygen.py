@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import os
+import time
+
+from datetime import datetime
+from redis.exceptions import ConnectionError as RedisConnectionError
+
+import worker
+
+from crypto_util import (FingerprintIndex, gen_reply_keypair,
+                         get_crypto_backend, scan_keyring)
+from db import background_session
+from models import Source
+
+# gpg reads 300 bytes from /dev/random to generate an RSA key (issue #303),
+# but only 32 for each of the two keys of a Curve25519 keypair
+ENTROPY_THRESHOLD = 2400
+ECC_ENTROPY_THRESHOLD = 512
+# How many times, and how many seconds apart, a job checks whether there's
+# enough entropy before giving up
+ENTROPY_RETRIES = 12
+ENTROPY_RETRY_DELAY = 10
+
+# The name jobs are run under by the process's local worker
+QUEUE = 'keygen'
+# A job may wait behind other sources' keys being generated before it
+# starts, so remember it's pending for longer than one takes. If its
+# process dies, the key is generated again once this has expired.
+PENDING_TTL = 30 * 60
+
+QUEUED = 'queued'
+STARTED = 'started'
+
+
+class LowEntropyException(Exception):
+    pass
+
+
+def get_entropy_estimate():
+    with open('/proc/sys/kernel/random/entropy_avail') as f:
+        return int(f.read())
+
+
+def _pending_key(filesystem_id):
+    return 'securedrop:keygen:{}'.format(filesystem_id)
+
+
+def _set_status(key, status):
+    # While Redis is unavailable, jobs go without
+    redis = worker.get_connection()
+    try:
+        if status is None:
+            redis.delete(key)
+        else:
+            redis.set(key, status, ex=PENDING_TTL)
+    except RedisConnectionError:
+        pass
+
+
+def status(filesystem_id):
+    """Return whether generation of a reply keypair for the source is
+    `QUEUED` or `STARTED`, or None if it's neither or Redis is
+    unavailable."""
+    try:
+        return worker.get_connection().get(_pending_key(filesystem_id))
+    except RedisConnectionError:
+        return None
+
+
+def enqueue(crypto_util, db_uri, filesystem_id, passphrase):
+    """Queue generation of a reply keypair for the source, unless one is
+    already queued or running. Returns the job, or None if it was a
+    duplicate.
+
+    The job needs the source's key passphrase (see
+    :meth:`CryptoUtil.derive_passphrase`), which mustn't be written
+    anywhere, Redis included, since it saves its data to the disk. So
+    rather than on an rq worker, the job is run by the process's local
+    worker (see `worker.get_local_worker`), on one of its few threads, and
+    only ever kept in memory. Redis only tells the processes which sources
+    have a job pending, when it's available.
+    """
+    key = _pending_key(filesystem_id)
+    try:
+        if not worker.get_connection().set(key, QUEUED, nx=True,
+                                           ex=PENDING_TTL):
+            return None
+    except RedisConnectionError:
+        # Only one job with its id runs in each process at a time
+        pass
+    try:
+        return worker.get_local_worker().enqueue(
+            QUEUE,
+            generate_reply_keypair,
+            (crypto_util.gpg_key_dir,
+             crypto_util.backend.NAME,
+             crypto_util.reply_key_params,
+             db_uri,
+             filesystem_id,
+             passphrase),
+            {},
+            dict(job_id=key),
+            durable=False)
+    except Exception:
+        _set_status(key, None)
+        raise
+
+
+def wait_for_entropy(threshold=ENTROPY_THRESHOLD):
+    for attempt in range(ENTROPY_RETRIES):
+        entropy_avail = get_entropy_estimate()
+        if entropy_avail >= threshold:
+            return entropy_avail
+        logging.getLogger(__name__).warning(
+            "waiting for entropy to generate a key: {}".format(entropy_avail))
+        time.sleep(ENTROPY_RETRY_DELAY)
+    raise LowEntropyException(
+        "not enough entropy to generate a key: {}".format(entropy_avail))
+
+
+def generate_reply_keypair(gpg_key_dir, backend_name, key_params, db_uri,
+                           filesystem_id, passphrase):
+    """Job generating a reply keypair for the source whose filesystem id
+    is `filesystem_id`, protected by `passphrase`. See :func:`enqueue`."""
+    key = _pending_key(filesystem_id)
+    _set_status(key, STARTED)
+    try:
+        backend = get_crypto_backend(backend_name, gpg_key_dir)
+        fingerprint_index = FingerprintIndex.for_keyring(
+            gpg_key_dir, scan=lambda: scan_keyring(backend))
+        if fingerprint_index.get(filesystem_id):
+            return "success"
+
+        if os.environ.get('SECUREDROP_ENV') != 'test':  # pragma: no cover
+            # Test keys are small enough not to need waiting for
+            if key_params['key_type'] == 'RSA':
+                wait_for_entropy()
+            else:
+                wait_for_entropy(ECC_ENTROPY_THRESHOLD)
+        gen_reply_keypair(backend,
+                          fingerprint_index,
+                          filesystem_id,
+                          passphrase,
+                          key_params)
+
+        # Register key generation as update to the source, so sources will
+        # filter to the top of the list in the journalist interface if a
+        # flagged source logs in and has a key generated for them. #789
+        with background_session(db_uri) as session:
+            source = session.query(Source).filter(
+                Source.filesystem_id == filesystem_id).one()
+            source.last_updated = datetime.utcnow()
+        return "success"
+    except Exception as e:
+        logging.getLogger(__name__).error(
+                "generate_reply_keypair for source (filesystem_id={}): {}"
+                .format(filesystem_id, e))
+        return "failure"
+    finally:
+        _set_status(key, None)
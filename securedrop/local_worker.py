@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+"""Running worker jobs in process, for when Redis can't be reached, or when
+they mustn't be written anywhere (see `keygen`).
+
+A job that can't be queued on Redis (see `worker.enqueue`) is written to a
+table in an SQLite database, `LOCAL_JOBS_FILE`, and run by a pool of
+threads in the process that queued it. Every few seconds, jobs left in the
+table are handed back to Redis if it's reachable again, or claimed by a
+process with a free thread to run them.
+
+A job is only deleted from the table once it's done, so a job whose process
+dies is picked up by another. Jobs that mustn't be written to the disk,
+like those handed a source's key passphrase, are only kept in memory.
+Unlike rq, nothing stops a job from running past its timeout.
+"""
+
+import importlib
+import logging
+import os
+import pickle
+import sqlite3
+import threading
+import time
+import uuid
+
+import psutil
+
+from contextlib import contextmanager
+from multiprocessing.pool import ThreadPool
+
+# How often the table is looked at for jobs, besides whenever one is added
+DRAIN_INTERVAL = 5
+
+
+class LocalJob(object):
+    """Stands in for the :class:`rq.job.Job` of a job run in process."""
+
+    def __init__(self, id):
+        self.id = id
+        self.result = None
+        self.meta = {}
+        self.started = False
+
+
+def _import(func):
+    module, name = func.rsplit('.', 1)
+    return getattr(importlib.import_module(module), name)
+
+
+class LocalWorker(object):
+    """Run jobs from `db_file`, `threads` at a time. If given, `hand_back`
+    is called with the queue name, function, args, kwargs and rq options of
+    each job waiting in it. If that doesn't raise, the job is considered
+    queued elsewhere and removed from the table."""
+
+    def __init__(self, db_file, threads=2, hand_back=None):
+        self.db_file = db_file
+        self.threads = threads
+        self.hand_back = hand_back
+        self.__jobs = {}
+        self.__lock = threading.Lock()
+        self.__pool = ThreadPool(threads)
+        self.__wake = threading.Event()
+
+        with self._transaction() as conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS jobs ('
+                         'id TEXT PRIMARY KEY, '
+                         'queue TEXT NOT NULL, '
+                         'func TEXT NOT NULL, '
+                         'args BLOB NOT NULL, '
+                         'kwargs BLOB NOT NULL, '
+                         'options BLOB NOT NULL, '
+                         'enqueued_at REAL NOT NULL, '
+                         'owner INTEGER)')
+
+        drainer = threading.Thread(target=self._drain_forever)
+        drainer.daemon = True
+        drainer.start()
+
+    @contextmanager
+    def _transaction(self):
+        conn = sqlite3.connect(self.db_file, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def pending(self, queue=None):
+        """Return how many jobs, on `queue` or any, are in the table."""
+        with self._transaction() as conn:
+            if queue is None:
+                return conn.execute('SELECT COUNT(*) FROM jobs').fetchone()[0]
+            return conn.execute('SELECT COUNT(*) FROM jobs WHERE queue = ?',
+                                (queue,)).fetchone()[0]
+
+    def enqueue(self, queue, f, args, kwargs, options, durable=True):
+        """Run `f(*args, **kwargs)` as a job of the queue `queue`, with the
+        rq `options` (such as `job_id`). Returns its :class:`LocalJob`, or
+        None if a job with the same id is already waiting or running. The
+        job is only kept in memory if it isn't `durable`."""
+        job = LocalJob(options.get('job_id') or str(uuid.uuid4()))
+        func = '{}.{}'.format(f.__module__, f.__name__)
+        with self.__lock:
+            if job.id in self.__jobs:
+                return None
+            if not durable:
+                job.started = True
+                self.__jobs[job.id] = job
+                self.__pool.apply_async(self._run,
+                                        (job, func, args, kwargs, False))
+                return job
+
+        try:
+            with self._transaction() as conn:
+                conn.execute('INSERT INTO jobs VALUES (?, ?, ?, ?, ?, ?, ?, '
+                             'NULL)',
+                             (job.id, queue, func,
+                              sqlite3.Binary(pickle.dumps(args, 2)),
+                              sqlite3.Binary(pickle.dumps(kwargs, 2)),
+                              sqlite3.Binary(pickle.dumps(options, 2)),
+                              time.time()))
+        except sqlite3.IntegrityError:
+            return None
+        with self.__lock:
+            self.__jobs[job.id] = job
+        self.__wake.set()
+        return job
+
+    def _run(self, job, func, args, kwargs, durable):
+        try:
+            job.result = _import(func)(*args, **kwargs)
+        except Exception:
+            logging.getLogger(__name__).exception(
+                "local job {} ({}) failed".format(job.id, func))
+        finally:
+            if durable:
+                with self._transaction() as conn:
+                    conn.execute('DELETE FROM jobs WHERE id = ?', (job.id,))
+            with self.__lock:
+                self.__jobs.pop(job.id, None)
+            self.__wake.set()
+
+    def _claim(self, conn, job_id):
+        return conn.execute('UPDATE jobs SET owner = ? '
+                            'WHERE id = ? AND owner IS NULL',
+                            (os.getpid(), job_id)).rowcount == 1
+
+    def drain(self):
+        """Hand the jobs waiting in the table back to Redis, or run as many
+        of them as there are free threads for."""
+        with self._transaction() as conn:
+            # Jobs claimed by processes that have died since
+            for job_id, owner in conn.execute(
+                    'SELECT id, owner FROM jobs WHERE owner IS NOT NULL '
+                    'AND owner != ?', (os.getpid(),)).fetchall():
+                if not psutil.pid_exists(owner):
+                    conn.execute('UPDATE jobs SET owner = NULL '
+                                 'WHERE id = ? AND owner = ?',
+                                 (job_id, owner))
+            rows = conn.execute('SELECT id, queue, func, args, kwargs, '
+                                'options FROM jobs WHERE owner IS NULL '
+                                'ORDER BY enqueued_at').fetchall()
+
+        hand_back = self.hand_back
+        for job_id, queue, func, args, kwargs, options in rows:
+            args = pickle.loads(bytes(args))
+            kwargs = pickle.loads(bytes(kwargs))
+            with self._transaction() as conn:
+                if not self._claim(conn, job_id):
+                    continue
+
+            if hand_back is not None:
+                try:
+                    hand_back(queue, func, args, kwargs,
+                              pickle.loads(bytes(options)))
+                except Exception as e:
+                    # Still unreachable, don't try again until next time
+                    logging.getLogger(__name__).info(
+                        "couldn't hand local job {} back: {}".format(job_id,
+                                                                     e))
+                    hand_back = None
+                else:
+                    with self._transaction() as conn:
+                        conn.execute('DELETE FROM jobs WHERE id = ?',
+                                     (job_id,))
+                    with self.__lock:
+                        self.__jobs.pop(job_id, None)
+                    continue
+
+            with self.__lock:
+                running = sum(1 for job in self.__jobs.values()
+                              if job.started)
+                if running >= self.threads:
+                    job = None
+                else:
+                    job = self.__jobs.setdefault(job_id, LocalJob(job_id))
+                    job.started = True
+            if job is None:
+                # Leave it to a process with a free thread, or to next time
+                with self._transaction() as conn:
+                    conn.execute('UPDATE jobs SET owner = NULL WHERE id = ?',
+                                 (job_id,))
+                if hand_back is None:
+                    break
+                continue
+            self.__pool.apply_async(self._run,
+                                    (job, func, args, kwargs, True))
+
+    def _drain_forever(self):
+        while True:
+            self.__wake.wait(DRAIN_INTERVAL)
+            self.__wake.clear()
+            try:
+                self.drain()
+            except Exception:
+                logging.getLogger(__name__).exception(
+                    "failed to look for local jobs")
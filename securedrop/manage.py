@@ -14,6 +14,7 @@ import time
 import traceback
 
 from flask import current_app
+from redis.exceptions import ConnectionError as RedisConnectionError
 from sqlalchemy import text
 from sqlalchemy.orm.exc import NoResultFound
 
@@ -21,9 +22,15 @@ os.environ['SECUREDROP_ENV'] = 'dev'  # noqa
 from sdconfig import config
 import journalist_app
 
+import deletion
+import migrations
+import models
+import worker
 from db import db
 from models import Journalist, PasswordError, InvalidUsernameException
 from management.run import run
+from rm import srm_options
+from source_app import uploads
 
 logging.basicConfig(format='%(asctime)s %(levelname)s %(message)s')
 log = logging.getLogger(__name__)
@@ -48,6 +55,7 @@ def reset(args):
     # Regenerate the database
     with app_context():
         db.create_all()
+        migrations.set_version(db.engine, migrations.latest_version())
 
     # Clear submission/reply storage
     try:
@@ -239,17 +247,95 @@ def clean_tmp(args):  # pragma: no cover
     return 0
 
 
+def clean_uploads(args):
+    """Delete the files sources started uploading in chunks whose sessions
+    have expired since."""
+    for path in uploads.sweep(args.minutes * 60):
+        log.debug('{} removed'.format(path))
+    return 0
+
+
 def init_db(args):
     with journalist_app.create_app(config).app_context():
         db.create_all()
         db.session.execute(text('PRAGMA secure_delete = ON'))
         db.session.execute(text('PRAGMA auto_vacuum = FULL'))
+        migrations.set_version(db.session, migrations.latest_version())
         db.session.commit()
 
     user = pwd.getpwnam(args.user)
     os.chown('/var/lib/securedrop/db.sqlite', user.pw_uid, user.pw_gid)
 
 
+def migrate(args):
+    """Upgrade the database created by `init-db` to the latest schema, or
+    upgrade or downgrade it to the schema version given with --version."""
+    with app_context():
+        with db.engine.connect() as connection:
+            try:
+                applied = migrations.migrate(connection, args.version)
+            except migrations.MigrationError as e:
+                log.error(e)
+                return 1
+            version = migrations.get_version(connection)
+
+    for direction, migration in applied:
+        log.info('{} {}: {}'.format(
+            'Applied' if direction == 'upgrade' else 'Reverted',
+            migration.version, migration.description))
+    log.info('Database schema is at version {}'.format(version))
+    return 0
+
+
+def recompute_source_counters(args):
+    """Recompute the message, document, unread and size counters of every
+    source from their submissions and replies."""
+    with app_context():
+        count = models.recompute_source_counters()
+        db.session.commit()
+    log.info('Recomputed the counters of {} sources'.format(count))
+    return 0
+
+
+def rebuild_fingerprint_index(args):
+    """Rebuild the index of source reply keypair fingerprints from the
+    contents of the GPG keyring."""
+    with app_context():
+        count = current_app.crypto_util.rebuild_fingerprint_index()
+    log.info('Indexed {} keys'.format(count))
+    return 0
+
+
+def migrate_worker_queues(args):
+    """Move the jobs left on the worker queue all of them used to go on
+    (`worker.LEGACY_QUEUE`) to the queues for what they do. The secure
+    deletions that were waiting are scheduled in batches (see `deletion`).
+    """
+    legacy = worker.get_queue(worker.LEGACY_QUEUE)
+    try:
+        jobs = legacy.jobs
+        paths = []
+        for job in jobs:
+            if job.func_name == 'rm.srm':
+                paths.append(job.args[0])
+            else:
+                log.warning('Leaving job {} ({}) on the {} queue'.format(
+                    job.id, job.func_name, legacy.name))
+        if paths:
+            with app_context():
+                deletion.schedule(paths, **srm_options(current_app.config))
+        for job in jobs:
+            if job.func_name == 'rm.srm':
+                job.delete()
+    except RedisConnectionError as e:
+        log.error('Could not reach Redis, jobs were left on the {} queue: '
+                  '{}'.format(legacy.name, e))
+        return 1
+    log.info('Scheduled {} deletions from the {} queue'.format(
+        len(paths), legacy.name))
+    return 0
+
+
 def get_args():
     parser = argparse.ArgumentParser(prog=__file__, description='Management '
                                      'and testing utility for SecureDrop.')
@@ -292,6 +378,46 @@ def get_args():
                               required=True)
     init_db_subp.set_defaults(func=init_db)
 
+    migrate_subp = subps.add_parser(
+        'migrate',
+        help='Upgrade the DB schema, or downgrade it with --version.')
+    migrate_subp.add_argument(
+        '--version',
+        type=int,
+        default=None,
+        help=('the schema version to migrate to (default: the latest, '
+              '{})'.format(migrations.latest_version())))
+    migrate_subp.set_defaults(func=migrate)
+
+    recompute_counters_subp = subps.add_parser(
+        'recompute-source-counters',
+        help="Recompute the sources' submission counters from the DB.")
+    recompute_counters_subp.set_defaults(func=recompute_source_counters)
+
+    rebuild_index_subp = subps.add_parser(
+        'rebuild-fingerprint-index',
+        help='Rebuild the index of source reply keys from the GPG keyring.')
+    rebuild_index_subp.set_defaults(func=rebuild_fingerprint_index)
+
+    migrate_queues_subp = subps.add_parser(
+        'migrate-worker-queues',
+        help='Move the jobs left on the old "default" worker queue to the '
+             'new queues.')
+    migrate_queues_subp.set_defaults(func=migrate_worker_queues)
+
+    default_minutes = getattr(config, 'SESSION_EXPIRATION_MINUTES', 120)
+    clean_uploads_subp = subps.add_parser(
+        'clean-uploads',
+        help='Delete the unfinished uploads of expired sessions.')
+    clean_uploads_subp.add_argument(
+        '--minutes',
+        default=default_minutes,
+        type=int,
+        help=('remove uploads not added to for MINUTES '
+              '(default {}, how long a session lasts)'.format(
+                  default_minutes)))
+    clean_uploads_subp.set_defaults(func=clean_uploads)
+
     return parser
 
 
@@ -0,0 +1,252 @@
+# -*- coding: utf-8 -*-
+
+from sqlalchemy import text
+
+
+class MigrationError(Exception):
+
+    """Raised when a database can't be migrated to the requested schema
+    version"""
+
+
+class Migration(object):
+    """A reversible change to the schema of an existing database.
+
+    The schema version of a database is kept in SQLite's `user_version`
+    header field, which is 0 for databases that have never been migrated.
+    A migration's statements and the change of version are applied in a
+    single transaction.
+    """
+
+    def __init__(self, version, description, upgrade, downgrade):
+        """
+        :param int version: The schema version this migration upgrades to.
+        :param str description: What the migration changes.
+        :param list upgrade: SQL statements upgrading from `version - 1`.
+        :param list downgrade: SQL statements undoing `upgrade`.
+        """
+        self.version = version
+        self.description = description
+        self.upgrade = upgrade
+        self.downgrade = downgrade
+
+    def __repr__(self):
+        return '<Migration {} {!r}>'.format(self.version, self.description)
+
+
+# Every migration ever released, in order. Their statements must never be
+# changed once released: add a new migration instead. `manage.py init-db`
+# creates the database with the latest schema from models.py and sets its
+# version to the latest one here, so the two have to agree.
+MIGRATIONS = [
+    Migration(
+        1, 'Index the columns used to look up sources, submissions, replies '
+           'and login attempts',
+        upgrade=[
+            'CREATE INDEX IF NOT EXISTS ix_sources_journalist_designation '
+            'ON sources (journalist_designation)',
+            'CREATE INDEX IF NOT EXISTS ix_submissions_source_id '
+            'ON submissions (source_id)',
+            'CREATE INDEX IF NOT EXISTS ix_submissions_downloaded '
+            'ON submissions (downloaded)',
+            'CREATE INDEX IF NOT EXISTS ix_submissions_filename '
+            'ON submissions (filename)',
+            'CREATE INDEX IF NOT EXISTS ix_replies_source_id '
+            'ON replies (source_id)',
+            'CREATE INDEX IF NOT EXISTS ix_replies_filename '
+            'ON replies (filename)',
+            'CREATE INDEX IF NOT EXISTS ix_journalist_login_attempt_timestamp '
+            'ON journalist_login_attempt (timestamp)',
+        ],
+        downgrade=[
+            'DROP INDEX IF EXISTS ix_sources_journalist_designation',
+            'DROP INDEX IF EXISTS ix_submissions_source_id',
+            'DROP INDEX IF EXISTS ix_submissions_downloaded',
+            'DROP INDEX IF EXISTS ix_submissions_filename',
+            'DROP INDEX IF EXISTS ix_replies_source_id',
+            'DROP INDEX IF EXISTS ix_replies_filename',
+            'DROP INDEX IF EXISTS ix_journalist_login_attempt_timestamp',
+        ]),
+    Migration(
+        2, 'Count the messages, documents, unread submissions and bytes of '
+           'each source',
+        upgrade=[
+            'ALTER TABLE sources '
+            'ADD COLUMN num_messages INTEGER NOT NULL DEFAULT 0',
+            'ALTER TABLE sources '
+            'ADD COLUMN num_documents INTEGER NOT NULL DEFAULT 0',
+            'ALTER TABLE sources '
+            'ADD COLUMN num_unread INTEGER NOT NULL DEFAULT 0',
+            'ALTER TABLE sources '
+            'ADD COLUMN total_size INTEGER NOT NULL DEFAULT 0',
+            """UPDATE sources SET
+                num_messages = (
+                    SELECT COUNT(*) FROM submissions
+                    WHERE submissions.source_id = sources.id
+                    AND submissions.filename LIKE '%msg.gpg'),
+                num_documents = (
+                    SELECT COUNT(*) FROM submissions
+                    WHERE submissions.source_id = sources.id
+                    AND (submissions.filename LIKE '%doc.gz.gpg' OR
+                         submissions.filename LIKE '%doc.zip.gpg')),
+                num_unread = (
+                    SELECT COUNT(*) FROM submissions
+                    WHERE submissions.source_id = sources.id
+                    AND submissions.downloaded = 0),
+                total_size = (
+                    SELECT COALESCE(SUM(size), 0) FROM submissions
+                    WHERE submissions.source_id = sources.id) + (
+                    SELECT COALESCE(SUM(size), 0) FROM replies
+                    WHERE replies.source_id = sources.id)""",
+        ],
+        # SQLite can't drop columns, so copy the table without them
+        downgrade=[
+            """CREATE TABLE sources_v1 (
+                id INTEGER NOT NULL,
+                filesystem_id VARCHAR(96),
+                journalist_designation VARCHAR(255) NOT NULL,
+                flagged BOOLEAN,
+                last_updated DATETIME,
+                pending BOOLEAN,
+                interaction_count INTEGER NOT NULL,
+                PRIMARY KEY (id),
+                UNIQUE (filesystem_id),
+                CHECK (flagged IN (0, 1)),
+                CHECK (pending IN (0, 1))
+            )""",
+            'INSERT INTO sources_v1 SELECT id, filesystem_id, '
+            'journalist_designation, flagged, last_updated, pending, '
+            'interaction_count FROM sources',
+            'DROP TABLE sources',
+            'ALTER TABLE sources_v1 RENAME TO sources',
+            'CREATE INDEX ix_sources_journalist_designation '
+            'ON sources (journalist_designation)',
+        ]),
+    Migration(
+        3, 'Store the interaction number of submissions and replies',
+        upgrade=[
+            'ALTER TABLE submissions '
+            'ADD COLUMN interaction_index INTEGER NOT NULL DEFAULT 0',
+            "UPDATE submissions SET interaction_index = CAST("
+            "substr(filename, 1, instr(filename, '-') - 1) AS INTEGER)",
+            'CREATE INDEX ix_submissions_source_id_interaction_index '
+            'ON submissions (source_id, interaction_index)',
+            'ALTER TABLE replies '
+            'ADD COLUMN interaction_index INTEGER NOT NULL DEFAULT 0',
+            "UPDATE replies SET interaction_index = CAST("
+            "substr(filename, 1, instr(filename, '-') - 1) AS INTEGER)",
+            'CREATE INDEX ix_replies_source_id_interaction_index '
+            'ON replies (source_id, interaction_index)',
+        ],
+        downgrade=[
+            """CREATE TABLE submissions_v2 (
+                id INTEGER NOT NULL,
+                source_id INTEGER,
+                filename VARCHAR(255) NOT NULL,
+                size INTEGER NOT NULL,
+                downloaded BOOLEAN,
+                PRIMARY KEY (id),
+                FOREIGN KEY(source_id) REFERENCES sources (id),
+                CHECK (downloaded IN (0, 1))
+            )""",
+            'INSERT INTO submissions_v2 SELECT id, source_id, filename, size, '
+            'downloaded FROM submissions',
+            'DROP TABLE submissions',
+            'ALTER TABLE submissions_v2 RENAME TO submissions',
+            'CREATE INDEX ix_submissions_source_id '
+            'ON submissions (source_id)',
+            'CREATE INDEX ix_submissions_downloaded '
+            'ON submissions (downloaded)',
+            'CREATE INDEX ix_submissions_filename '
+            'ON submissions (filename)',
+            """CREATE TABLE replies_v2 (
+                id INTEGER NOT NULL,
+                journalist_id INTEGER,
+                source_id INTEGER,
+                filename VARCHAR(255) NOT NULL,
+                size INTEGER NOT NULL,
+                PRIMARY KEY (id),
+                FOREIGN KEY(journalist_id) REFERENCES journalists (id),
+                FOREIGN KEY(source_id) REFERENCES sources (id)
+            )""",
+            'INSERT INTO replies_v2 SELECT id, journalist_id, source_id, '
+            'filename, size FROM replies',
+            'DROP TABLE replies',
+            'ALTER TABLE replies_v2 RENAME TO replies',
+            'CREATE INDEX ix_replies_source_id ON replies (source_id)',
+            'CREATE INDEX ix_replies_filename ON replies (filename)',
+        ]),
+]
+
+
+def latest_version():
+    return MIGRATIONS[-1].version if MIGRATIONS else 0
+
+
+def get_version(connection):
+    """Return the schema version of the database behind `connection`."""
+    return connection.execute(text('PRAGMA user_version')).scalar()
+
+
+def set_version(connection, version):
+    """Record that the database behind `connection` has the schema
+    `version`, without changing anything else. Used for databases that were
+    just created with the latest schema."""
+    # PRAGMA doesn't take bound parameters
+    connection.execute(text('PRAGMA user_version = {:d}'.format(version)))
+
+
+def migrate(connection, version=None):
+    """Upgrade or downgrade the database behind `connection` to the schema
+    `version`, the latest one by default.
+
+    :returns: The list of (direction, migration) pairs that were applied,
+              where direction is either 'upgrade' or 'downgrade'.
+    """
+    if version is None:
+        version = latest_version()
+    if not 0 <= version <= latest_version():
+        raise MigrationError('Unknown schema version {}'.format(version))
+
+    current = get_version(connection)
+    if current > latest_version():
+        raise MigrationError(
+            'The database has schema version {}, which is newer than this '
+            'version of SecureDrop knows about'.format(current))
+
+    applied = []
+    for migration in MIGRATIONS:
+        if current < migration.version <= version:
+            _apply(connection, migration.upgrade, migration.version)
+            applied.append(('upgrade', migration))
+
+    for migration in reversed(MIGRATIONS):
+        if version < migration.version <= current:
+            _apply(connection, migration.downgrade, migration.version - 1)
+            applied.append(('downgrade', migration))
+
+    return applied
+
+
+def _apply(connection, statements, version):
+    """Run `statements` and set the schema version to `version` in a single
+    transaction."""
+    # The sqlite3 module commits before every schema change, which could
+    # leave a migration half applied, so take over transaction control
+    dbapi_connection = connection.connection.connection
+    isolation_level = dbapi_connection.isolation_level
+    dbapi_connection.isolation_level = None
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute('BEGIN')
+        try:
+            for statement in statements:
+                cursor.execute(statement)
+            cursor.execute('PRAGMA user_version = {:d}'.format(version))
+        except Exception:
+            cursor.execute('ROLLBACK')
+            raise
+        cursor.execute('COMMIT')
+    finally:
+        cursor.close()
+        dbapi_connection.isolation_level = isolation_level
@@ -1,9 +1,9 @@
 # -*- coding: utf-8 -*-
 import binascii
+import collections
 import datetime
 import base64
 import os
-import scrypt
 import pyotp
 import qrcode
 # Using svg because it doesn't require additional dependencies
@@ -17,12 +17,16 @@ except ImportError:
 
 from flask import current_app
 from jinja2 import Markup
-from sqlalchemy import ForeignKey
-from sqlalchemy.orm import relationship, backref
+from sqlalchemy import ForeignKey, Index, event
+from sqlalchemy.orm import (relationship, backref, column_property,
+                            attributes, object_session, Session)
 from sqlalchemy import Column, Integer, String, Boolean, DateTime, Binary
 from sqlalchemy.orm.exc import MultipleResultsFound, NoResultFound
+from sqlalchemy.sql.expression import (and_, false, func, null, or_, select,
+                                       union_all)
 
 from db import db
+import scrypt_pool
 
 
 LOGIN_HARDENING = True
@@ -50,7 +54,7 @@ class Source(db.Model):
     __tablename__ = 'sources'
     id = Column(Integer, primary_key=True)
     filesystem_id = Column(String(96), unique=True)
-    journalist_designation = Column(String(255), nullable=False)
+    journalist_designation = Column(String(255), nullable=False, index=True)
     flagged = Column(Boolean, default=False)
     last_updated = Column(DateTime, default=datetime.datetime.utcnow)
     star = relationship("SourceStar", uselist=False, backref="source")
@@ -62,6 +66,15 @@ class Source(db.Model):
     # keep track of how many interactions have happened, for filenames
     interaction_count = Column(Integer, default=0, nullable=False)
 
+    # Counts of the source's submissions and the bytes taken by their
+    # collection, kept up to date whenever submissions and replies are added,
+    # downloaded or deleted (see update_source_counters) so that listing
+    # sources doesn't have to look at every submission
+    num_messages = Column(Integer, default=0, nullable=False)
+    num_documents = Column(Integer, default=0, nullable=False)
+    num_unread = Column(Integer, default=0, nullable=False)
+    total_size = Column(Integer, default=0, nullable=False)
+
     # Don't create or bother checking excessively long codenames to prevent DoS
     NUM_WORDS = 7
     MAX_CODENAME_LEN = 128
@@ -80,51 +93,89 @@ class Source(db.Model):
             ' ', '_') if c in valid_chars])
 
     def documents_messages_count(self):
-        try:
-            return self.docs_msgs_count
-        except AttributeError:
-            self.docs_msgs_count = {'messages': 0, 'documents': 0}
-            for submission in self.submissions:
-                if submission.filename.endswith('msg.gpg'):
-                    self.docs_msgs_count['messages'] += 1
-                elif (submission.filename.endswith('doc.gz.gpg') or
-                      submission.filename.endswith('doc.zip.gpg')):
-                    self.docs_msgs_count['documents'] += 1
-            return self.docs_msgs_count
+        return {'messages': self.num_messages,
+                'documents': self.num_documents}
 
     @property
     def collection(self):
         """Return the list of submissions and replies for this source, sorted
-        in ascending order by the filename/interaction count."""
-        collection = []
-        collection.extend(self.submissions)
-        collection.extend(self.replies)
-        collection.sort(key=lambda x: int(x.filename.split('-')[0]))
-        return collection
+        in ascending order by the filename/interaction count.
+
+        The list comes from a single query and is kept until the source is
+        expired (e.g. on commit) or its submissions or replies change."""
+        if self._collection is None:
+            items = union_all(
+                select([Submission.interaction_index.label('index'),
+                        Submission.id.label('submission_id'),
+                        null().label('reply_id')])
+                .where(Submission.source_id == self.id),
+                select([Reply.interaction_index, null(), Reply.id])
+                .where(Reply.source_id == self.id)).alias('items')
+            item = items.c
+            rows = object_session(self).query(Submission, Reply) \
+                .select_from(items) \
+                .outerjoin(Submission, item.submission_id == Submission.id) \
+                .outerjoin(Reply, item.reply_id == Reply.id) \
+                .order_by(item.index, item.reply_id) \
+                .all()
+            self._collection = [submission or reply
+                                for submission, reply in rows]
+        return self._collection
+
+    # Memoized by collection
+    _collection = None
+
+
+@event.listens_for(Source, 'expire')
+def _forget_collection(source, attrs):
+    source.__dict__.pop('_collection', None)
+
+
+@event.listens_for(Source, 'refresh')
+def _forget_refreshed_collection(source, context, attrs):
+    source.__dict__.pop('_collection', None)
 
 
 class Submission(db.Model):
     __tablename__ = 'submissions'
     id = Column(Integer, primary_key=True)
-    source_id = Column(Integer, ForeignKey('sources.id'))
+    source_id = Column(Integer, ForeignKey('sources.id'), index=True)
     source = relationship(
         "Source",
         backref=backref("submissions", order_by=id, cascade="delete")
         )
 
-    filename = Column(String(255), nullable=False)
+    filename = Column(String(255), nullable=False, index=True)
     size = Column(Integer, nullable=False)
-    downloaded = Column(Boolean, default=False)
+    # Its previous value is needed to update the source's unread count
+    downloaded = column_property(Column(Boolean, default=False, index=True),
+                                 active_history=True)
+    # The number at the start of the filename, which orders the source's
+    # submissions and replies
+    interaction_index = Column(Integer, nullable=False)
+
+    __table_args__ = (Index('ix_submissions_source_id_interaction_index',
+                            'source_id', 'interaction_index'),)
 
     def __init__(self, source, filename):
         self.source_id = source.id
         self.filename = filename
+        self.interaction_index = int(filename.split('-')[0])
         self.size = os.stat(current_app.storage.path(source.filesystem_id,
                                                      filename)).st_size
 
     def __repr__(self):
         return '<Submission %r>' % (self.filename)
 
+    @property
+    def is_message(self):
+        return self.filename.endswith('msg.gpg')
+
+    @property
+    def is_document(self):
+        return (self.filename.endswith('doc.gz.gpg') or
+                self.filename.endswith('doc.zip.gpg'))
+
 
 class Reply(db.Model):
     __tablename__ = "replies"
@@ -137,19 +188,25 @@ class Reply(db.Model):
             'replies',
             order_by=id))
 
-    source_id = Column(Integer, ForeignKey('sources.id'))
+    source_id = Column(Integer, ForeignKey('sources.id'), index=True)
     source = relationship(
         "Source",
         backref=backref("replies", order_by=id, cascade="delete")
         )
 
-    filename = Column(String(255), nullable=False)
+    filename = Column(String(255), nullable=False, index=True)
     size = Column(Integer, nullable=False)
+    # See Submission.interaction_index
+    interaction_index = Column(Integer, nullable=False)
+
+    __table_args__ = (Index('ix_replies_source_id_interaction_index',
+                            'source_id', 'interaction_index'),)
 
     def __init__(self, journalist, source, filename):
         self.journalist_id = journalist.id
         self.source_id = source.id
         self.filename = filename
+        self.interaction_index = int(filename.split('-')[0])
         self.size = os.stat(current_app.storage.path(source.filesystem_id,
                                                      filename)).st_size
 
@@ -267,7 +324,7 @@ class Journalist(db.Model):
     def _scrypt_hash(self, password, salt, params=None):
         if not params:
             params = self._SCRYPT_PARAMS
-        return scrypt.hash(str(password), salt, **params)
+        return scrypt_pool.hash(str(password), salt, **params)
 
     MAX_PASSWORD_LEN = 128
     MIN_PASSWORD_LEN = 14
@@ -438,8 +495,100 @@ class JournalistLoginAttempt(db.Model):
     passwords or two-factor tokens."""
     __tablename__ = "journalist_login_attempt"
     id = Column(Integer, primary_key=True)
-    timestamp = Column(DateTime, default=datetime.datetime.utcnow)
+    timestamp = Column(DateTime, default=datetime.datetime.utcnow,
+                       index=True)
     journalist_id = Column(Integer, ForeignKey('journalists.id'))
 
     def __init__(self, journalist):
         self.journalist_id = journalist.id
+
+
+def _is_unread(downloaded):
+    # NULL doesn't count as unread, as in `downloaded == false()`
+    return int(downloaded is not None and not downloaded)
+
+
+def _submission_counters(submission, downloaded):
+    return {'num_messages': int(submission.is_message),
+            'num_documents': int(submission.is_document),
+            'num_unread': _is_unread(downloaded),
+            'total_size': submission.size}
+
+
+@event.listens_for(Session, 'before_flush')
+def update_source_counters(session, flush_context, instances):
+    """Apply the changes to the submissions and replies being flushed to
+    their sources' counters, in the same transaction.
+
+    Persistent sources are updated with `counter = counter + n` rather than
+    with values computed here, so that concurrent writers don't overwrite
+    each other's changes.
+    """
+    changes = collections.defaultdict(collections.Counter)
+
+    for obj in session.new:
+        if isinstance(obj, Submission):
+            # The column default hasn't been applied yet
+            downloaded = obj.downloaded if obj.downloaded is not None \
+                else False
+            changes[obj.source_id].update(
+                _submission_counters(obj, downloaded))
+        elif isinstance(obj, Reply):
+            changes[obj.source_id]['total_size'] += obj.size
+
+    for obj in session.deleted:
+        if isinstance(obj, Submission):
+            changes[obj.source_id].subtract(
+                _submission_counters(obj, obj.downloaded))
+        elif isinstance(obj, Reply):
+            changes[obj.source_id]['total_size'] -= obj.size
+
+    for obj in session.dirty:
+        if not isinstance(obj, Submission):
+            continue
+        added, _, deleted = attributes.get_history(obj, 'downloaded')
+        if added and deleted:
+            changes[obj.source_id]['num_unread'] += \
+                _is_unread(added[0]) - _is_unread(deleted[0])
+
+    for source_id, counters in changes.items():
+        if source_id is None:
+            continue
+        source = session.query(Source).get(source_id)
+        # Deleting a source deletes its submissions and replies too
+        if source is None or source in session.deleted:
+            continue
+        source.__dict__.pop('_collection', None)
+        for counter, change in counters.items():
+            if not change:
+                continue
+            if source in session.new:
+                setattr(source, counter, (getattr(source, counter) or 0) +
+                        change)
+            else:
+                setattr(source, counter, getattr(Source, counter) + change)
+
+
+def recompute_source_counters():
+    """Recompute every source's counters from their submissions and
+    replies, e.g. after they were changed outside of the ORM. Returns the
+    number of sources."""
+    submissions = Submission.__table__
+    replies = Reply.__table__
+
+    def count(*criteria):
+        return select([func.count()]).where(
+            and_(submissions.c.source_id == Source.id, *criteria)).as_scalar()
+
+    def size(table):
+        return select([func.coalesce(func.sum(table.c.size), 0)]).where(
+            table.c.source_id == Source.id).as_scalar()
+
+    return Source.query.update({
+        'num_messages': count(submissions.c.filename.like('%msg.gpg')),
+        'num_documents': count(or_(
+            submissions.c.filename.like('%doc.gz.gpg'),
+            submissions.c.filename.like('%doc.zip.gpg'))),
+        'num_unread': count(submissions.c.downloaded == false()),
+        'total_size': size(submissions) + size(replies),
+    }, synchronize_session=False)
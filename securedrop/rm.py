@@ -16,9 +16,258 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
-import subprocess
+"""Secure deletion of submissions, replies and source collections.
 
+Files are deleted the way `srm -r` from the secure-delete package deletes
+them: each file is overwritten in place with a number of passes, each pass
+flushed to the disk before the next, then truncated, renamed to a random
+name and unlinked. Directories are renamed and removed once they're empty.
+Symbolic links are removed, not followed.
+"""
 
-def srm(fn):
-    subprocess.check_call(['srm', '-r', fn])
+import base64
+import errno
+import logging
+import os
+import stat
+import threading
+import time
+
+from collections import OrderedDict
+from Cryptodome.Cipher import AES
+from Cryptodome.Util import Counter
+from multiprocessing.pool import ThreadPool
+from rq import get_current_job
+
+# The patterns of Peter Gutmann's method that aren't random
+GUTMANN_PATTERNS = [
+    b'\x55\x55\x55', b'\xaa\xaa\xaa',
+    b'\x92\x49\x24', b'\x49\x24\x92', b'\x24\x92\x49',
+    b'\x00\x00\x00', b'\x11\x11\x11', b'\x22\x22\x22', b'\x33\x33\x33',
+    b'\x44\x44\x44', b'\x55\x55\x55', b'\x66\x66\x66', b'\x77\x77\x77',
+    b'\x88\x88\x88', b'\x99\x99\x99', b'\xaa\xaa\xaa', b'\xbb\xbb\xbb',
+    b'\xcc\xcc\xcc', b'\xdd\xdd\xdd', b'\xee\xee\xee', b'\xff\xff\xff',
+    b'\x92\x49\x24', b'\x49\x24\x92', b'\x24\x92\x49',
+    b'\x6d\xb6\xdb', b'\xb6\xdb\x6d', b'\xdb\x6d\xb6',
+]
+# The passes srm makes by default: 0xff, 5 random passes, Gutmann's patterns
+# and 5 more random passes. None is a random pass.
+SRM_PASSES = [b'\xff'] + [None] * 5 + GUTMANN_PATTERNS + [None] * 5
+DEFAULT_PASSES = len(SRM_PASSES)
+
+# How many files of a directory tree are overwritten at once
+DEFAULT_THREADS = 4
+
+# Files are overwritten a block at a time. Blocks are a whole number of
+# ext4's 4 KiB blocks, and of the 3 byte patterns.
+BLOCK_SIZE = 3 * 256 * 1024
+
+# How often a worker job's progress is saved, in seconds
+PROGRESS_INTERVAL = 1
+
+
+def overwrite_passes(passes):
+    """Return the patterns to overwrite files with in `passes` passes. Like
+    srm, that's its whole sequence by default, 0xff then a random pass for 2
+    passes (`srm -l`) and a random pass for 1 (`srm -ll`). Other numbers of
+    passes are 0xff followed by random passes, and 0 is none at all."""
+    if passes >= len(SRM_PASSES):
+        return SRM_PASSES
+    if passes < 1:
+        return []
+    if passes == 1:
+        return [None]
+    return [b'\xff'] + [None] * (passes - 1)
+
+
+class Progress(object):
+    """How much overwriting a deletion has done, and how fast. Saved in the
+    meta of the worker job doing it, if there is one. If `max_rate` is set,
+    :meth:`add` holds the deletion back to that many bytes per second."""
+
+    def __init__(self, total_bytes, max_rate=0):
+        self.total_bytes = total_bytes
+        self.done_bytes = 0
+        self.max_rate = max_rate
+        self.started = time.time()
+        self.__lock = threading.Lock()
+        self.__job = get_current_job()
+        self.__saved = 0
+
+    @property
+    def bytes_per_sec(self):
+        return self.done_bytes / max(time.time() - self.started, 1e-6)
+
+    def add(self, nbytes):
+        with self.__lock:
+            self.done_bytes += nbytes
+            if time.time() - self.__saved >= PROGRESS_INTERVAL:
+                self.save()
+            ahead = 0
+            if self.max_rate:
+                ahead = (self.started + self.done_bytes / float(self.max_rate)
+                         - time.time())
+        # Outside the lock, so that the other threads' progress is still
+        # saved while this one waits
+        if ahead > 0:
+            time.sleep(ahead)
+
+    def save(self):
+        self.__saved = time.time()
+        if self.__job is not None:
+            self.__job.meta.update(bytes_total=self.total_bytes,
+                                   bytes_done=self.done_bytes,
+                                   bytes_per_sec=int(self.bytes_per_sec))
+            self.__job.save_meta()
+
+
+def _random_name(path):
+    # The same length as the name it replaces, like srm
+    name = os.path.basename(path)
+    random_name = base64.b32encode(os.urandom(len(name)))[:len(name)]
+    return os.path.join(os.path.dirname(path), random_name)
+
+
+def _overwrite(fd, size, pattern, progress):
+    if pattern is None:
+        # AES-CTR keystream, much faster than reading as much from urandom
+        cipher = AES.new(os.urandom(32), AES.MODE_CTR,
+                         counter=Counter.new(128))
+        zeros = b'\0' * BLOCK_SIZE
+    else:
+        block = pattern * (BLOCK_SIZE // len(pattern))
+    os.lseek(fd, 0, os.SEEK_SET)
+    written = 0
+    while written < size:
+        length = min(BLOCK_SIZE, size - written)
+        if pattern is None:
+            data = cipher.encrypt(zeros[:length])
+        else:
+            data = block[:length]
+        while data:
+            n = os.write(fd, data)
+            data = data[n:]
+        written += length
+        progress.add(length)
+    # Otherwise the pass might only ever reach the page cache, and be
+    # overwritten there by the next one
+    os.fsync(fd)
+
+
+def _overwrite_size(st):
+    # Overwrite the unused end of the file's last block too
+    block = st.st_blksize or 4096
+    return (st.st_size + block - 1) // block * block
+
+
+def _delete_file(path, passes, progress):
+    st = os.lstat(path)
+    if stat.S_ISREG(st.st_mode) and passes:
+        size = _overwrite_size(st)
+        fd = os.open(path, os.O_WRONLY)
+        try:
+            for pattern in passes:
+                _overwrite(fd, size, pattern, progress)
+            os.ftruncate(fd, 0)
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+    random_path = _random_name(path)
+    os.rename(path, random_path)
+    os.unlink(random_path)
+
+
+def srm_options(app_config):
+    """The keyword arguments of :func:`srm` and :func:`srm_batch` set in an
+    application's config."""
+    return dict(passes=app_config['SECURE_DELETE_PASSES'],
+                threads=app_config['SECURE_DELETE_THREADS'],
+                max_rate=app_config['SECURE_DELETE_MAX_RATE'])
+
+
+def _collect(fn, files, dirs):
+    # Add the files and directories of the tree `fn` to `files` and `dirs`,
+    # subdirectories before the directories they're in
+    if stat.S_ISDIR(os.lstat(fn).st_mode):
+        for root, dirnames, filenames in os.walk(fn, topdown=False):
+            files.extend(os.path.join(root, name) for name in filenames)
+            # os.walk lists links to directories as directories
+            for name in dirnames:
+                path = os.path.join(root, name)
+                if os.path.islink(path):
+                    files.append(path)
+                else:
+                    dirs.append(path)
+        dirs.append(fn)
+    else:
+        files.append(fn)
+
+
+def _delete(files, dirs, passes, threads, max_rate):
+    patterns = overwrite_passes(passes)
+    progress = Progress(sum(_overwrite_size(os.lstat(path))
+                            for path in files
+                            if os.path.isfile(path) and
+                            not os.path.islink(path)) * len(patterns),
+                        max_rate)
+
+    def delete_file(path):
+        _delete_file(path, patterns, progress)
+
+    if threads > 1 and len(files) > 1:
+        pool = ThreadPool(min(threads, len(files)))
+        try:
+            pool.map(delete_file, files)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        for path in files:
+            delete_file(path)
+
+    for path in dirs:
+        random_path = _random_name(path)
+        os.rename(path, random_path)
+        os.rmdir(random_path)
+
+    progress.save()
+    logging.getLogger(__name__).info(
+        "srm: deleted {} files in {:.1f}s, {} bytes overwritten at {} "
+        "bytes/s".format(len(files), time.time() - progress.started,
+                         progress.done_bytes, int(progress.bytes_per_sec)))
+
+
+def srm(fn, passes=DEFAULT_PASSES, threads=DEFAULT_THREADS, max_rate=0):
+    """Securely delete the file or directory tree `fn`, like `srm -r`, with
+    `passes` overwrite passes (see :func:`overwrite_passes`). The files of a
+    tree are overwritten `threads` at a time, at no more than `max_rate`
+    bytes per second between them if it's set. Progress is reported in the
+    `bytes_total`, `bytes_done` and `bytes_per_sec` of the worker job's
+    meta."""
+    files = []
+    dirs = []
+    _collect(fn, files, dirs)
+    _delete(files, dirs, passes, threads, max_rate)
+    return "success"
+
+
+def srm_batch(paths, passes=DEFAULT_PASSES, threads=DEFAULT_THREADS,
+              max_rate=0):
+    """Securely delete the files and directory trees `paths`, like
+    :func:`srm`, as one deletion. Paths that have already been deleted are
+    skipped."""
+    files = []
+    dirs = []
+    for path in paths:
+        try:
+            _collect(path, files, dirs)
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                raise
+            logging.getLogger(__name__).warning(
+                "srm: {} has already been deleted".format(path))
+    # A submission may be deleted along with the collection it's in
+    files = list(OrderedDict.fromkeys(files))
+    dirs = list(OrderedDict.fromkeys(dirs))
+    _delete(files, dirs, passes, threads, max_rate)
     return "success"
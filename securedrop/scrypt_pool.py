@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import multiprocessing
+import os
+import scrypt
+import threading
+import time
+
+from werkzeug.exceptions import ServiceUnavailable
+
+# How often, in seconds, each process logs the stats of its pool
+STATS_INTERVAL = 10 * 60
+# How long, in seconds, a hash may take on the pool, waiting included,
+# before it's given up on
+DEFAULT_TIMEOUT = 30
+
+
+class ScryptPoolSaturated(ServiceUnavailable):
+
+    """Raised when a hash is requested while the scrypt pool already has as
+    many hashes running and waiting as it admits, or when one takes longer
+    than its timeout. Flask turns it into a 503 response."""
+
+
+class ScryptPool(object):
+    """Runs scrypt, which is deliberately expensive in both CPU and memory,
+    on a bounded pool of worker processes instead of the request thread.
+
+    At most `processes` hashes run at once and at most `max_queue` more
+    wait for a free process; requests beyond that are refused straight
+    away with :class:`ScryptPoolSaturated`, so that a flood of logins
+    can't starve the rest of the application. A hash that takes longer
+    than `timeout` seconds is given up on with the same exception, and the
+    pool's processes are replaced in case one of them is stuck. With
+    `processes=0` hashes are computed inline and nothing is refused.
+    """
+
+    def __init__(self, processes=0, max_queue=0, timeout=DEFAULT_TIMEOUT):
+        self.processes = processes
+        self.max_queue = max_queue
+        self.timeout = timeout
+        if processes > 0:
+            self.__slots = threading.BoundedSemaphore(processes + max_queue)
+        else:
+            self.__slots = None
+        self.__pool = None
+        self.__pool_pid = None
+        self.__lock = threading.Lock()
+
+        self.__depth = 0
+        self.__calls = 0
+        self.__rejected = 0
+        self.__timed_out = 0
+        self.__total_latency = 0.0
+        self.__max_latency = 0.0
+        self.__stats_logged = time.time()
+
+    def hash(self, password, salt, **params):
+        """Same as `scrypt.hash(password, salt, **params)`."""
+        if self.__slots and not self.__slots.acquire(False):
+            with self.__lock:
+                self.__rejected += 1
+            logging.getLogger(__name__).warning(
+                "scrypt pool saturated ({} hashes in progress)".format(
+                    self.__depth))
+            raise ScryptPoolSaturated()
+
+        with self.__lock:
+            self.__depth += 1
+        start = time.time()
+        try:
+            if self.__slots:
+                pool = self.__get_pool()
+                try:
+                    return pool.apply_async(
+                        scrypt.hash, (password, salt), params).get(
+                            self.timeout)
+                except multiprocessing.TimeoutError:
+                    with self.__lock:
+                        self.__timed_out += 1
+                    logging.getLogger(__name__).warning(
+                        "scrypt hash took longer than {}s, replacing the "
+                        "pool".format(self.timeout))
+                    self.__discard_pool(pool)
+                    raise ScryptPoolSaturated()
+            return scrypt.hash(password, salt, **params)
+        finally:
+            latency = time.time() - start
+            with self.__lock:
+                self.__depth -= 1
+                self.__calls += 1
+                self.__total_latency += latency
+                self.__max_latency = max(self.__max_latency, latency)
+                log_stats = time.time() - self.__stats_logged >= \
+                    STATS_INTERVAL
+                if log_stats:
+                    self.__stats_logged = time.time()
+            if self.__slots:
+                self.__slots.release()
+            if log_stats:
+                self.log_stats()
+
+    def stats(self):
+        """Return the number of hashes in progress (running or waiting),
+        the number completed, refused and timed out, and their latency in
+        seconds."""
+        with self.__lock:
+            return {
+                'queue_depth': self.__depth,
+                'calls': self.__calls,
+                'rejected': self.__rejected,
+                'timed_out': self.__timed_out,
+                'mean_latency': (self.__total_latency / self.__calls
+                                 if self.__calls else 0.0),
+                'max_latency': self.__max_latency,
+            }
+
+    def log_stats(self):
+        """Log :meth:`stats`, which :meth:`hash` does every
+        `STATS_INTERVAL` seconds, so that how close the pool comes to being
+        saturated can be watched for in production."""
+        stats = self.stats()
+        logging.getLogger(__name__).info(
+            "scrypt pool: {calls} hashes, {rejected} refused, {timed_out} "
+            "timed out, {queue_depth} in progress, {mean_latency:.3f}s mean "
+            "and {max_latency:.3f}s max latency".format(**stats))
+
+    def close(self):
+        with self.__lock:
+            pool, self.__pool = self.__pool, None
+        if pool is not None and self.__pool_pid == os.getpid():
+            pool.terminate()
+
+    def __discard_pool(self, pool):
+        # Unless another timed out hash has already replaced it
+        with self.__lock:
+            if self.__pool is not pool:
+                return
+            self.__pool = None
+        pool.terminate()
+
+    def __get_pool(self):
+        with self.__lock:
+            # A forked child can't use its parent's pool
+            if self.__pool is None or self.__pool_pid != os.getpid():
+                self.__pool = multiprocessing.Pool(self.processes)
+                self.__pool_pid = os.getpid()
+            return self.__pool
+
+
+_pool = ScryptPool()
+
+
+def configure(processes, max_queue):
+    """Replace the process-wide scrypt pool."""
+    global _pool
+    if (_pool.processes, _pool.max_queue) == (processes, max_queue):
+        return
+    old_pool, _pool = _pool, ScryptPool(processes, max_queue)
+    old_pool.close()
+
+
+def hash(password, salt, **params):
+    return _pool.hash(password, salt, **params)
+
+
+def stats():
+    return _pool.stats()
@@ -27,6 +27,17 @@ class SDConfig(object):
         except AttributeError:
             pass
 
+        try:
+            self.CRYPTO_BACKEND = _config.CRYPTO_BACKEND  # type: ignore
+        except AttributeError:
+            pass
+
+        try:
+            self.CRYPTO_BATCH_THREADS = \
+                _config.CRYPTO_BATCH_THREADS  # type: ignore
+        except AttributeError:
+            pass
+
         try:
             self.DATABASE_FILE = _config.DATABASE_FILE  # type: ignore
         except AttributeError:
@@ -52,6 +63,26 @@ class SDConfig(object):
         except AttributeError:
             pass
 
+        try:
+            self.REDIS_URL = _config.REDIS_URL  # type: ignore
+        except AttributeError:
+            pass
+
+        try:
+            self.JOB_BACKEND = _config.JOB_BACKEND  # type: ignore
+        except AttributeError:
+            pass
+
+        try:
+            self.LOCAL_JOBS_FILE = _config.LOCAL_JOBS_FILE  # type: ignore
+        except AttributeError:
+            pass
+
+        try:
+            self.LOCAL_JOB_THREADS = _config.LOCAL_JOB_THREADS  # type: ignore
+        except AttributeError:
+            pass
+
         try:
             self.ADJECTIVES = _config.ADJECTIVES  # type: ignore
         except AttributeError:
@@ -102,6 +133,46 @@ class SDConfig(object):
         except AttributeError:
             pass
 
+        try:
+            self.SCRYPT_POOL_PROCESSES = \
+                _config.SCRYPT_POOL_PROCESSES  # type: ignore
+        except AttributeError:
+            pass
+
+        try:
+            self.SCRYPT_POOL_MAX_QUEUE = \
+                _config.SCRYPT_POOL_MAX_QUEUE  # type: ignore
+        except AttributeError:
+            pass
+
+        try:
+            self.REPLIES_PER_PAGE = _config.REPLIES_PER_PAGE  # type: ignore
+        except AttributeError:
+            pass
+
+        try:
+            self.REPLY_KEY_PROFILE = _config.REPLY_KEY_PROFILE  # type: ignore
+        except AttributeError:
+            pass
+
+        try:
+            self.SECURE_DELETE_PASSES = \
+                _config.SECURE_DELETE_PASSES  # type: ignore
+        except AttributeError:
+            pass
+
+        try:
+            self.SECURE_DELETE_THREADS = \
+                _config.SECURE_DELETE_THREADS  # type: ignore
+        except AttributeError:
+            pass
+
+        try:
+            self.SECURE_DELETE_MAX_RATE = \
+                _config.SECURE_DELETE_MAX_RATE  # type: ignore
+        except AttributeError:
+            pass
+
         try:
             self.SECUREDROP_DATA_ROOT = _config.SECUREDROP_DATA_ROOT  # type: ignore # noqa: E501
         except AttributeError:
@@ -118,6 +189,17 @@ class SDConfig(object):
         except AttributeError:
             pass
 
+        try:
+            self.CODENAME_POOL_SIZE = \
+                _config.CODENAME_POOL_SIZE  # type: ignore
+        except AttributeError:
+            pass
+
+        try:
+            self.SOURCES_PER_PAGE = _config.SOURCES_PER_PAGE  # type: ignore
+        except AttributeError:
+            pass
+
         try:
             self.SOURCE_TEMPLATES_DIR = \
                 _config.SOURCE_TEMPLATES_DIR  # type: ignore
@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 import base64
 import os
+import re
 from tempfile import _TemporaryFileWrapper
 
 from gnupg._util import _STREAMLIKE_TYPES
@@ -8,6 +9,8 @@ from Cryptodome.Cipher import AES
 from Cryptodome.Random import random
 from Cryptodome.Util import Counter
 
+VALID_TMP_FILE_ID = re.compile(r'^[A-Za-z0-9_-]{43}$').match
+
 
 class SecureTemporaryFile(_TemporaryFileWrapper, object):
     """Temporary file that provides on-the-fly encryption.
@@ -31,7 +34,7 @@ class SecureTemporaryFile(_TemporaryFileWrapper, object):
     AES_key_size = 256
     AES_block_size = 128
 
-    def __init__(self, store_dir):
+    def __init__(self, store_dir, delete=True, resume=None):
         """Generates an AES key and an initialization vector, and opens
         a file in the `store_dir` directory with a
         pseudorandomly-generated filename.
@@ -39,16 +42,38 @@ class SecureTemporaryFile(_TemporaryFileWrapper, object):
         Args:
             store_dir (str): the directory to create the secure
                 temporary file under.
+            delete (bool): whether to delete the file when it's closed.
+            resume (tuple): the `tmp_file_id`, `key`, `iv` and number of
+                bytes written so far of a file created earlier with
+                `delete=False`, to reopen it and carry on writing to it
+                rather than create a new one. Anything written past that
+                many bytes is discarded.
 
         Returns: self
         """
         self.last_action = 'init'
-        self.create_key()
-        self.tmp_file_id = base64.urlsafe_b64encode(os.urandom(32)).strip('=')
+        if resume is None:
+            self.create_key()
+            self.tmp_file_id = base64.urlsafe_b64encode(
+                os.urandom(32)).strip('=')
+            offset = 0
+        else:
+            self.tmp_file_id, self.key, self.iv, offset = resume
+            if not VALID_TMP_FILE_ID(self.tmp_file_id):
+                raise ValueError('invalid tmp_file_id')
+            self.initialize_cipher(offset)
         self.filepath = os.path.join(store_dir,
                                      '{}.aes'.format(self.tmp_file_id))
-        self.file = open(self.filepath, 'w+b')
-        super(SecureTemporaryFile, self).__init__(self.file, self.filepath)
+        if resume is None:
+            self.file = open(self.filepath, 'w+b')
+        else:
+            self.file = open(self.filepath, 'r+b')
+            self.file.truncate(offset)
+            self.file.seek(offset)
+            if offset:
+                self.last_action = 'write'
+        super(SecureTemporaryFile, self).__init__(self.file, self.filepath,
+                                                  delete=delete)
 
     def create_key(self):
         """Generates a unique, pseudorandom AES key, stored ephemerally in
@@ -62,14 +87,21 @@ class SecureTemporaryFile(_TemporaryFileWrapper, object):
         self.iv = random.getrandbits(self.AES_block_size)
         self.initialize_cipher()
 
-    def initialize_cipher(self):
+    def initialize_cipher(self, offset=0):
         """Creates the cipher-related objects needed for AES-CTR
-        encryption and decryption.
+        encryption and decryption. The encryptor picks up `offset` bytes
+        into the keystream, where writing to a resumed file carries on.
         """
-        self.ctr_e = Counter.new(self.AES_block_size, initial_value=self.iv)
+        block_bytes = self.AES_block_size // 8
+        self.ctr_e = Counter.new(
+            self.AES_block_size,
+            initial_value=((self.iv + offset // block_bytes) %
+                           (1 << self.AES_block_size)))
         self.ctr_d = Counter.new(self.AES_block_size, initial_value=self.iv)
         self.encryptor = AES.new(self.key, AES.MODE_CTR, counter=self.ctr_e)
         self.decryptor = AES.new(self.key, AES.MODE_CTR, counter=self.ctr_d)
+        if offset % block_bytes:
+            self.encryptor.encrypt(b'\0' * (offset % block_bytes))
 
     def write(self, data):
         """Write `data` to the secure temporary file. This method may be
@@ -9,16 +9,21 @@ from os import path
 from sqlalchemy.orm.exc import NoResultFound
 
 import i18n
+import scrypt_pool
 import template_filters
 import version
 
-from crypto_util import CryptoUtil
-from db import db
+from crypto_util import (CryptoUtil, DEFAULT_CRYPTO_BACKEND,
+                         DEFAULT_CRYPTO_BATCH_THREADS,
+                         DEFAULT_REPLY_KEY_PROFILE)
+from db import db, get_database_uri
 from models import Source
 from request_that_secures_file_uploads import RequestThatSecuresFileUploads
-from source_app import main, info, api
+from rm import DEFAULT_PASSES, DEFAULT_THREADS
+from source_app import main, info, api, uploads
+from source_app.codename_pool import CodenamePool
 from source_app.decorators import ignore_static
-from source_app.utils import logged_in
+from source_app.utils import logged_in, make_unique_codename
 from store import Storage
 
 import typing
@@ -45,25 +50,27 @@ def create_app(config):
     app.config['WTF_CSRF_TIME_LIMIT'] = 60 * 60 * 24
     CSRFProtect(app)
 
-    if config.DATABASE_ENGINE == "sqlite":
-        db_uri = (config.DATABASE_ENGINE + ":///" +
-                  config.DATABASE_FILE)
-    else:
-        db_uri = (
-            config.DATABASE_ENGINE + '://' +
-            config.DATABASE_USERNAME + ':' +
-            config.DATABASE_PASSWORD + '@' +
-            config.DATABASE_HOST + '/' +
-            config.DATABASE_NAME
-        )
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-    app.config['SQLALCHEMY_DATABASE_URI'] = db_uri
+    app.config['SQLALCHEMY_DATABASE_URI'] = get_database_uri(config)
+    app.config['SECURE_DELETE_PASSES'] = getattr(
+        config, 'SECURE_DELETE_PASSES', DEFAULT_PASSES)
+    app.config['SECURE_DELETE_THREADS'] = getattr(
+        config, 'SECURE_DELETE_THREADS', DEFAULT_THREADS)
+    app.config['SECURE_DELETE_MAX_RATE'] = getattr(
+        config, 'SECURE_DELETE_MAX_RATE', 0)
+    app.config['MAX_UNFINISHED_UPLOADS'] = getattr(
+        config, 'MAX_UNFINISHED_UPLOADS',
+        uploads.DEFAULT_MAX_UNFINISHED_UPLOADS)
     db.init_app(app)
 
     app.storage = Storage(config.STORE_DIR,
                           config.TEMP_DIR,
                           config.JOURNALIST_KEY)
 
+    scrypt_pool.configure(
+        processes=getattr(config, 'SCRYPT_POOL_PROCESSES', 0),
+        max_queue=getattr(config, 'SCRYPT_POOL_MAX_QUEUE', 0))
+
     app.crypto_util = CryptoUtil(
         scrypt_params=config.SCRYPT_PARAMS,
         scrypt_id_pepper=config.SCRYPT_ID_PEPPER,
@@ -73,11 +80,23 @@ def create_app(config):
         nouns_file=config.NOUNS,
         adjectives_file=config.ADJECTIVES,
         gpg_key_dir=config.GPG_KEY_DIR,
+        reply_key_profile=getattr(config, 'REPLY_KEY_PROFILE',
+                                  DEFAULT_REPLY_KEY_PROFILE),
+        crypto_backend=getattr(config, 'CRYPTO_BACKEND',
+                               DEFAULT_CRYPTO_BACKEND),
+        batch_threads=getattr(config, 'CRYPTO_BATCH_THREADS',
+                              DEFAULT_CRYPTO_BATCH_THREADS),
     )
 
+    app.codename_pool = CodenamePool(
+        app,
+        getattr(config, 'CODENAME_POOL_SIZE', CodenamePool.DEFAULT_SIZE),
+        make_unique_codename)
+
     @app.errorhandler(CSRFError)
     def handle_csrf_error(e):
         msg = render_template('session_timeout.html')
+        uploads.discard()
         session.clear()
         flash(Markup(msg), "important")
         return redirect(url_for('main.index'))
@@ -103,7 +122,7 @@ def create_app(config):
     app.jinja_env.filters['nl2br'] = evalcontextfilter(template_filters.nl2br)
     app.jinja_env.filters['filesizeformat'] = template_filters.filesizeformat
 
-    for module in [main, info, api]:
+    for module in [main, info, api, uploads]:
         app.register_blueprint(module.make_blueprint(config))  # type: ignore
 
     @app.before_request
@@ -134,6 +153,7 @@ def create_app(config):
             msg = render_template('session_timeout.html')
 
             # clear the session after we render the message so it's localized
+            uploads.discard()
             session.clear()
 
             flash(Markup(msg), "important")
@@ -149,7 +169,13 @@ def create_app(config):
         # these common values.
         if logged_in():
             g.codename = session['codename']
-            g.filesystem_id = app.crypto_util.hash_codename(g.codename)
+            # The filesystem id is derived once per session and kept in the
+            # signed session cookie next to the codename it was derived from,
+            # so we don't run scrypt again on every request.
+            if 'filesystem_id' not in session:
+                session['filesystem_id'] = \
+                    app.crypto_util.hash_codename(g.codename)
+            g.filesystem_id = session['filesystem_id']
             try:
                 g.source = Source.query \
                             .filter(Source.filesystem_id == g.filesystem_id) \
@@ -160,6 +186,7 @@ def create_app(config):
                     (e,))
                 del session['logged_in']
                 del session['codename']
+                session.pop('filesystem_id', None)
                 return redirect(url_for('main.index'))
             g.loc = app.storage.path(g.filesystem_id)
 
@@ -171,4 +198,8 @@ def create_app(config):
     def internal_error(error):
         return render_template('error.html'), 500
 
+    @app.errorhandler(503)
+    def service_unavailable(error):
+        return render_template('error.html'), 503
+
     return app
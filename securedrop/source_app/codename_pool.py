@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+
+import atexit
+import collections
+import logging
+import os
+
+from threading import Lock, Thread
+
+from db import db
+
+
+class CodenamePool(object):
+    """A bounded, in-memory pool of fresh (codename, filesystem_id) pairs
+    per locale.
+
+    Generating a codename means running scrypt on it and checking that no
+    source already uses it, which is too slow to do while the source waits
+    for /generate. A background thread keeps up to `size` such pairs ready
+    for every locale that has been asked for, so that the request handler
+    only has to pop one.
+
+    Entries are handed out at most once. They only ever live in the memory
+    of the process that generated them: a process that finds itself forked
+    drops what it inherited, and the pool is emptied when the process exits.
+    """
+
+    DEFAULT_SIZE = 16
+
+    def __init__(self, app, size, make_entry):
+        """
+        :param flask.Flask app: The application whose context the filler
+                                thread runs in, for database access.
+        :param int size: The maximum number of entries kept per locale. A
+                         size of 0 disables the pool.
+        :param make_entry: A function taking a locale and returning a new,
+                           unused (codename, filesystem_id) pair.
+        """
+        self.app = app
+        self.size = size
+        self.make_entry = make_entry
+        self.__lock = Lock()
+        self.__pools = {}  # type: ignore
+        self.__filler = None  # type: ignore
+        self.__pid = os.getpid()
+        atexit.register(self.wipe)
+
+    def pop(self, locale):
+        """Return a pre-hashed (codename, filesystem_id) pair for `locale`,
+        or None if none is ready yet. Either way, the pool for `locale` is
+        topped up in the background.
+        """
+        if self.size <= 0:
+            return None
+
+        with self.__lock:
+            self.__discard_if_forked()
+            pool = self.__pools.setdefault(locale, collections.deque())
+            entry = pool.popleft() if pool else None
+            if self.__filler is None or not self.__filler.is_alive():
+                self.__filler = Thread(target=self.__fill_in_app)
+                self.__filler.daemon = True
+                self.__filler.start()
+        return entry
+
+    def fill(self):
+        """Top up the pool of every locale that has been asked for."""
+        while True:
+            with self.__lock:
+                locale = next((locale
+                               for locale, pool in self.__pools.items()
+                               if len(pool) < self.size),
+                              None)
+            if locale is None:
+                return
+
+            # scrypt (slow), so don't hold the lock
+            entry = self.make_entry(locale)
+
+            with self.__lock:
+                pool = self.__pools.get(locale)
+                if pool is None or len(pool) >= self.size:
+                    return
+                pool.append(entry)
+
+    def wipe(self):
+        """Forget every entry, e.g. on shutdown."""
+        with self.__lock:
+            for pool in self.__pools.values():
+                pool.clear()
+            self.__pools = {}
+
+    def __len__(self):
+        with self.__lock:
+            return sum(len(pool) for pool in self.__pools.values())
+
+    def __discard_if_forked(self):
+        if os.getpid() != self.__pid:
+            self.__pools = {}
+            self.__filler = None
+            self.__pid = os.getpid()
+
+    def __fill_in_app(self):
+        with self.app.app_context():
+            try:
+                self.fill()
+            except Exception as e:
+                logging.getLogger(__name__).error(
+                    "Could not fill the codename pool: {}".format(e))
+            finally:
+                db.session.remove()
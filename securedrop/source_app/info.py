@@ -17,7 +17,7 @@ def make_blueprint(config):
 
     @view.route('/journalist-key')
     def download_journalist_pubkey():
-        journalist_pubkey = current_app.crypto_util.gpg.export_keys(
+        journalist_pubkey = current_app.crypto_util.export_pubkey(
             config.JOURNALIST_KEY)
         return send_file(StringIO(journalist_pubkey),
                          mimetype="application/pgp-keys",
@@ -5,15 +5,19 @@ from datetime import datetime
 from flask import (Blueprint, render_template, flash, redirect, url_for, g,
                    session, current_app, request, Markup, abort)
 from flask_babel import gettext
+from flask_sqlalchemy import Pagination
 from sqlalchemy.exc import IntegrityError
 
+import keygen
+
 from db import db
 from models import Source, Submission, Reply, get_one_or_else
-from rm import srm
+from rm import srm, srm_options
+from source_app import uploads
 from source_app.decorators import login_required
 from source_app.utils import (logged_in, generate_unique_codename,
-                              async_genkey, normalize_timestamps,
-                              valid_codename, get_entropy_estimate)
+                              async_genkey, gpg_passphrase,
+                              normalize_timestamps, valid_codename)
 from source_app.forms import LoginForm
 
 
@@ -34,15 +38,19 @@ def make_blueprint(config):
                   "notification")
             return redirect(url_for('.lookup'))
 
-        codename = generate_unique_codename(config)
+        codename, filesystem_id = generate_unique_codename(config)
         session['codename'] = codename
+        session['filesystem_id'] = filesystem_id
+        uploads.discard()
         session['new_user'] = True
         return render_template('generate.html', codename=codename)
 
     @view.route('/create', methods=['POST'])
     def create():
-        filesystem_id = current_app.crypto_util.hash_codename(
-            session['codename'])
+        filesystem_id = session.get('filesystem_id')
+        if filesystem_id is None:
+            filesystem_id = current_app.crypto_util.hash_codename(
+                session['codename'])
 
         source = Source(filesystem_id, current_app.crypto_util.display_id())
         db.session.add(source)
@@ -56,67 +64,96 @@ def make_blueprint(config):
 
             # Issue 2386: don't log in on duplicates
             del session['codename']
+            session.pop('filesystem_id', None)
             abort(500)
         else:
             os.mkdir(current_app.storage.path(filesystem_id))
 
         session['logged_in'] = True
+        session['filesystem_id'] = filesystem_id
         return redirect(url_for('.lookup'))
 
     @view.route('/lookup', methods=('GET',))
     @login_required
     def lookup():
-        replies = []
         for reply in g.source.replies:
-            reply_path = current_app.storage.path(
-                g.filesystem_id,
-                reply.filename,
-            )
+            reply.date = datetime.utcfromtimestamp(os.stat(
+                current_app.storage.path(g.filesystem_id,
+                                         reply.filename)).st_mtime)
+
+        # Sort the replies by date
+        all_replies = sorted(g.source.replies,
+                             key=operator.attrgetter('date'), reverse=True)
+
+        # Only the replies on the requested page are decrypted, all at once
+        per_page = getattr(config, 'REPLIES_PER_PAGE', 20) or \
+            max(len(all_replies), 1)
+        page_num = max(request.args.get('page', 1, type=int), 1)
+        start = (page_num - 1) * per_page
+        page = Pagination(None, page_num, per_page, len(all_replies),
+                          all_replies[start:start + per_page])
+
+        ciphertexts = []
+        for reply in page.items:
+            with open(current_app.storage.path(g.filesystem_id,
+                                               reply.filename)) as f:
+                ciphertexts.append(f.read())
+        plaintexts = []
+        if ciphertexts:
+            plaintexts = current_app.crypto_util.decrypt_many(
+                gpg_passphrase(), ciphertexts)
+
+        replies = []
+        for reply, plaintext in zip(page.items, plaintexts):
             try:
-                with open(reply_path) as f:
-                    contents = f.read()
-                reply.decrypted = current_app.crypto_util.decrypt(
-                    g.codename,
-                    contents).decode('utf-8')
+                reply.decrypted = plaintext.decode('utf-8')
             except UnicodeDecodeError:
                 current_app.logger.error("Could not decode reply %s" %
                                          reply.filename)
             else:
-                reply.date = datetime.utcfromtimestamp(
-                    os.stat(reply_path).st_mtime)
                 replies.append(reply)
 
-        # Sort the replies by date
-        replies.sort(key=operator.attrgetter('date'), reverse=True)
-
         # Generate a keypair to encrypt replies from the journalist
         # Only do this if the journalist has flagged the source as one
         # that they would like to reply to. (Issue #140.)
-        if not current_app.crypto_util.getkey(g.filesystem_id) and \
-                g.source.flagged:
-            db_uri = current_app.config['SQLALCHEMY_DATABASE_URI']
-            async_genkey(current_app.crypto_util,
-                         db_uri,
-                         g.filesystem_id,
-                         g.codename)
+        haskey = bool(current_app.crypto_util.getkey(g.filesystem_id))
+        keygen_status = None
+        if not haskey and g.source.flagged:
+            keygen_status = keygen.status(g.filesystem_id)
+            if not keygen_status:
+                db_uri = current_app.config['SQLALCHEMY_DATABASE_URI']
+                if async_genkey(current_app.crypto_util,
+                                db_uri,
+                                g.filesystem_id,
+                                gpg_passphrase()):
+                    keygen_status = keygen.QUEUED
 
         return render_template(
             'lookup.html',
             codename=g.codename,
             replies=replies,
+            page=page,
             flagged=g.source.flagged,
             new_user=session.get('new_user', None),
-            haskey=current_app.crypto_util.getkey(
-                g.filesystem_id))
+            haskey=haskey,
+            keygen_status=keygen_status)
 
     @view.route('/submit', methods=('POST',))
     @login_required
     def submit():
         msg = request.form['msg']
-        fh = request.files['fh']
+        documents = []
+        fh = request.files.get('fh')
+        if fh:
+            documents.append((fh.filename, fh.stream))
+        # A file the source's browser uploaded in chunks beforehand
+        upload_filename, upload = uploads.finish(
+            request.form.get('upload_id'))
+        if upload is not None:
+            documents.append((upload_filename, upload))
 
         # Don't submit anything if it was an "empty" submission. #878
-        if not (msg or fh):
+        if not (msg or documents):
             flash(gettext(
                 "You must enter a message or choose a file to submit."),
                   "error")
@@ -134,24 +171,28 @@ def make_blueprint(config):
                     g.source.interaction_count,
                     journalist_filename,
                     msg))
-        if fh:
-            g.source.interaction_count += 1
-            fnames.append(
-                current_app.storage.save_file_submission(
-                    g.filesystem_id,
-                    g.source.interaction_count,
-                    journalist_filename,
-                    fh.filename,
-                    fh.stream))
+        try:
+            for filename, stream in documents:
+                g.source.interaction_count += 1
+                fnames.append(
+                    current_app.storage.save_file_submission(
+                        g.filesystem_id,
+                        g.source.interaction_count,
+                        journalist_filename,
+                        filename,
+                        stream))
+        finally:
+            if upload is not None:
+                upload.close()
 
         if first_submission:
             msg = render_template('first_submission_flashed_message.html')
             flash(Markup(msg), "success")
 
         else:
-            if msg and not fh:
+            if msg and not documents:
                 html_contents = gettext('Thanks! We received your message.')
-            elif not msg and fh:
+            elif not msg and documents:
                 html_contents = gettext('Thanks! We received your document.')
             else:
                 html_contents = gettext('Thanks! We received your message and '
@@ -168,22 +209,13 @@ def make_blueprint(config):
         if g.source.pending:
             g.source.pending = False
 
-            # Generate a keypair now, if there's enough entropy (issue #303)
-            # (gpg reads 300 bytes from /dev/random)
-            entropy_avail = get_entropy_estimate()
-            if entropy_avail >= 2400:
-                db_uri = current_app.config['SQLALCHEMY_DATABASE_URI']
-
-                async_genkey(current_app.crypto_util,
-                             db_uri,
-                             g.filesystem_id,
-                             g.codename)
-                current_app.logger.info("generating key, entropy: {}".format(
-                    entropy_avail))
-            else:
-                current_app.logger.warn(
-                        "skipping key generation. entropy: {}".format(
-                                entropy_avail))
+            # Generate a keypair now. The worker waits for there to be
+            # enough entropy first (issue #303)
+            db_uri = current_app.config['SQLALCHEMY_DATABASE_URI']
+            async_genkey(current_app.crypto_util,
+                         db_uri,
+                         g.filesystem_id,
+                         gpg_passphrase())
 
         g.source.last_updated = datetime.utcnow()
         db.session.commit()
@@ -197,7 +229,8 @@ def make_blueprint(config):
         query = Reply.query.filter(
             Reply.filename == request.form['reply_filename'])
         reply = get_one_or_else(query, current_app.logger, abort)
-        srm(current_app.storage.path(g.filesystem_id, reply.filename))
+        srm(current_app.storage.path(g.filesystem_id, reply.filename),
+            **srm_options(current_app.config))
         db.session.delete(reply)
         db.session.commit()
 
@@ -214,7 +247,8 @@ def make_blueprint(config):
             return redirect(url_for('.lookup'))
 
         for reply in replies:
-            srm(current_app.storage.path(g.filesystem_id, reply.filename))
+            srm(current_app.storage.path(g.filesystem_id, reply.filename),
+                **srm_options(current_app.config))
             db.session.delete(reply)
         db.session.commit()
 
@@ -226,8 +260,13 @@ def make_blueprint(config):
         form = LoginForm()
         if form.validate_on_submit():
             codename = request.form['codename'].strip()
-            if valid_codename(codename):
-                session.update(codename=codename, logged_in=True)
+            filesystem_id = valid_codename(codename)
+            if filesystem_id:
+                uploads.discard()
+                # Derived once here, rather than again by `setup_g`
+                session.update(codename=codename,
+                               filesystem_id=filesystem_id,
+                               logged_in=True)
                 return redirect(url_for('.lookup', from_login='1'))
             else:
                 current_app.logger.info(
@@ -244,6 +283,7 @@ def make_blueprint(config):
             # Clear the session after we render the message so it's localized
             # If a user specified a locale, save it and restore it
             user_locale = g.locale
+            uploads.discard()
             session.clear()
             session['locale'] = user_locale
 
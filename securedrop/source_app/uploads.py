@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+"""Resumable uploads of file submissions, a chunk at a time.
+
+A source's browser starts an upload with the file's name and size, then
+appends it to the upload a chunk at a time. If a chunk is lost because their
+Tor circuit dropped, starting the upload again with the same file picks up
+after the last chunk that arrived. The finished upload is handed to
+`main.submit` in place of a file, by its id.
+
+The chunks are appended to a :class:`SecureTemporaryFile`. Its key is kept
+in the source's session, next to their codename, so that it's never
+written to the server's disk and any of the application's processes can
+carry on the upload.
+
+An upload whose source never comes back is left behind when their session
+expires, until `manage.py clean-uploads` deletes it. So that those can't
+fill the disk in the meantime, no more than `MAX_UNFINISHED_UPLOADS` are
+kept at once.
+"""
+
+import base64
+import glob
+import os
+import time
+
+from flask import Blueprint, abort, current_app, jsonify, request, session
+
+from secure_tempfile import SecureTemporaryFile
+from source_app.decorators import login_required
+
+# See the note in `RequestThatSecuresFileUploads` on why this isn't
+# `config.TEMP_DIR`.
+UPLOAD_DIR = '/tmp'  # nosec
+
+# The size of the chunks the browser sends. Less is lost when a circuit
+# drops in the middle of a smaller chunk, but each chunk takes a round trip.
+CHUNK_SIZE = 1024 * 1024
+
+# How many uploads may be in `UPLOAD_DIR` at once. Beyond that, starting one
+# gets a 503, and the browser tries again later.
+DEFAULT_MAX_UNFINISHED_UPLOADS = 50
+
+
+def _open(upload, delete=False):
+    return SecureTemporaryFile(
+        UPLOAD_DIR,
+        delete=delete,
+        resume=(upload['id'],
+                base64.b64decode(upload['key']),
+                upload['iv'],
+                upload['offset']))
+
+
+def _status(upload):
+    return jsonify(id=upload['id'], offset=upload['offset'],
+                   size=upload['size'], chunk_size=CHUNK_SIZE)
+
+
+def _paths():
+    # Including files being uploaded in one request, see
+    # `RequestThatSecuresFileUploads`
+    return glob.glob(os.path.join(UPLOAD_DIR, '*.aes'))
+
+
+def sweep(max_age):
+    """Delete the uploads that haven't been appended to for `max_age`
+    seconds, which should be at least how long a session lasts. Returns
+    their paths."""
+    removed = []
+    for path in _paths():
+        try:
+            if time.time() - os.stat(path).st_mtime > max_age:
+                os.remove(path)
+                removed.append(path)
+        except OSError:
+            # Finished or discarded in the meantime
+            pass
+    return removed
+
+
+def discard():
+    """Delete the session's unfinished upload, if it has one."""
+    upload = session.pop('upload', None)
+    if upload:
+        try:
+            os.remove(os.path.join(UPLOAD_DIR, '{}.aes'.format(upload['id'])))
+        except OSError:
+            pass
+
+
+def finish(upload_id):
+    """Return the original filename and contents of the session's upload
+    `upload_id`, or (None, None) if there isn't one or it's unfinished. The
+    contents are a :class:`SecureTemporaryFile` that's deleted when it's
+    closed."""
+    upload = session.get('upload')
+    if not upload or upload['id'] != upload_id or \
+            upload['offset'] != upload['size']:
+        return None, None
+    session.pop('upload')
+    return upload['filename'], _open(upload, delete=True)
+
+
+def make_blueprint(config):
+    view = Blueprint('uploads', __name__)
+
+    @view.route('/upload', methods=('POST',))
+    @login_required
+    def start():
+        """Start uploading a file, or pick up uploading it where we left off
+        if it's the same file as the upload in progress."""
+        filename = request.form.get('filename', '')
+        size = request.form.get('size', -1, type=int)
+        max_size = current_app.config.get('MAX_CONTENT_LENGTH')
+        if not filename or size <= 0 or (max_size and size > max_size):
+            abort(400)
+
+        upload = session.get('upload')
+        if upload and upload['filename'] == filename and \
+                upload['size'] == size:
+            return _status(upload)
+
+        discard()
+        if len(_paths()) >= current_app.config['MAX_UNFINISHED_UPLOADS']:
+            current_app.logger.warning(
+                "too many unfinished uploads, refusing another")
+            abort(503)
+        f = SecureTemporaryFile(UPLOAD_DIR, delete=False)
+        f.close()
+        upload = dict(id=f.tmp_file_id,
+                      key=base64.b64encode(f.key),
+                      iv=f.iv,
+                      filename=filename,
+                      size=size,
+                      offset=0)
+        session['upload'] = upload
+        return _status(upload)
+
+    @view.route('/upload/<upload_id>', methods=('POST',))
+    @login_required
+    def append(upload_id):
+        """Append the request body to the upload, if it carries on from
+        the last chunk we got. Otherwise, the response says where to carry
+        on from."""
+        upload = session.get('upload')
+        if not upload or upload['id'] != upload_id:
+            abort(404)
+
+        offset = request.args.get('offset', -1, type=int)
+        if offset != upload['offset']:
+            response = _status(upload)
+            response.status_code = 409
+            return response
+        length = request.content_length
+        if not length or length > CHUNK_SIZE or \
+                offset + length > upload['size']:
+            abort(400)
+
+        f = _open(upload)
+        try:
+            while True:
+                buf = request.stream.read(1024 * 64)
+                if not buf:
+                    break
+                f.write(buf)
+                offset += len(buf)
+                if offset > upload['size']:
+                    abort(400)
+        finally:
+            f.close()
+
+        upload['offset'] = offset
+        session.modified = True
+        return _status(upload)
+
+    return view
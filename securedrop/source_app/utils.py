@@ -1,13 +1,9 @@
-import logging
 import subprocess
 
-from datetime import datetime
 from flask import session, current_app, abort, g
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-from threading import Thread
 
 import i18n
+import keygen
 
 from crypto_util import CryptoException
 from models import Source
@@ -18,6 +14,8 @@ def logged_in():
 
 
 def valid_codename(codename):
+    """Return the filesystem id of the source whose codename is `codename`,
+    or None if there isn't one."""
     try:
         filesystem_id = current_app.crypto_util.hash_codename(codename)
     except CryptoException as e:
@@ -27,15 +25,26 @@ def valid_codename(codename):
         abort(500)
 
     source = Source.query.filter_by(filesystem_id=filesystem_id).first()
-    return source is not None
+    return filesystem_id if source is not None else None
 
 
 def generate_unique_codename(config):
-    """Generate random codenames until we get an unused one"""
+    """Return an unused codename and its filesystem id, taken from the app's
+    pool of pre-hashed codenames if one is ready."""
+    language = i18n.get_language(config)
+    entry = current_app.codename_pool.pop(language)
+    if entry is None:
+        entry = make_unique_codename(language)
+    return entry
+
+
+def make_unique_codename(language):
+    """Generate random codenames until we get an unused one. Returns the
+    codename and its filesystem id."""
     while True:
         codename = current_app.crypto_util.genrandomid(
             Source.NUM_WORDS,
-            i18n.get_language(config))
+            language)
 
         # The maximum length of a word in the wordlist is 9 letters and the
         # codename length is 7 words, so it is currently impossible to
@@ -56,42 +65,27 @@ def generate_unique_codename(config):
         matching_sources = Source.query.filter(
             Source.filesystem_id == filesystem_id).all()
         if len(matching_sources) == 0:
-            return codename
+            return codename, filesystem_id
 
 
-def get_entropy_estimate():
-    with open('/proc/sys/kernel/random/entropy_avail') as f:
-        return int(f.read())
+def gpg_passphrase():
+    """Return the logged in source's reply key passphrase, derived from
+    their codename with scrypt at most once per request. Unlike their
+    filesystem id, it's never kept in the session: that's a cookie, which
+    the server can't take back from a client once it has it."""
+    if getattr(g, 'gpg_passphrase', None) is None:
+        g.gpg_passphrase = \
+            current_app.crypto_util.derive_passphrase(g.codename)
+    return g.gpg_passphrase
 
 
-def async(f):
-    def wrapper(*args, **kwargs):
-        thread = Thread(target=f, args=args, kwargs=kwargs)
-        thread.start()
-    return wrapper
-
-
-@async
-def async_genkey(crypto_util_, db_uri, filesystem_id, codename):
+def async_genkey(crypto_util_, db_uri, filesystem_id, passphrase):
+    """Queue generation of a reply keypair for the source (see `keygen`),
+    unless it's already queued or running. Returns the job, or None."""
     # We pass in the `crypto_util_` so we don't have to reference `current_app`
     # here. The app might not have a pushed context during testing which would
-    # cause this async function to break.
-    crypto_util_.genkeypair(filesystem_id, codename)
-
-    # Register key generation as update to the source, so sources will
-    # filter to the top of the list in the journalist interface if a
-    # flagged source logs in and has a key generated for them. #789
-    session = sessionmaker(bind=create_engine(db_uri))()
-    try:
-        source = session.query(Source).filter(
-            Source.filesystem_id == filesystem_id).one()
-        source.last_updated = datetime.utcnow()
-        session.commit()
-    except Exception as e:
-        logging.getLogger(__name__).error(
-                "async_genkey for source (filesystem_id={}): {}"
-                .format(filesystem_id, e))
-    session.close()
+    # cause this function to break.
+    return keygen.enqueue(crypto_util_, db_uri, filesystem_id, passphrase)
 
 
 def normalize_timestamps(filesystem_id):
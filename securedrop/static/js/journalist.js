@@ -3,9 +3,6 @@
  * confusing users, this function dynamically adds elements that require JS.
  */
 function enhance_ui() {
-  // Add the "quick filter" box for sources
-  $('div#filter-container').html('<input id="filter" type="text" placeholder="' + get_string("filter-by-codename-placeholder-string") + '" autofocus >');
-
   // Add the "select {all,none}" buttons
   $('div#select-container').html('<span id="select_all" class="select"><i class="far fa-check-square"></i> ' + get_string("select-all-string") + '</span> <span id="select_unread" class="select"><i class="far fa-check-square"></i> ' + get_string("select-unread-string") + '</span> <span id="select_none" class="select"><i class="far fa-square"></i> ' + get_string("select-none-string") + '</span>');
 
@@ -65,12 +62,14 @@ $(function () {
     $("#unread").html("unread: 0");
   });
 
+  // Narrow down the sources on the current page while the filter is being
+  // typed; submitting it filters all sources on the server
   var filter_codenames = function(value){
     if(value == ""){
       $('ul#cols li').show()
     } else {
       $('ul#cols li').hide()
-      $('ul#cols li[data-source-designation*="' + value.replace(/"/g, "").toLowerCase() + '"]').show()
+      $('ul#cols li[data-source-designation^="' + value.replace(/"/g, "").toLowerCase() + '"]').show()
     }
   }
 
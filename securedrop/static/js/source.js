@@ -56,3 +56,113 @@ $(function(){
     });
   }
 });
+
+// Upload files in chunks, so that if the source's Tor circuit drops partway
+// through a large upload, only the chunk in flight has to be sent again.
+// Without JavaScript, the form uploads the file in one request as usual.
+var UPLOAD_RETRY_DELAY = 5000; // milliseconds
+var UPLOAD_MAX_RETRIES = 60;
+
+function chunked_upload(form, file, done, fallback) {
+  var csrf_token = form.find('input[name="csrf_token"]').val();
+  var progress = $('#upload-progress');
+  var retries = 0;
+  var upload;
+
+  function retry(start_over) {
+    if (++retries > UPLOAD_MAX_RETRIES) {
+      progress.text(progress.data('failed'));
+      form.find('button[type="submit"]').prop('disabled', false);
+      return;
+    }
+    progress.text(progress.data('retrying'));
+    setTimeout(start_over ? start : send_chunk, UPLOAD_RETRY_DELAY);
+  }
+
+  function show_progress() {
+    progress.text(progress.data('progress').replace(
+      '{percent}', Math.floor(100 * upload.offset / upload.size)));
+  }
+
+  // Asking to upload the same file again gets us the upload in progress,
+  // and how much of it the server has
+  function start() {
+    $.ajax({
+      url: form.data('upload-url'),
+      type: 'POST',
+      headers: {'X-CSRFToken': csrf_token},
+      data: {filename: file.name, size: file.size},
+      dataType: 'json'
+    }).done(function(status) {
+      upload = status;
+      send_chunk();
+    }).fail(function(xhr) {
+      if (xhr.status >= 400 && xhr.status < 500) {
+        // The server won't take this file in chunks
+        fallback();
+      } else {
+        retry(true);
+      }
+    });
+  }
+
+  function send_chunk() {
+    if (upload.offset >= upload.size) {
+      done(upload.id);
+      return;
+    }
+    show_progress();
+    $.ajax({
+      url: form.data('upload-url') + '/' + upload.id +
+           '?offset=' + upload.offset,
+      type: 'POST',
+      headers: {'X-CSRFToken': csrf_token},
+      data: file.slice(upload.offset, upload.offset + upload.chunk_size),
+      processData: false,
+      contentType: 'application/octet-stream',
+      dataType: 'json'
+    }).done(function(status) {
+      retries = 0;
+      upload = status;
+      send_chunk();
+    }).fail(function(xhr) {
+      if (xhr.status === 409 && xhr.responseJSON) {
+        // We're out of step with the server, carry on from where it is
+        upload = xhr.responseJSON;
+        send_chunk();
+      } else {
+        retry(xhr.status !== 0);
+      }
+    });
+  }
+
+  start();
+}
+
+$(function(){
+  var form = $('#upload');
+  if (!form.length || !form.data('upload-url') ||
+      !(window.File && window.Blob && Blob.prototype.slice)) {
+    return;
+  }
+  form.submit(function(e) {
+    var input = form.find('input[name="fh"]')[0];
+    if (!input.files || !input.files.length || !input.files[0].size ||
+        form.data('uploaded')) {
+      return; // nothing to upload in chunks, submit the form as usual
+    }
+    e.preventDefault();
+    form.find('button[type="submit"]').prop('disabled', true);
+    chunked_upload(form, input.files[0], function(upload_id) {
+      $('<input type="hidden" name="upload_id">').val(upload_id)
+        .appendTo(form);
+      // The file has been uploaded, don't send it again with the form
+      $(input).prop('disabled', true);
+      form.data('uploaded', true);
+      form[0].submit();
+    }, function() {
+      form.data('uploaded', true);
+      form[0].submit();
+    });
+  });
+});
@@ -1,14 +1,14 @@
 # -*- coding: utf-8 -*-
 import gzip
+import io
 import os
 import re
-import tempfile
-import zipfile
+import zlib
 
 from flask import current_app
 from werkzeug.utils import secure_filename
 
-from secure_tempfile import SecureTemporaryFile
+from zip_stream import ZipStream
 
 
 VALIDATE_FILENAME = re.compile(
@@ -24,6 +24,114 @@ class PathException(Exception):
     pass
 
 
+# gzip compression levels of file submissions. Uploads that won't get any
+# smaller are stored, still wrapped in gzip for the sake of the original
+# filename in its header.
+COMPRESS_NONE = 0
+COMPRESS_FAST = 1
+COMPRESS_MAX = 9
+
+# Magic numbers of file formats that are compressed already
+COMPRESSED_MAGIC = (
+    b'\x1f\x8b',  # gzip
+    b'PK\x03\x04',  # zip, and so docx, xlsx, odt, epub, jar, apk...
+    b'BZh',  # bzip2
+    b'\xfd7zXZ\x00',  # xz
+    b"7z\xbc\xaf'\x1c",  # 7-Zip
+    b'Rar!\x1a\x07',  # RAR
+    b'\xff\xd8\xff',  # JPEG
+    b'\x89PNG\r\n\x1a\n',  # PNG
+    b'GIF8',  # GIF
+    b'\x1aE\xdf\xa3',  # Matroska, WebM
+    b'OggS',  # Ogg
+    b'fLaC',  # FLAC
+    b'ID3',  # MP3
+)
+
+
+def is_compressed(head):
+    """Whether `head`, the first bytes of a file, is the start of a file
+    format that's compressed already."""
+    if head.startswith(COMPRESSED_MAGIC):
+        return True
+    # MP4, MOV, M4A, HEIC...
+    if head[4:8] == b'ftyp':
+        return True
+    # WebP
+    return head[:4] == b'RIFF' and head[8:12] == b'WEBP'
+
+
+def compression_level(head):
+    """Choose the gzip compression level for a file starting with `head`.
+
+    Known compressed formats and data that doesn't compress (such as
+    encrypted files) are stored, data that compresses well is compressed as
+    much as possible, and anything in between is compressed quickly.
+    """
+    if not head or is_compressed(head):
+        return COMPRESS_NONE
+    ratio = len(zlib.compress(head, COMPRESS_FAST)) / float(len(head))
+    if ratio > 0.9:
+        return COMPRESS_NONE
+    if ratio < 0.5:
+        return COMPRESS_MAX
+    return COMPRESS_FAST
+
+
+class GzipStream(io.RawIOBase):
+    """Read-only stream of the gzip-compressed contents of another stream.
+
+    The input is compressed a chunk at a time as the output is read, so
+    that it can be piped straight into gpg without a full compressed copy
+    ever being buffered in memory or written to disk. `head` is data
+    already read from the start of `stream`.
+    """
+
+    CHUNK_SIZE = 1024 * 64
+
+    def __init__(self, stream, filename, compresslevel=COMPRESS_MAX,
+                 head=b''):
+        super(GzipStream, self).__init__()
+        self.__stream = stream
+        self.__head = head
+        self.__compressed = io.BytesIO()
+        self.__gzf = gzip.GzipFile(filename=filename, mode='wb',
+                                   compresslevel=compresslevel,
+                                   fileobj=self.__compressed)
+        self.__pending = b''
+        self.__offset = 0
+        self.__eof = False
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while (len(self.__pending) - self.__offset < len(b) and
+               not self.__eof):
+            self.__compress_chunk()
+        data = self.__pending[self.__offset:self.__offset + len(b)]
+        self.__offset += len(data)
+        b[:len(data)] = data
+        return len(data)
+
+    def __compress_chunk(self):
+        if self.__head:
+            buf, self.__head = self.__head, b''
+        else:
+            buf = self.__stream.read(self.CHUNK_SIZE)
+        if buf:
+            self.__gzf.write(buf)
+        else:
+            self.__gzf.close()
+            self.__eof = True
+
+        self.__pending = (self.__pending[self.__offset:] +
+                          self.__compressed.getvalue())
+        self.__offset = 0
+        self.__compressed.seek(0)
+        self.__compressed.truncate()
+
+
 class Storage:
 
     def __init__(self, storage_path, temp_dir, gpg_key):
@@ -77,36 +185,35 @@ class Storage:
         return absolute
 
     def get_bulk_archive(self, selected_submissions, zip_directory=''):
-        """Generate a zip file from the selected submissions"""
-        zip_file = tempfile.NamedTemporaryFile(
-            prefix='tmp_securedrop_bulk_dl_',
-            dir=self.__temp_dir,
-            delete=False)
+        """Generate a zip file from the selected submissions. The archive is
+        returned as a :class:`zip_stream.ZipStream`, which produces its
+        bytes as the submissions are read so they can be streamed to the
+        client without an intermediate file."""
+        members = []
         sources = set([i.source.journalist_designation
                        for i in selected_submissions])
         # The below nested for-loops are there to create a more usable
         # folder structure per #383
-        with zipfile.ZipFile(zip_file, 'w') as zip:
-            for source in sources:
-                fname = ""
-                submissions = [s for s in selected_submissions
-                               if s.source.journalist_designation == source]
-                for submission in submissions:
-                    filename = self.path(submission.source.filesystem_id,
-                                         submission.filename)
-                    self.verify(filename)
-                    document_number = submission.filename.split('-')[0]
-                    if zip_directory == submission.source.journalist_filename:
-                        fname = zip_directory
-                    else:
-                        fname = os.path.join(zip_directory, source)
-                    zip.write(filename, arcname=os.path.join(
-                        fname,
-                        "%s_%s" % (document_number,
-                                   submission.source.last_updated.date()),
-                        os.path.basename(filename)
-                    ))
-        return zip_file
+        for source in sources:
+            fname = ""
+            submissions = [s for s in selected_submissions
+                           if s.source.journalist_designation == source]
+            for submission in submissions:
+                filename = self.path(submission.source.filesystem_id,
+                                     submission.filename)
+                self.verify(filename)
+                document_number = submission.filename.split('-')[0]
+                if zip_directory == submission.source.journalist_filename:
+                    fname = zip_directory
+                else:
+                    fname = os.path.join(zip_directory, source)
+                members.append((filename, os.path.join(
+                    fname,
+                    "%s_%s" % (document_number,
+                               submission.source.last_updated.date()),
+                    os.path.basename(filename)
+                )))
+        return ZipStream(members)
 
     def save_file_submission(self, filesystem_id, count, journalist_filename,
                              filename, stream):
@@ -124,24 +231,25 @@ class Storage:
         # decrypted file automatically have the name of the original
         # file. Given various usability constraints in GPG and Tails, this
         # is the most user-friendly way we have found to do this.
+        #
+        # How hard the upload is compressed depends on its first chunk: see
+        # `compression_level`.
 
         encrypted_file_name = "{0}-{1}-doc.gz.gpg".format(
             count,
             journalist_filename)
         encrypted_file_path = self.path(filesystem_id, encrypted_file_name)
-        with SecureTemporaryFile("/tmp") as stf:  # nosec
-            with gzip.GzipFile(filename=sanitized_filename,
-                               mode='wb', fileobj=stf) as gzf:
-                # Buffer the stream into the gzip file to avoid excessive
-                # memory consumption
-                while True:
-                    buf = stream.read(1024 * 8)
-                    if not buf:
-                        break
-                    gzf.write(buf)
-
-            current_app.crypto_util.encrypt(
-                stf, self.__gpg_key, encrypted_file_path)
+
+        # The upload is compressed as gpg reads it, so the plaintext never
+        # touches the disk again and no compressed copy is buffered. gpg
+        # would only be compressing gzip output again, so it doesn't.
+        head = stream.read(GzipStream.CHUNK_SIZE)
+        current_app.crypto_util.encrypt(
+            GzipStream(stream, sanitized_filename,
+                       compresslevel=compression_level(head), head=head),
+            self.__gpg_key,
+            encrypted_file_path,
+            compress=False)
 
         return encrypted_file_name
 
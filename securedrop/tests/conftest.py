@@ -18,6 +18,7 @@ from db import db
 from journalist_app import create_app as create_journalist_app
 from source_app import create_app as create_source_app
 import utils
+import worker
 
 # TODO: the PID file for the redis worker is hard-coded below.
 # Ideally this constant would be provided by a test harness.
@@ -136,8 +137,12 @@ def test_source(journalist_app):
 def _start_test_rqworker(config):
     if not psutil.pid_exists(_get_pid_from_file(TEST_WORKER_PIDFILE)):
         tmp_logfile = open('/tmp/test_rqworker.log', 'w')
-        subprocess.Popen(['rqworker', 'test',
-                          '-P', config.SECUREDROP_ROOT,
+        # One worker for every queue, taking jobs in order of priority
+        subprocess.Popen(['rqworker'] +
+                         [worker.queue_name(name) for name in worker.QUEUES] +
+                         ['-P', config.SECUREDROP_ROOT,
+                          '--url', getattr(config, 'REDIS_URL',
+                                           worker.DEFAULT_REDIS_URL),
                           '--pid', TEST_WORKER_PIDFILE],
                          stdout=tmp_logfile,
                          stderr=subprocess.STDOUT)
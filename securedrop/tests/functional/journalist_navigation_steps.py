@@ -757,9 +757,20 @@ class JournalistNavigationStepsMixin():
         for source in sources:
             assert source.is_displayed() is False
 
+        # Submitting the filter reloads the index, filtered on the server
+        filter_box.send_keys(Keys.RETURN)
+        self.wait_for(lambda: self.driver.find_element_by_css_selector(
+            '#filter[value="thiswordisnotinthewordlist"]'))
+        assert not self.driver.find_elements_by_class_name("code-name")
+
+        filter_box = self.driver.find_element_by_id("filter")
         filter_box.clear()
         filter_box.send_keys(Keys.RETURN)
+        self.wait_for(lambda: self.driver.find_element_by_css_selector(
+            '#filter[value=""]'))
 
+        sources = self.driver.find_elements_by_class_name("code-name")
+        assert len(sources) > 0
         for source in sources:
             assert source.is_displayed() is True
 
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+import os
+import pytest
+
+from mock import patch
+
+os.environ['SECUREDROP_ENV'] = 'test'  # noqa
+from sdconfig import config
+
+import crypto_util
+
+from crypto_util import CryptoException, get_crypto_backend
+
+FILES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'files')
+
+RSA_PARAMS = {'key_type': 'RSA', 'key_length': 1024}
+MESSAGE = u'Buenos días, mundo hermoso!'.encode('utf-8')
+PASSPHRASE = 'correct horse battery staple'
+
+BACKENDS = [
+    'gnupg',
+    pytest.param('pgpy', marks=pytest.mark.skipif(
+        crypto_util.pgpy is None, reason="PGPy is not installed")),
+]
+
+
+def _make_backend(name, tmpdir):
+    keys = tmpdir.mkdir(name)
+    backend = get_crypto_backend(name, str(keys))
+    for keyfile in ('test_journalist_key.pub', 'test_journalist_key.sec'):
+        with open(os.path.join(FILES_DIR, keyfile)) as f:
+            backend.import_keys(f.read())
+    return backend
+
+
+@pytest.fixture(params=BACKENDS)
+def backend(request, tmpdir):
+    return _make_backend(request.param, tmpdir)
+
+
+@pytest.fixture(params=BACKENDS)
+def other_backend(request, tmpdir):
+    return _make_backend(request.param, tmpdir.mkdir('other'))
+
+
+def test_unknown_backend(tmpdir):
+    with pytest.raises(CryptoException):
+        get_crypto_backend('openssl', str(tmpdir))
+
+
+def test_gen_key_round_trip(backend):
+    fingerprint = backend.gen_key('SOURCE', PASSPHRASE, RSA_PARAMS)
+
+    ciphertext = backend.encrypt(MESSAGE, [fingerprint])
+
+    assert ciphertext
+    assert backend.decrypt(ciphertext, PASSPHRASE) == MESSAGE
+    assert backend.decrypt(ciphertext, 'wrong passphrase') == ''
+
+
+def test_list_and_delete_keys(backend):
+    fingerprint = backend.gen_key('SOURCE', PASSPHRASE, RSA_PARAMS)
+
+    keys = dict(backend.list_keys())
+    assert config.JOURNALIST_KEY in keys
+    assert any('<SOURCE>' in uid for uid in keys[fingerprint])
+
+    backend.delete_key(fingerprint)
+    assert fingerprint not in dict(backend.list_keys())
+
+
+def test_export_key(backend):
+    pubkey = backend.export_key(config.JOURNALIST_KEY)
+
+    assert pubkey.startswith('-----BEGIN PGP PUBLIC KEY BLOCK-----')
+
+
+def test_encrypt_to_file(backend, tmpdir):
+    output = str(tmpdir.join('message.gpg'))
+
+    backend.encrypt(MESSAGE, [config.JOURNALIST_KEY], output)
+
+    with open(output, 'rb') as f:
+        assert backend.decrypt(f.read()) == MESSAGE
+
+
+def test_encrypt_stream(backend):
+    with open(os.path.join(FILES_DIR, 'test_journalist_key.pub')) as f:
+        plaintext = f.read()
+        f.seek(0)
+        ciphertext = backend.encrypt(f, [config.JOURNALIST_KEY])
+
+    assert backend.decrypt(ciphertext) == plaintext
+
+
+@pytest.mark.skipif(crypto_util.pgpy is None, reason="PGPy is not installed")
+def test_pgpy_streams_to_gpg_keys(tmpdir):
+    keys = tmpdir.mkdir('keys')
+    with open(os.path.join(FILES_DIR, 'test_journalist_key.pub')) as f:
+        get_crypto_backend('gnupg', str(keys)).import_keys(f.read())
+    backend = get_crypto_backend('pgpy', str(keys))
+
+    with patch.object(crypto_util.GnuPGBackend, 'encrypt') as encrypt, \
+            open(os.path.join(FILES_DIR, 'test_journalist_key.pub')) as f:
+        assert backend.encrypt(f, [config.JOURNALIST_KEY]) == \
+            encrypt.return_value
+        # Left for gpg to read
+        assert f.tell() == 0
+
+    encrypt.assert_called_once_with(f, [config.JOURNALIST_KEY], None,
+                                    compress=True)
+
+
+def test_encrypt_to_unknown_key(backend):
+    with pytest.raises(CryptoException):
+        backend.encrypt(MESSAGE, ['A' * 40])
+
+
+def test_backends_interoperate(backend, other_backend):
+    ciphertext = backend.encrypt(MESSAGE, [config.JOURNALIST_KEY])
+
+    assert other_backend.decrypt(ciphertext) == MESSAGE
+
+
+def test_multiple_recipients_interoperate(backend, other_backend):
+    fingerprint = backend.gen_key('SOURCE', PASSPHRASE, RSA_PARAMS)
+    ciphertext = backend.encrypt(MESSAGE,
+                                 [fingerprint, config.JOURNALIST_KEY])
+
+    assert backend.decrypt(ciphertext, PASSPHRASE) == MESSAGE
+    assert other_backend.decrypt(ciphertext) == MESSAGE
+
+    other_backend.delete_key(config.JOURNALIST_KEY)
+    other_backend.import_keys(backend.export_key(fingerprint, secret=True))
+    assert other_backend.decrypt(ciphertext, PASSPHRASE) == MESSAGE
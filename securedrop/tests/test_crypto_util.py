@@ -1,4 +1,5 @@
 # -*- coding: utf-8 -*-
+import mock
 import os
 import unittest
 
@@ -13,6 +14,7 @@ import utils
 
 from crypto_util import CryptoUtil, CryptoException
 from db import db
+from store import PathException
 
 
 class TestCryptoUtil(unittest.TestCase):
@@ -80,7 +82,8 @@ class TestCryptoUtil(unittest.TestCase):
             message,
             [current_app.crypto_util.getkey(source.filesystem_id),
              config.JOURNALIST_KEY])
-        plaintext = current_app.crypto_util.decrypt(codename, ciphertext)
+        plaintext = current_app.crypto_util.decrypt(
+            current_app.crypto_util.derive_passphrase(codename), ciphertext)
 
         self.assertEqual(message, plaintext)
 
@@ -104,7 +107,8 @@ class TestCryptoUtil(unittest.TestCase):
                 [current_app.crypto_util.getkey(source.filesystem_id),
                  config.JOURNALIST_KEY],
                 current_app.storage.path(source.filesystem_id, 'somefile.gpg'))
-        plaintext = current_app.crypto_util.decrypt(codename, ciphertext)
+        plaintext = current_app.crypto_util.decrypt(
+            current_app.crypto_util.derive_passphrase(codename), ciphertext)
 
         with open(os.path.realpath(__file__)) as fh:
             self.assertEqual(fh.read(), plaintext)
@@ -119,7 +123,8 @@ class TestCryptoUtil(unittest.TestCase):
             message,
             current_app.crypto_util.getkey(source.filesystem_id),
             current_app.storage.path(source.filesystem_id, 'somefile.gpg'))
-        plaintext = current_app.crypto_util.decrypt(codename, ciphertext)
+        plaintext = current_app.crypto_util.decrypt(
+            current_app.crypto_util.derive_passphrase(codename), ciphertext)
 
         self.assertEqual(message, plaintext)
 
@@ -131,7 +136,8 @@ class TestCryptoUtil(unittest.TestCase):
             [current_app.crypto_util.getkey(source.filesystem_id),
              config.JOURNALIST_KEY],
             current_app.storage.path(source.filesystem_id, 'somefile.gpg'))
-        plaintext = current_app.crypto_util.decrypt(codename, ciphertext)
+        plaintext = current_app.crypto_util.decrypt(
+            current_app.crypto_util.derive_passphrase(codename), ciphertext)
 
         self.assertEqual(message, plaintext)
 
@@ -143,6 +149,45 @@ class TestCryptoUtil(unittest.TestCase):
 
         self.assertEqual(message, plaintext_)
 
+    def test_encrypt_many_then_decrypt_many(self):
+        source, codename = utils.db_helper.init_source()
+        crypto = current_app.crypto_util
+        recipients = [crypto.getkey(source.filesystem_id),
+                      config.JOURNALIST_KEY]
+        messages = [str(n) * (n + 1) for n in range(6)]
+
+        ciphertexts = crypto.encrypt_many(
+            [(message, recipients, None) for message in messages])
+        passphrase = crypto.derive_passphrase(codename)
+        with mock.patch.object(crypto, 'hash_codename',
+                               wraps=crypto.hash_codename) as hash_codename:
+            plaintexts = crypto.decrypt_many(passphrase, ciphertexts)
+
+        self.assertEqual(messages, plaintexts)
+        self.assertEqual(hash_codename.call_count, 0)
+
+    def test_encrypt_many_writes_outputs(self):
+        source, codename = utils.db_helper.init_source()
+        crypto = current_app.crypto_util
+        outputs = [current_app.storage.path(source.filesystem_id,
+                                            '{}-reply.gpg'.format(n))
+                   for n in range(3)]
+
+        crypto.encrypt_many([(str(n), crypto.getkey(source.filesystem_id),
+                              output)
+                             for n, output in enumerate(outputs)])
+
+        passphrase = crypto.derive_passphrase(codename)
+        for n, output in enumerate(outputs):
+            with open(output) as f:
+                self.assertEqual(str(n), crypto.decrypt(passphrase, f.read()))
+
+    def test_encrypt_many_verifies_outputs(self):
+        crypto = current_app.crypto_util
+        with self.assertRaises(PathException):
+            crypto.encrypt_many([('test', config.JOURNALIST_KEY,
+                                  '/tmp/not-in-the-store.gpg')])
+
     def verify_genrandomid(self, locale):
         id = current_app.crypto_util.genrandomid(locale=locale)
         id_words = id.split()
@@ -177,6 +222,15 @@ class TestCryptoUtil(unittest.TestCase):
         self.assertIn(id_words[0], current_app.crypto_util.adjectives)
         self.assertIn(id_words[1], current_app.crypto_util.nouns)
 
+    def test_derive_passphrase(self):
+        crypto = current_app.crypto_util
+        codename = crypto.genrandomid()
+        passphrase = crypto.derive_passphrase(codename)
+
+        self.assertRegexpMatches(passphrase, '^[2-7A-Z]{103}=$')
+        self.assertNotEqual(passphrase, crypto.hash_codename(codename))
+        self.assertEqual(passphrase, crypto.derive_passphrase(codename))
+
     def test_hash_codename(self):
         codename = current_app.crypto_util.genrandomid()
         hashed_codename = current_app.crypto_util.hash_codename(codename)
@@ -190,16 +244,86 @@ class TestCryptoUtil(unittest.TestCase):
         source = models.Source(filesystem_id, journalist_filename)
         db.session.add(source)
         db.session.commit()
-        current_app.crypto_util.genkeypair(source.filesystem_id, codename)
+        current_app.crypto_util.genkeypair(
+            source.filesystem_id,
+            current_app.crypto_util.derive_passphrase(codename))
 
         self.assertIsNotNone(current_app.crypto_util.getkey(filesystem_id))
 
+    def test_genkeypair_uses_reply_key_profile(self):
+        crypto = current_app.crypto_util
+        crypto.reply_key_params = dict(
+            crypto_util.REPLY_KEY_PROFILES['curve25519'])
+        with mock.patch.object(crypto.gpg, 'gen_key') as gen_key, \
+                mock.patch.object(crypto.gpg, 'gen_key_input') \
+                as gen_key_input:
+            gen_key.return_value.fingerprint = None
+            crypto.genkeypair('randomid', 'randomid')
+
+        kwargs = gen_key_input.call_args[1]
+        self.assertEqual(kwargs['key_type'], 'EDDSA')
+        self.assertEqual(kwargs['key_curve'], 'ed25519')
+        self.assertEqual(kwargs['subkey_type'], 'ECDH')
+        self.assertEqual(kwargs['subkey_curve'], 'cv25519')
+        self.assertEqual(kwargs['name_email'], 'randomid')
+
+    def test_unknown_reply_key_profile(self):
+        with self.assertRaisesRegexp(CryptoException,
+                                     'unknown reply key profile: dsa'):
+            CryptoUtil(scrypt_params=config.SCRYPT_PARAMS,
+                       scrypt_id_pepper=config.SCRYPT_ID_PEPPER,
+                       scrypt_gpg_pepper=config.SCRYPT_GPG_PEPPER,
+                       securedrop_root=config.SECUREDROP_ROOT,
+                       word_list=config.WORD_LIST,
+                       nouns_file=config.NOUNS,
+                       adjectives_file=config.ADJECTIVES,
+                       gpg_key_dir=config.GPG_KEY_DIR,
+                       reply_key_profile='dsa')
+
+    def test_unsupported_reply_key_profile(self):
+        with mock.patch.object(crypto_util.GnuPGBackend, 'supports',
+                               return_value=False), \
+                self.assertRaisesRegexp(CryptoException,
+                                        "can't generate curve25519"):
+            CryptoUtil(scrypt_params=config.SCRYPT_PARAMS,
+                       scrypt_id_pepper=config.SCRYPT_ID_PEPPER,
+                       scrypt_gpg_pepper=config.SCRYPT_GPG_PEPPER,
+                       securedrop_root=config.SECUREDROP_ROOT,
+                       word_list=config.WORD_LIST,
+                       nouns_file=config.NOUNS,
+                       adjectives_file=config.ADJECTIVES,
+                       gpg_key_dir=config.GPG_KEY_DIR,
+                       reply_key_profile='curve25519')
+
     def test_delete_reply_keypair(self):
         source, _ = utils.db_helper.init_source()
         current_app.crypto_util.delete_reply_keypair(source.filesystem_id)
 
         self.assertIsNone(current_app.crypto_util.getkey(source.filesystem_id))
 
+    def test_delete_reply_keypairs(self):
+        sources = [utils.db_helper.init_source()[0] for _ in range(3)]
+        filesystem_ids = [source.filesystem_id for source in sources]
+        fingerprints = [current_app.crypto_util.getkey(filesystem_id)
+                        for filesystem_id in filesystem_ids]
+        backend = current_app.crypto_util.backend
+
+        with mock.patch.object(backend, 'delete_keys',
+                               wraps=backend.delete_keys) as delete_keys:
+            current_app.crypto_util.delete_reply_keypairs(
+                filesystem_ids[:2] + ['Reality Winner'])
+
+        # All in one operation on the keyring
+        self.assertEqual(delete_keys.call_count, 1)
+        self.assertIsNone(current_app.crypto_util.getkey(filesystem_ids[0]))
+        self.assertIsNone(current_app.crypto_util.getkey(filesystem_ids[1]))
+        self.assertEqual(current_app.crypto_util.getkey(filesystem_ids[2]),
+                         fingerprints[2])
+        keyring = [fingerprint for fingerprint, _ in backend.list_keys()]
+        self.assertNotIn(fingerprints[0], keyring)
+        self.assertNotIn(fingerprints[1], keyring)
+        self.assertIn(fingerprints[2], keyring)
+
     def test_delete_reply_keypair_no_key(self):
         """No exceptions should be raised when provided a filesystem id that
         does not exist.
@@ -211,3 +335,43 @@ class TestCryptoUtil(unittest.TestCase):
 
         self.assertIsNotNone(
             current_app.crypto_util.getkey(source.filesystem_id))
+
+    def test_getkey_does_not_scan_keyring(self):
+        source, _ = utils.db_helper.init_source()
+
+        with mock.patch.object(current_app.crypto_util.gpg, 'list_keys') \
+                as mock_list_keys:
+            self.assertIsNotNone(
+                current_app.crypto_util.getkey(source.filesystem_id))
+        self.assertFalse(mock_list_keys.called)
+
+    def test_getkey_builds_missing_fingerprint_index(self):
+        source, _ = utils.db_helper.init_source()
+        fingerprint = current_app.crypto_util.getkey(source.filesystem_id)
+        os.remove(current_app.crypto_util.fingerprint_index.path)
+
+        self.assertEqual(fingerprint,
+                         current_app.crypto_util.getkey(source.filesystem_id))
+        self.assertTrue(current_app.crypto_util.fingerprint_index.exists())
+
+    def test_genkeypair_builds_missing_fingerprint_index(self):
+        source, _ = utils.db_helper.init_source()
+        fingerprint = current_app.crypto_util.getkey(source.filesystem_id)
+        os.remove(current_app.crypto_util.fingerprint_index.path)
+
+        # Adding the first key to the index doesn't hide the others
+        current_app.crypto_util.genkeypair('randomid', 'randomid')
+        self.assertEqual(fingerprint,
+                         current_app.crypto_util.getkey(source.filesystem_id))
+        self.assertIsNotNone(current_app.crypto_util.getkey('randomid'))
+
+    def test_rebuild_fingerprint_index(self):
+        source, _ = utils.db_helper.init_source()
+        fingerprint = current_app.crypto_util.getkey(source.filesystem_id)
+        current_app.crypto_util.fingerprint_index.replace({})
+
+        self.assertIsNone(
+            current_app.crypto_util.getkey(source.filesystem_id))
+        current_app.crypto_util.rebuild_fingerprint_index()
+        self.assertEqual(fingerprint,
+                         current_app.crypto_util.getkey(source.filesystem_id))
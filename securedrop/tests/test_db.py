@@ -1,11 +1,15 @@
 # -*- coding: utf-8 -*-
 from flask_testing import TestCase
 import mock
+import pytest
+from sqlalchemy import event
 
 import journalist
+from db import (db, background_session, get_database_uri,
+                SQLITE_BUSY_TIMEOUT)
 from utils import db_helper, env
-from models import (Journalist, Submission, Reply, get_one_or_else,
-                    LoginThrottledException)
+from models import (Journalist, Submission, Reply, Source, get_one_or_else,
+                    LoginThrottledException, recompute_source_counters)
 
 
 class TestDatabase(TestCase):
@@ -80,3 +84,111 @@ class TestDatabase(TestCase):
             Journalist.throttle_login(journalist)
         with self.assertRaises(LoginThrottledException):
             Journalist.throttle_login(journalist)
+
+    def _counters(self, source):
+        source = Source.query.get(source.id)
+        return (source.num_messages, source.num_documents, source.num_unread,
+                source.total_size)
+
+    def test_source_counters_follow_submissions_and_replies(self):
+        journalist, _ = db_helper.init_journalist()
+        source, _ = db_helper.init_source()
+        assert self._counters(source) == (0, 0, 0, 0)
+
+        submissions = db_helper.submit(source, 3)
+        size = sum(submission.size for submission in submissions)
+        assert self._counters(source) == (3, 0, 3, size)
+
+        db_helper.mark_downloaded(submissions[0])
+        assert self._counters(source) == (3, 0, 2, size)
+
+        reply, = db_helper.reply(journalist, source, 1)
+        size += reply.size
+        assert self._counters(source) == (3, 0, 2, size)
+
+        for item in (submissions[1], reply):
+            size -= item.size
+            db.session.delete(item)
+        db.session.commit()
+        assert self._counters(source) == (2, 0, 1, size)
+
+        # Marking a downloaded submission as downloaded changes nothing
+        db_helper.mark_downloaded(submissions[0])
+        assert self._counters(source) == (2, 0, 1, size)
+
+    def test_recompute_source_counters(self):
+        source, _ = db_helper.init_source()
+        submissions = db_helper.submit(source, 2)
+        db_helper.mark_downloaded(submissions[0])
+        expected = self._counters(source)
+
+        Source.query.update({'num_messages': 0, 'num_unread': 7,
+                             'total_size': 0})
+        db.session.commit()
+        assert self._counters(source) != expected
+
+        assert recompute_source_counters() == 1
+        db.session.commit()
+        assert self._counters(source) == expected
+
+    def test_source_collection(self):
+        journalist, _ = db_helper.init_journalist()
+        source, _ = db_helper.init_source()
+        # Order by number rather than by filename, where 10 < 9
+        source.interaction_count = 8
+        items = db_helper.submit(source, 1)
+        items += db_helper.reply(journalist, source, 1)
+        items += db_helper.submit(source, 1)
+        assert [item.interaction_index for item in items] == [9, 10, 11]
+
+        source = Source.query.get(source.id)
+        assert source.collection == items
+
+        statements = []
+
+        def count_statement(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', count_statement)
+        try:
+            assert source.collection == items
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', count_statement)
+        assert statements == []
+
+        # Changes to the collection are picked up
+        db.session.delete(items.pop(1))
+        db.session.commit()
+        assert source.collection == items
+
+
+def test_background_session(journalist_app, config):
+    db_uri = get_database_uri(config)
+
+    with background_session(db_uri) as session:
+        session.add(Source('1' * 32, 'alpha beaver'))
+
+    with pytest.raises(ValueError):
+        with background_session(db_uri) as session:
+            session.add(Source('2' * 32, 'beta cougar'))
+            session.flush()
+            raise ValueError()
+
+    with journalist_app.app_context():
+        designations = [source.journalist_designation
+                        for source in Source.query.all()]
+    assert designations == ['alpha beaver']
+
+
+def test_background_sessions_share_an_engine(config):
+    db_uri = get_database_uri(config)
+
+    with background_session(db_uri) as session:
+        engine = session.get_bind()
+    with background_session(db_uri) as session:
+        assert session.get_bind() is engine
+
+    with engine.connect() as connection:
+        # busy_timeout is in milliseconds
+        assert connection.execute('PRAGMA busy_timeout').scalar() == \
+            SQLITE_BUSY_TIMEOUT * 1000
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from mock import patch
+
+import deletion
+import worker
+
+
+@pytest.fixture
+def redis():
+    redis = worker.get_connection()
+    redis.delete(deletion.PENDING_KEY, deletion.BATCH_KEY)
+    yield redis
+    redis.delete(deletion.PENDING_KEY, deletion.BATCH_KEY)
+
+
+def test_schedule_coalesces_batches(redis):
+    with patch.object(worker, 'enqueue') as enqueue:
+        job = deletion.schedule(['/a', '/b'], 1, 4)
+        assert job == enqueue.return_value
+        # Until that batch is done, paths are added to it or the next one
+        with patch('deletion.Job') as Job:
+            assert deletion.schedule(['/c'], 1, 4) == Job.fetch.return_value
+
+    assert enqueue.call_count == 1
+    batch_id = enqueue.call_args[1]['job_id']
+    assert enqueue.call_args[0] == (worker.DELETION, deletion.delete_batch,
+                                    1, 4, 0, batch_id)
+    assert redis.get(deletion.BATCH_KEY) == batch_id
+    assert redis.lrange(deletion.PENDING_KEY, 0, -1) == ['/a', '/b', '/c']
+
+
+def test_schedule_takes_over_from_failed_batch(redis):
+    redis.set(deletion.BATCH_KEY, 'killed')
+    with patch.object(worker, 'enqueue') as enqueue, \
+            patch('deletion.Job') as Job:
+        Job.fetch.return_value.get_status.return_value = \
+            deletion.JobStatus.FAILED
+        assert deletion.schedule(['/a'], 1, 4) == enqueue.return_value
+
+    Job.fetch.assert_called_once_with('killed', connection=redis)
+    assert redis.get(deletion.BATCH_KEY) == enqueue.call_args[1]['job_id']
+
+
+def test_delete_batch(redis, tmpdir):
+    collections = [tmpdir.mkdir(str(n)) for n in range(3)]
+    for collection in collections:
+        collection.join('1-msg.gpg').write('secret')
+    redis.rpush(deletion.PENDING_KEY, *[str(c) for c in collections])
+
+    with patch.object(deletion, 'BATCH_SIZE', 2), \
+            patch.object(deletion, 'set_idle_io_priority') as io_priority, \
+            patch.object(worker, 'enqueue') as enqueue:
+        assert deletion.delete_batch(1, 4, 0) == "success"
+
+    assert io_priority.called
+    assert not collections[0].check()
+    assert not collections[1].check()
+    assert collections[2].check()
+    # The rest are left to the next batch, which is scheduled
+    assert redis.lrange(deletion.PENDING_KEY, 0, -1) == [str(collections[2])]
+    assert enqueue.call_count == 1
+    assert redis.get(deletion.BATCH_KEY) == enqueue.call_args[1]['job_id']
+
+
+def test_delete_batch_last(redis, tmpdir):
+    redis.rpush(deletion.PENDING_KEY, str(tmpdir.join('already-deleted')))
+
+    with patch.object(worker, 'enqueue') as enqueue:
+        assert deletion.delete_batch(1, 4, 0) == "success"
+
+    assert not enqueue.called
+    assert redis.llen(deletion.PENDING_KEY) == 0
+    assert redis.get(deletion.BATCH_KEY) is None
+
+
+def test_delete_batch_failure(redis, tmpdir):
+    deleted = tmpdir.join('deleted')
+    left = tmpdir.join('left')
+    left.write('secret')
+    redis.rpush(deletion.PENDING_KEY, str(deleted), str(left))
+    redis.set(deletion.BATCH_KEY, 'batch')
+
+    with patch('deletion.srm_batch', side_effect=OSError), \
+            patch.object(worker, 'enqueue') as enqueue:
+        with pytest.raises(OSError):
+            deletion.delete_batch(1, 4, 0, 'batch')
+
+    # Only the paths that are gone are taken off the list, and the rest are
+    # left to the next batch that's asked for
+    assert redis.lrange(deletion.PENDING_KEY, 0, -1) == [str(left)]
+    assert redis.get(deletion.BATCH_KEY) is None
+    assert not enqueue.called
+
+
+def test_status(redis):
+    assert deletion.status() == dict(pending=0, batch=None)
+    redis.rpush(deletion.PENDING_KEY, '/a', '/b')
+    assert deletion.status()['pending'] == 2
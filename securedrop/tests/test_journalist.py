@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 import os
 import random
+import re
 import unittest
 import zipfile
 
@@ -9,6 +10,7 @@ from flask import url_for, escape, session, current_app, g
 from flask_testing import TestCase
 from mock import patch
 from pyotp import TOTP
+from sqlalchemy import event
 from sqlalchemy.orm.exc import StaleDataError
 from sqlalchemy.exc import IntegrityError
 
@@ -19,11 +21,12 @@ import journalist_app as journalist_app_module
 import utils
 
 os.environ['SECUREDROP_ENV'] = 'test'  # noqa
+from scrypt_pool import ScryptPoolSaturated
 from sdconfig import SDConfig, config
 
 from db import db
 from models import (InvalidPasswordLength, Journalist, Reply, Source,
-                    Submission)
+                    SourceStar, Submission)
 from utils.instrument import InstrumentedApp
 
 # Smugly seed the RNG for deterministic testing
@@ -177,6 +180,19 @@ def test_login_invalid_credentials(journalist_app, test_journo):
     assert "Login failed" in text
 
 
+def test_login_when_scrypt_pool_is_saturated(journalist_app, test_journo):
+    with patch('scrypt_pool.hash', side_effect=ScryptPoolSaturated()):
+        with journalist_app.test_client() as app:
+            resp = app.post('/login',
+                            data=dict(username=test_journo['username'],
+                                      password=test_journo['password'],
+                                      token=TOTP(test_journo['otp_secret'])
+                                      .now()))
+            assert resp.status_code == 503
+            assert 'uid' not in session
+    assert "too busy" in resp.data.decode('utf-8')
+
+
 def test_validate_redirect(journalist_app):
     with journalist_app.test_client() as app:
         resp = app.post('/', follow_redirects=True)
@@ -309,6 +325,150 @@ def test_admin_index(journalist_app, test_admin):
         assert "Admin Interface" in text
 
 
+def test_admin_index_shows_deletion_progress(journalist_app, test_admin):
+    status = dict(pending=120,
+                  batch=dict(files=50, bytes_total=4 * 1024 * 1024,
+                             bytes_done=1024 * 1024,
+                             bytes_per_sec=512 * 1024))
+    with journalist_app.test_client() as app:
+        _login_user(app, test_admin['username'], test_admin['password'],
+                    test_admin['otp_secret'])
+        with patch('deletion.status', return_value=status):
+            resp = app.get('/admin/')
+        text = resp.data.decode('utf-8')
+        assert ("120 files or collections are waiting to be securely "
+                "deleted.") in text
+        assert ("Deleting 50 of them: 1.0 MB of 4.2 MB overwritten, at "
+                "524.3 kB/s.") in text
+
+
+def test_index_queries_do_not_grow_with_sources(journalist_app,
+                                                test_journo):
+    statements = []
+
+    def count_statement(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    def add_sources(num_sources, starred):
+        for _ in range(num_sources):
+            source, _ = utils.db_helper.init_source_without_keypair()
+            source.pending = False
+            utils.db_helper.submit(source, 2)
+            if starred:
+                db.session.add(SourceStar(source))
+        db.session.commit()
+
+    def get_index(app):
+        del statements[:]
+        event.listen(db.engine, 'before_cursor_execute', count_statement)
+        try:
+            resp = app.get('/')
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', count_statement)
+        assert resp.status_code == 200
+        return resp.data.decode('utf-8'), len(statements)
+
+    with journalist_app.test_client() as app:
+        _login_user(app, test_journo['username'], test_journo['password'],
+                    test_journo['otp_secret'])
+        add_sources(1, starred=False)
+        add_sources(1, starred=True)
+        text, few_sources_queries = get_index(app)
+        assert text.count('class="button-star starred"') == 1
+        assert text.count('2 unread') == 2
+        assert text.count('2 messages') == 2
+
+        add_sources(4, starred=False)
+        add_sources(4, starred=True)
+        text, many_sources_queries = get_index(app)
+        assert text.count('class="button-star starred"') == 5
+        assert text.count('2 unread') == 10
+
+    assert many_sources_queries == few_sources_queries
+
+
+def _add_listed_source(designation, num_submissions, num_unread):
+    source, _ = utils.db_helper.init_source_without_keypair()
+    source.journalist_designation = designation
+    source.pending = False
+    submissions = utils.db_helper.submit(source, num_submissions)
+    utils.db_helper.mark_downloaded(*submissions[num_unread:])
+    return source
+
+
+def _listed_designations(resp):
+    assert resp.status_code == 200
+    text = resp.data.decode('utf-8')
+    return re.findall(r'data-source-designation="([^"]+)"', text)
+
+
+def test_index_is_paginated_and_filtered(config, journalist_app, test_journo):
+    config.SOURCES_PER_PAGE = 2
+    with journalist_app.test_client() as app:
+        _login_user(app, test_journo['username'], test_journo['password'],
+                    test_journo['otp_secret'])
+        _add_listed_source('alpha beaver', 3, 1)
+        _add_listed_source('beta cougar', 3, 3)
+        _add_listed_source('alpha dingo', 3, 2)
+
+        resp = app.get(url_for('main.index'))
+        assert _listed_designations(resp) == ['alpha dingo', 'beta cougar']
+        assert 'Page 1 of 2' in resp.data.decode('utf-8')
+
+        resp = app.get(url_for('main.index', page=2))
+        assert _listed_designations(resp) == ['alpha beaver']
+
+        resp = app.get(url_for('main.index', sort='unread'))
+        assert _listed_designations(resp) == ['beta cougar', 'alpha dingo']
+
+        resp = app.get(url_for('main.index', filter=' Alpha '))
+        assert _listed_designations(resp) == ['alpha dingo', 'alpha beaver']
+
+        resp = app.get(url_for('main.index', filter='alpha d'))
+        assert _listed_designations(resp) == ['alpha dingo']
+
+        resp = app.get(url_for('main.index', filter='zebra'))
+        assert _listed_designations(resp) == []
+        assert 'No sources match your filter.' in resp.data.decode('utf-8')
+
+
+def test_index_sorted_by_star(journalist_app, test_journo):
+    with journalist_app.test_client() as app:
+        _login_user(app, test_journo['username'], test_journo['password'],
+                    test_journo['otp_secret'])
+        starred = _add_listed_source('alpha beaver', 1, 1)
+        _add_listed_source('beta cougar', 1, 1)
+        db.session.add(SourceStar(starred))
+        db.session.commit()
+
+        resp = app.get(url_for('main.index', sort='starred'))
+        assert _listed_designations(resp) == ['alpha beaver', 'beta cougar']
+
+        # Unknown sort keys fall back to the default order
+        resp = app.get(url_for('main.index', sort='id; drop table sources'))
+        assert _listed_designations(resp) == ['alpha beaver', 'beta cougar']
+
+
+def test_bulk_action_returns_to_index_page(journalist_app, test_journo):
+    with journalist_app.test_client() as app:
+        _login_user(app, test_journo['username'], test_journo['password'],
+                    test_journo['otp_secret'])
+        source = _add_listed_source('alpha beaver', 1, 1)
+        filesystem_id = source.filesystem_id
+
+        resp = app.post(url_for('col.process'),
+                        data=dict(action='star',
+                                  cols_selected=[filesystem_id],
+                                  sort='unread', filter='alpha', page='2'))
+
+        assert resp.status_code == 302
+        assert resp.location == url_for('main.index', sort='unread',
+                                        filter='alpha', page='2',
+                                        _external=True)
+        source = Source.query.filter_by(filesystem_id=filesystem_id).one()
+        assert source.star.starred
+
+
 class TestJournalistApp(TestCase):
 
     # A method required by flask_testing.TestCase
@@ -1078,6 +1238,44 @@ class TestJournalistApp(TestCase):
         results = db.session.query(Reply.source_id == self.source.id).all()
         self.assertEqual(results, [])
 
+    def test_delete_collections_at_once(self):
+        """Verify that deleting several sources removes their records, and
+        only theirs, in one commit, with one deletion job for their
+        collections."""
+        sources = []
+        for _ in range(3):
+            source, _ = utils.db_helper.init_source()
+            utils.db_helper.submit(source, 2)
+            utils.db_helper.reply(self.user, source, 1)
+            db.session.add(SourceStar(source))
+            sources.append(source)
+        db.session.commit()
+        deleted, kept = sources[:2], sources[2]
+
+        with patch('deletion.schedule') as schedule, \
+                patch.object(db.session, 'commit',
+                             wraps=db.session.commit) as commit:
+            journalist_app_module.utils.delete_collections(
+                [source.filesystem_id for source in deleted])
+
+        self.assertEqual(commit.call_count, 1)
+        self.assertEqual(schedule.call_count, 1)
+        self.assertEqual(
+            sorted(schedule.call_args[0][0]),
+            sorted(current_app.storage.path(source.filesystem_id)
+                   for source in deleted))
+        for source in deleted:
+            self.assertIsNone(current_app.crypto_util.getkey(
+                source.filesystem_id))
+        deleted_ids = [source.id for source in deleted]
+        for model in (Submission, Reply, SourceStar):
+            self.assertEqual(model.query.filter(
+                model.source_id.in_(deleted_ids)).count(), 0)
+            self.assertTrue(model.query.filter(
+                model.source_id == kept.id).count())
+        self.assertEqual(
+            [source.id for source in Source.query.all()], [kept.id])
+
     def test_delete_source_deletes_source_key(self):
         """Verify that when a source is deleted, the PGP key that corresponds
         to them is also deleted."""
@@ -1104,14 +1302,13 @@ class TestJournalistApp(TestCase):
                                        self.source.filesystem_id)
         self.assertTrue(os.path.exists(dir_source_docs))
 
-        job = journalist_app_module.utils.delete_collection(
+        journalist_app_module.utils.delete_collection(
             self.source.filesystem_id)
 
-        # Wait up to 5s to wait for Redis worker `srm` operation to complete
-        utils.async.wait_for_redis_worker(job)
-
-        # Encrypted documents no longer exist
-        self.assertFalse(os.path.exists(dir_source_docs))
+        # Encrypted documents no longer exist, once the deletion worker has
+        # got to them
+        utils.async.wait_for_assertion(
+            lambda: self.assertFalse(os.path.exists(dir_source_docs)))
 
     def test_download_selected_submissions_from_source(self):
         source, _ = utils.db_helper.init_source()
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from flask import current_app
+from mock import patch
+from redis.exceptions import ConnectionError as RedisConnectionError
+
+import keygen
+import utils
+import worker
+
+from db import db
+from models import Source
+
+
+def test_enqueue_deduplicates_per_source(source_app):
+    with source_app.app_context():
+        source, codename = utils.db_helper.init_source()
+        filesystem_id = source.filesystem_id
+        db_uri = current_app.config['SQLALCHEMY_DATABASE_URI']
+        passphrase = current_app.crypto_util.derive_passphrase(codename)
+        redis = worker.get_connection()
+
+        with patch.object(worker, 'get_local_worker') as get_local_worker:
+            try:
+                local = get_local_worker.return_value
+                assert keygen.enqueue(current_app.crypto_util, db_uri,
+                                      filesystem_id, passphrase) == \
+                    local.enqueue.return_value
+                assert keygen.status(filesystem_id) == keygen.QUEUED
+                assert keygen.enqueue(current_app.crypto_util, db_uri,
+                                      filesystem_id, passphrase) is None
+                # Only whether it's pending is kept in Redis
+                assert redis.keys('securedrop:keygen:*') == \
+                    [keygen._pending_key(filesystem_id)]
+            finally:
+                redis.delete(keygen._pending_key(filesystem_id))
+
+        assert local.enqueue.call_count == 1
+        args = local.enqueue.call_args[0][2]
+        assert codename not in args
+        # The passphrase is only handed to the job in memory
+        assert args[-1] == passphrase
+        assert local.enqueue.call_args[1] == dict(durable=False)
+
+
+def test_enqueue_without_redis(source_app):
+    with source_app.app_context():
+        crypto_util = current_app.crypto_util
+        db_uri = current_app.config['SQLALCHEMY_DATABASE_URI']
+
+        with patch.object(worker, 'get_connection') as get_connection, \
+                patch.object(worker, 'get_local_worker') as get_local_worker:
+            get_connection.return_value.set.side_effect = \
+                RedisConnectionError('Connection refused')
+            job = keygen.enqueue(crypto_util, db_uri, 'abc', 'passphrase')
+
+        local = get_local_worker.return_value
+        assert job == local.enqueue.return_value
+        assert local.enqueue.call_args[0][2][-1] == 'passphrase'
+
+
+def test_generate_reply_keypair(source_app):
+    with source_app.app_context():
+        source, codename = utils.db_helper.init_source_without_keypair()
+        filesystem_id = source.filesystem_id
+        last_updated = source.last_updated
+        crypto_util = current_app.crypto_util
+
+        result = keygen.generate_reply_keypair(
+            crypto_util.gpg_key_dir,
+            crypto_util.backend.NAME,
+            crypto_util.reply_key_params,
+            current_app.config['SQLALCHEMY_DATABASE_URI'],
+            filesystem_id,
+            crypto_util.derive_passphrase(codename))
+
+        assert result == 'success'
+        assert crypto_util.getkey(filesystem_id)
+        assert keygen.status(filesystem_id) is None
+        db.session.expire_all()
+        source = Source.query.filter_by(filesystem_id=filesystem_id).one()
+        assert source.last_updated > last_updated
+
+
+def test_wait_for_entropy_retries():
+    with patch.object(keygen, 'get_entropy_estimate') as get_entropy_estimate:
+        with patch('time.sleep') as sleep:
+            get_entropy_estimate.side_effect = [300, 1000, 2400]
+            assert keygen.wait_for_entropy() == 2400
+            assert sleep.call_count == 2
+
+
+def test_wait_for_entropy_gives_up():
+    with patch.object(keygen, 'get_entropy_estimate') as get_entropy_estimate:
+        with patch('time.sleep'):
+            get_entropy_estimate.return_value = 300
+            with pytest.raises(keygen.LowEntropyException):
+                keygen.wait_for_entropy()
+            assert get_entropy_estimate.call_count == keygen.ENTROPY_RETRIES
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+import os
+import threading
+
+from mock import Mock
+
+import utils
+
+from local_worker import LocalWorker
+
+
+def test_run_job(tmpdir):
+    local = LocalWorker(str(tmpdir.join('jobs.sqlite')))
+    path = str(tmpdir.join('made-by-job'))
+
+    assert local.enqueue('deletion', os.mkdir, (path,), {}, {})
+
+    def job_done():
+        assert os.path.isdir(path)
+        assert local.pending() == 0
+    utils.async.wait_for_assertion(job_done)
+
+
+def test_duplicate_job(tmpdir):
+    # Hold on to the first job while the second is queued
+    release = threading.Event()
+    local = LocalWorker(str(tmpdir.join('jobs.sqlite')),
+                        hand_back=Mock(side_effect=lambda *args:
+                                       release.wait()))
+    try:
+        assert local.enqueue('keygen', os.getpid, (), {}, dict(job_id='1'))
+        assert local.enqueue('keygen', os.getpid, (), {},
+                             dict(job_id='1')) is None
+        assert local.pending('keygen') == 1
+    finally:
+        release.set()
+
+
+def test_hand_back(tmpdir):
+    hand_back = Mock()
+    local = LocalWorker(str(tmpdir.join('jobs.sqlite')), hand_back=hand_back)
+    path = str(tmpdir.join('made-by-job'))
+
+    local.enqueue('deletion', os.mkdir, (path,), {}, dict(timeout=60))
+
+    def handed_back():
+        hand_back.assert_called_once_with('deletion', 'posix.mkdir', (path,),
+                                          {}, dict(timeout=60))
+        assert local.pending() == 0
+    utils.async.wait_for_assertion(handed_back)
+    assert not os.path.exists(path)
+
+
+def test_run_job_if_hand_back_fails(tmpdir):
+    hand_back = Mock(side_effect=IOError('Connection refused'))
+    local = LocalWorker(str(tmpdir.join('jobs.sqlite')), hand_back=hand_back)
+    path = str(tmpdir.join('made-by-job'))
+
+    local.enqueue('deletion', os.mkdir, (path,), {}, {})
+
+    def job_done():
+        assert hand_back.called
+        assert os.path.isdir(path)
+    utils.async.wait_for_assertion(job_done)
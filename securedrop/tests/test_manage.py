@@ -2,23 +2,27 @@
 
 import argparse
 import os
+from flask import current_app
 from os.path import abspath, dirname, realpath
 os.environ['SECUREDROP_ENV'] = 'test'  # noqa
 from sdconfig import config
 import logging
 import manage
+import migrations
 import mock
+import rm
 from sqlalchemy.orm.exc import NoResultFound
 from StringIO import StringIO
 import sys
 import time
 import unittest
 import utils
+import worker
 
 import journalist_app
 
 from db import db
-from models import Journalist
+from models import Journalist, Source
 
 
 YUBIKEY_HOTP = ['cb a0 5f ad 41 a2 ff 4e eb 53 56 3a 1b f7 23 2e ce fc dc',
@@ -202,3 +206,79 @@ class TestManage(object):
         manage.setup_verbosity(args)
         manage.clean_tmp(args)
         assert 'FILE removed' in caplog.text
+
+    def test_clean_uploads(self, caplog, tmpdir):
+        old = tmpdir.join('old.aes')
+        old.write('abandoned')
+        old.setmtime(time.time() - 3 * 60 * 60)
+        recent = tmpdir.join('recent.aes')
+        recent.write('in progress')
+        args = argparse.Namespace(minutes=120, verbose=logging.DEBUG)
+        manage.setup_verbosity(args)
+        with mock.patch.object(manage.uploads, 'UPLOAD_DIR', str(tmpdir)):
+            manage.clean_uploads(args)
+        assert not old.check()
+        assert recent.check()
+        assert 'old.aes removed' in caplog.text
+
+    def test_recompute_source_counters(self, caplog):
+        source, _ = utils.db_helper.init_source()
+        utils.db_helper.submit(source, 2)
+        source.num_messages = 0
+        db.session.commit()
+        source_id = source.id
+
+        args = argparse.Namespace(verbose=logging.DEBUG)
+        manage.setup_verbosity(args)
+        assert manage.recompute_source_counters(args) == 0
+        assert 'Recomputed the counters of 1 sources' in caplog.text
+        assert Source.query.get(source_id).num_messages == 2
+
+    def test_rebuild_fingerprint_index(self, caplog):
+        source, _ = utils.db_helper.init_source()
+        fingerprint = current_app.crypto_util.getkey(source.filesystem_id)
+        current_app.crypto_util.fingerprint_index.replace({})
+
+        args = argparse.Namespace(verbose=logging.DEBUG)
+        manage.setup_verbosity(args)
+        assert manage.rebuild_fingerprint_index(args) == 0
+        assert 'Indexed' in caplog.text
+        assert current_app.crypto_util.getkey(
+            source.filesystem_id) == fingerprint
+
+    def test_migrate_worker_queues(self, caplog):
+        legacy = worker.get_queue(worker.LEGACY_QUEUE)
+        legacy.empty()
+        legacy.enqueue(rm.srm, '/var/lib/securedrop/store/abc')
+        legacy.enqueue(rm.overwrite_passes, 1)
+
+        manage.setup_verbosity(argparse.Namespace(verbose=logging.DEBUG))
+        with mock.patch('deletion.schedule') as schedule:
+            assert manage.migrate_worker_queues(argparse.Namespace()) == 0
+
+        try:
+            assert schedule.call_args[0][0] == [
+                '/var/lib/securedrop/store/abc']
+            # Jobs it doesn't know of are left alone
+            assert [job.func_name for job in legacy.jobs] == [
+                'rm.overwrite_passes']
+            assert 'Scheduled 1 deletions' in caplog.text
+        finally:
+            legacy.empty()
+
+    def test_migrate(self, caplog):
+        manage.setup_verbosity(argparse.Namespace(verbose=logging.DEBUG))
+
+        migrations.set_version(db.engine, migrations.latest_version())
+        args = argparse.Namespace(version=0)
+        assert manage.migrate(args) == 0
+        assert migrations.get_version(db.engine) == 0
+
+        args = argparse.Namespace(version=None)
+        assert manage.migrate(args) == 0
+        assert 'Applied 1' in caplog.text
+        assert migrations.get_version(db.engine) == \
+            migrations.latest_version()
+
+        args = argparse.Namespace(version=migrations.latest_version() + 1)
+        assert manage.migrate(args) == 1
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+import os
+import pytest
+
+from sqlalchemy import create_engine
+
+os.environ['SECUREDROP_ENV'] = 'test'  # noqa
+import migrations
+
+from db import db
+from models import Reply, Source, Submission
+
+
+def _indexes(connection):
+    return set(name for name, in connection.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'index' "
+        "AND name LIKE 'ix_%'"))
+
+
+@pytest.fixture
+def engine(tmpdir):
+    engine = create_engine('sqlite:///' + str(tmpdir.join('db.sqlite')))
+    db.Model.metadata.create_all(engine)
+    return engine
+
+
+def test_models_match_latest_migration(engine):
+    """A database created from the models must have everything that the
+    migrations add, since `init-db` marks it as fully migrated."""
+    with engine.connect() as connection:
+        created = _indexes(connection)
+        migrations.set_version(connection, migrations.latest_version())
+        migrations.migrate(connection, 0)
+        assert migrations.get_version(connection) == 0
+        assert not created & _indexes(connection)
+
+        migrations.migrate(connection)
+        assert migrations.get_version(connection) == \
+            migrations.latest_version()
+        assert _indexes(connection) == created
+
+
+def test_migrate_up_and_down(engine):
+    with engine.connect() as connection:
+        migrations.set_version(connection, migrations.latest_version())
+        migrations.migrate(connection, 0)
+
+        applied = migrations.migrate(connection)
+        assert [(direction, migration.version)
+                for direction, migration in applied] == \
+            [('upgrade', migration.version)
+             for migration in migrations.MIGRATIONS]
+        assert 'ix_submissions_source_id' in _indexes(connection)
+
+        # Already up to date
+        assert migrations.migrate(connection) == []
+
+        applied = migrations.migrate(connection, 0)
+        assert [(direction, migration.version)
+                for direction, migration in applied] == \
+            [('downgrade', migration.version)
+             for migration in reversed(migrations.MIGRATIONS)]
+        assert 'ix_submissions_source_id' not in _indexes(connection)
+
+
+def test_migrate_unknown_versions(engine):
+    with engine.connect() as connection:
+        with pytest.raises(migrations.MigrationError):
+            migrations.migrate(connection, migrations.latest_version() + 1)
+        with pytest.raises(migrations.MigrationError):
+            migrations.migrate(connection, -1)
+
+        migrations.set_version(connection, migrations.latest_version() + 1)
+        with pytest.raises(migrations.MigrationError):
+            migrations.migrate(connection)
+
+
+def test_source_counters_are_backfilled(engine):
+    engine.execute(Source.__table__.insert(), [
+        {'id': 1, 'journalist_designation': 'alpha beaver'},
+        {'id': 2, 'journalist_designation': 'beta cougar'}])
+    engine.execute(Submission.__table__.insert(), [
+        {'source_id': 1, 'filename': '1-alpha_beaver-msg.gpg', 'size': 1,
+         'downloaded': True, 'interaction_index': 1},
+        {'source_id': 1, 'filename': '2-alpha_beaver-msg.gpg', 'size': 2,
+         'downloaded': False, 'interaction_index': 2},
+        {'source_id': 1, 'filename': '3-alpha_beaver-doc.gz.gpg', 'size': 4,
+         'downloaded': False, 'interaction_index': 3}])
+    engine.execute(Reply.__table__.insert(), [
+        {'source_id': 1, 'filename': '4-alpha_beaver-reply.gpg', 'size': 8,
+         'interaction_index': 4}])
+
+    with engine.connect() as connection:
+        migrations.set_version(connection, migrations.latest_version())
+        migrations.migrate(connection, 1)
+        assert connection.execute(
+            'SELECT journalist_designation FROM sources ORDER BY id'
+        ).fetchall() == [('alpha beaver',), ('beta cougar',)]
+
+        migrations.migrate(connection, 2)
+        counters = connection.execute(
+            'SELECT num_messages, num_documents, num_unread, total_size '
+            'FROM sources ORDER BY id').fetchall()
+        assert counters == [(2, 1, 2, 15), (0, 0, 0, 0)]
+
+
+def test_interaction_index_is_backfilled(engine):
+    engine.execute(Submission.__table__.insert(), [
+        {'source_id': 1, 'filename': '12-alpha_beaver-msg.gpg', 'size': 1,
+         'interaction_index': 12}])
+    engine.execute(Reply.__table__.insert(), [
+        {'source_id': 1, 'filename': '3-alpha_beaver-reply.gpg', 'size': 1,
+         'interaction_index': 3}])
+
+    with engine.connect() as connection:
+        migrations.set_version(connection, migrations.latest_version())
+        migrations.migrate(connection, 2)
+        migrations.migrate(connection, 3)
+        assert connection.execute(
+            'SELECT interaction_index FROM submissions').fetchall() == [(12,)]
+        assert connection.execute(
+            'SELECT interaction_index FROM replies').fetchall() == [(3,)]
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+import os
+import pytest
+
+from mock import patch
+
+import rm
+
+
+def test_overwrite_passes():
+    assert rm.overwrite_passes(rm.DEFAULT_PASSES) == rm.SRM_PASSES
+    assert len(rm.SRM_PASSES) == 38
+    assert rm.overwrite_passes(2) == [b'\xff', None]
+    assert rm.overwrite_passes(1) == [None]
+    assert rm.overwrite_passes(0) == []
+
+
+def test_srm_file(tmpdir):
+    path = tmpdir.join('1-leak-doc.gz.gpg')
+    path.write('x' * 10000)
+    overwrites = []
+
+    def fsync(fd):
+        with open(str(path), 'rb') as f:
+            overwrites.append(f.read())
+
+    with patch('os.fsync', side_effect=fsync):
+        assert rm.srm(str(path), passes=2) == "success"
+
+    assert not path.check()
+    assert tmpdir.listdir() == []
+    # 0xff, then random, then truncated. The end of the last block is
+    # overwritten too.
+    assert len(overwrites[0]) >= 10000
+    assert set(overwrites[0]) == set([b'\xff'])
+    assert len(overwrites[1]) == len(overwrites[0])
+    assert 'x' * 16 not in overwrites[1]
+    assert overwrites[2] == b''
+
+
+def test_srm_tree(tmpdir):
+    collection = tmpdir.mkdir('collection')
+    collection.mkdir('sub').join('reply.gpg').write('reply')
+    for n in range(10):
+        collection.join('{}-msg.gpg'.format(n)).write(os.urandom(100 * n))
+    outside = tmpdir.join('outside')
+    outside.write('keep me')
+    collection.join('link').mksymlinkto(outside)
+
+    with patch.object(rm, 'get_current_job') as get_current_job:
+        job = get_current_job.return_value
+        job.meta = {}
+        assert rm.srm(str(collection), passes=3, threads=4) == "success"
+
+    assert tmpdir.listdir() == [outside]
+    assert outside.read() == 'keep me'
+    assert job.meta['bytes_total'] == job.meta['bytes_done'] > 0
+    assert job.meta['bytes_per_sec'] > 0
+    assert job.save_meta.called
+
+
+def test_srm_missing_file(tmpdir):
+    with pytest.raises(OSError):
+        rm.srm(str(tmpdir.join('missing')))
+
+
+def test_srm_batch(tmpdir):
+    collection = tmpdir.mkdir('collection')
+    submission = collection.join('1-msg.gpg')
+    submission.write('secret')
+    reply = tmpdir.join('2-reply.gpg')
+    reply.write('secret')
+
+    # The submission is deleted along with its collection, only once
+    assert rm.srm_batch([str(submission), str(tmpdir.join('missing')),
+                         str(collection), str(reply)],
+                        passes=1) == "success"
+
+    assert tmpdir.listdir() == []
+
+
+def test_max_rate():
+    with patch('time.time', return_value=100.0), \
+            patch('time.sleep') as sleep:
+        progress = rm.Progress(4096, max_rate=1024)
+        progress.add(2048)
+
+    sleep.assert_called_once_with(2.0)
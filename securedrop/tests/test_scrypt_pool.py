@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+import multiprocessing
+import os
+import pytest
+import scrypt
+import threading
+
+from mock import patch
+
+os.environ['SECUREDROP_ENV'] = 'test'  # noqa
+import scrypt_pool
+
+from scrypt_pool import ScryptPool, ScryptPoolSaturated
+
+PARAMS = dict(N=2**1, r=1, p=1)
+
+
+def test_inline_hash():
+    pool = ScryptPool()
+    assert pool.hash('codename', 'salt', **PARAMS) == \
+        scrypt.hash('codename', 'salt', **PARAMS)
+
+    stats = pool.stats()
+    assert stats['calls'] == 1
+    assert stats['queue_depth'] == 0
+    assert stats['rejected'] == 0
+
+
+def test_process_pool_hash():
+    pool = ScryptPool(processes=1, max_queue=1)
+    try:
+        assert pool.hash('codename', 'salt', **PARAMS) == \
+            scrypt.hash('codename', 'salt', **PARAMS)
+        assert pool.stats()['calls'] == 1
+        assert pool.stats()['max_latency'] > 0
+    finally:
+        pool.close()
+
+
+def test_saturated_pool_rejects_hashes():
+    pool = ScryptPool(processes=1, max_queue=0)
+    started = threading.Event()
+    release = threading.Event()
+
+    def slow_get(timeout):
+        started.set()
+        release.wait()
+        return 'hash'
+
+    with patch.object(pool, '_ScryptPool__get_pool') as mock_get_pool:
+        mock_get_pool.return_value.apply_async.return_value.get = slow_get
+        thread = threading.Thread(target=pool.hash,
+                                  args=('codename', 'salt'),
+                                  kwargs=PARAMS)
+        thread.start()
+        started.wait()
+        assert pool.stats()['queue_depth'] == 1
+
+        with pytest.raises(ScryptPoolSaturated):
+            pool.hash('codename', 'salt', **PARAMS)
+
+        release.set()
+        thread.join()
+
+    stats = pool.stats()
+    assert stats['rejected'] == 1
+    assert stats['calls'] == 1
+    assert stats['queue_depth'] == 0
+
+
+def test_hash_timeout_releases_slot():
+    pool = ScryptPool(processes=1, max_queue=0, timeout=0.1)
+    with patch.object(pool, '_ScryptPool__get_pool') as mock_get_pool:
+        result = mock_get_pool.return_value.apply_async.return_value
+        result.get.side_effect = multiprocessing.TimeoutError()
+        with pytest.raises(ScryptPoolSaturated):
+            pool.hash('codename', 'salt', **PARAMS)
+        result.get.assert_called_once_with(0.1)
+
+        # The slot it held is free again
+        result.get.side_effect = None
+        result.get.return_value = 'hash'
+        assert pool.hash('codename', 'salt', **PARAMS) == 'hash'
+
+    stats = pool.stats()
+    assert stats['timed_out'] == 1
+    assert stats['queue_depth'] == 0
+
+
+def test_hash_timeout_replaces_pool():
+    pool = ScryptPool(processes=1, max_queue=0, timeout=0.1)
+    try:
+        stuck = pool._ScryptPool__get_pool()
+        with patch.object(stuck, 'apply_async') as apply_async:
+            apply_async.return_value.get.side_effect = \
+                multiprocessing.TimeoutError()
+            with pytest.raises(ScryptPoolSaturated):
+                pool.hash('codename', 'salt', **PARAMS)
+        assert pool._ScryptPool__get_pool() is not stuck
+        assert pool.hash('codename', 'salt', **PARAMS) == \
+            scrypt.hash('codename', 'salt', **PARAMS)
+    finally:
+        pool.close()
+
+
+def test_stats_are_logged_periodically():
+    pool = ScryptPool()
+    with patch.object(pool, 'log_stats') as log_stats:
+        pool.hash('codename', 'salt', **PARAMS)
+        assert not log_stats.called
+
+        with patch.object(scrypt_pool, 'STATS_INTERVAL', 0):
+            pool.hash('codename', 'salt', **PARAMS)
+        assert log_stats.call_count == 1
+
+    with patch('logging.Logger.info') as info:
+        pool.log_stats()
+    assert "2 hashes, 0 refused, 0 timed out" in info.call_args[0][0]
+
+
+def test_configure_replaces_default_pool():
+    original = scrypt_pool._pool
+    try:
+        scrypt_pool.configure(processes=0, max_queue=0)
+        assert scrypt_pool._pool is original
+
+        scrypt_pool.configure(processes=1, max_queue=2)
+        assert scrypt_pool._pool is not original
+        assert scrypt_pool.hash('codename', 'salt', **PARAMS) == \
+            scrypt.hash('codename', 'salt', **PARAMS)
+    finally:
+        scrypt_pool._pool.close()
+        scrypt_pool._pool = original
@@ -101,3 +101,39 @@ class TestSecureTempfile(unittest.TestCase):
         invalid characters such as '/' and '\0' (null)."""
         self.assertNotIn('/', self.f.tmp_file_id)
         self.assertNotIn('\0', self.f.tmp_file_id)
+
+    def test_resume(self):
+        f = secure_tempfile.SecureTemporaryFile(config.STORE_DIR,
+                                                delete=False)
+        # Not a whole number of AES blocks
+        f.write(self.msg * 3)
+        f.close()
+        self.assertTrue(os.path.exists(f.filepath))
+
+        f = secure_tempfile.SecureTemporaryFile(
+            config.STORE_DIR,
+            resume=(f.tmp_file_id, f.key, f.iv, len(self.msg) * 3))
+        f.write(self.msg)
+
+        self.assertEqual(f.read(), self.msg * 4)
+        f.close()
+        self.assertFalse(os.path.exists(f.filepath))
+
+    def test_resume_discards_past_offset(self):
+        f = secure_tempfile.SecureTemporaryFile(config.STORE_DIR,
+                                                delete=False)
+        f.write(self.msg * 3)
+        f.close()
+
+        f = secure_tempfile.SecureTemporaryFile(
+            config.STORE_DIR, resume=(f.tmp_file_id, f.key, f.iv, 5))
+        f.write('BORN TO DIE')
+
+        self.assertEqual(f.read(), self.msg[:5] + 'BORN TO DIE')
+
+    def test_resume_invalid_tmp_file_id(self):
+        with self.assertRaises(ValueError):
+            secure_tempfile.SecureTemporaryFile(
+                config.STORE_DIR,
+                resume=('../' + self.f.tmp_file_id[3:], self.f.key,
+                        self.f.iv, 0))
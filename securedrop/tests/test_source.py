@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 import gzip
 import json
+import os
 import re
 import subprocess
 
@@ -15,7 +16,11 @@ import version
 
 from db import db
 from models import Source
+from scrypt_pool import ScryptPoolSaturated
 from source_app import main as source_app_main
+from source_app import uploads as source_app_uploads
+from source_app.codename_pool import CodenamePool
+from source_app.utils import make_unique_codename
 from utils.db_helper import new_codename
 from utils.instrument import InstrumentedApp
 
@@ -93,6 +98,63 @@ def test_generate(source_app):
     assert codename == escape(session_codename)
 
 
+def test_generate_uses_codename_pool(source_app):
+    pool = CodenamePool(source_app, 2, make_unique_codename)
+    source_app.codename_pool = pool
+
+    # fill the pool synchronously instead of from the background thread
+    with patch('source_app.codename_pool.Thread'):
+        with source_app.app_context():
+            assert pool.pop('en') is None  # registers the locale
+            pool.fill()
+        assert len(pool) == 2
+
+        with patch.object(source_app.crypto_util, 'hash_codename') \
+                as mock_hash_codename:
+            with source_app.test_client() as app:
+                resp = app.get('/generate')
+                assert resp.status_code == 200
+                codename = session['codename']
+                filesystem_id = session['filesystem_id']
+                resp = app.post('/create', follow_redirects=True)
+                assert session['logged_in'] is True
+            assert not mock_hash_codename.called
+
+    assert len(pool) == 1
+    assert filesystem_id == source_app.crypto_util.hash_codename(codename)
+    with source_app.app_context():
+        assert Source.query.filter_by(filesystem_id=filesystem_id).one()
+
+
+def test_codename_pool_is_per_process_and_wiped(source_app):
+    pool = CodenamePool(source_app, 2, make_unique_codename)
+
+    with patch('source_app.codename_pool.Thread'):
+        with source_app.app_context():
+            pool.pop('en')
+            pool.fill()
+        assert len(pool) == 2
+
+        # a forked child must not hand out its parent's codenames
+        with patch('os.getpid', return_value=os.getpid() + 1):
+            assert pool.pop('en') is None
+            assert len(pool) == 0
+
+            with source_app.app_context():
+                pool.fill()
+            assert len(pool) == 2
+
+    pool.wipe()
+    assert len(pool) == 0
+
+
+def test_codename_pool_disabled(source_app):
+    pool = CodenamePool(source_app, 0, make_unique_codename)
+    with patch('source_app.codename_pool.Thread') as mock_thread:
+        assert pool.pop('en') is None
+    assert not mock_thread.called
+
+
 def test_generate_already_logged_in(source_app):
     with source_app.test_client() as app:
         new_codename(app, session)
@@ -169,6 +231,24 @@ def test_lookup(source_app):
         assert "BEGIN PGP PUBLIC KEY BLOCK" in text
 
 
+def test_lookup_shows_key_generation(source_app):
+    with patch.object(source_app_main, 'async_genkey') as async_genkey:
+        with source_app.test_client() as app:
+            new_codename(app, session)
+            source = Source.query.filter_by(
+                filesystem_id=session['filesystem_id']).one()
+            source.flagged = True
+            db.session.commit()
+
+            resp = app.get('/lookup')
+            assert async_genkey.called
+            assert 'id="keygen-status"' in resp.data.decode('utf-8')
+
+            async_genkey.return_value = None
+            resp = app.get('/lookup')
+            assert 'id="keygen-status"' not in resp.data.decode('utf-8')
+
+
 def test_login_and_logout(source_app):
     with source_app.test_client() as app:
         resp = app.get('/login')
@@ -210,6 +290,31 @@ def test_login_and_logout(source_app):
         assert 'Thank you for exiting your session!' in text
 
 
+def test_filesystem_id_is_derived_once_per_session(source_app):
+    with source_app.test_client() as app:
+        codename = new_codename(app, session)
+        filesystem_id = session['filesystem_id']
+        assert filesystem_id == source_app.crypto_util.hash_codename(codename)
+
+        with patch.object(source_app.crypto_util, 'hash_codename',
+                          wraps=source_app.crypto_util.hash_codename) \
+                as mock_hash_codename:
+            for _ in range(3):
+                resp = app.get('/lookup')
+                assert resp.status_code == 200
+            assert not mock_hash_codename.called
+
+            app.get('/logout')
+            assert 'filesystem_id' not in session
+            resp = app.post('/login', data=dict(codename=codename),
+                            follow_redirects=True)
+            assert resp.status_code == 200
+            assert session['filesystem_id'] == filesystem_id
+            app.get('/lookup')
+            # only to check the codename, which gives the session's id
+            assert mock_hash_codename.call_count == 1
+
+
 def test_user_must_log_in_for_protected_views(source_app):
     with source_app.test_client() as app:
         resp = app.get('/lookup', follow_redirects=True)
@@ -345,38 +450,186 @@ def test_submit_both(source_app):
         assert "Thanks! We received your message and document" in text
 
 
-def test_submit_message_with_low_entropy(source_app):
+def test_submit_message_queues_key_generation(source_app):
     with patch.object(source_app_main, 'async_genkey') as async_genkey:
-        with patch.object(source_app_main, 'get_entropy_estimate') \
-                as get_entropy_estimate:
-            get_entropy_estimate.return_value = 300
+        with source_app.test_client() as app:
+            new_codename(app, session)
+            _dummy_submission(app)
+            resp = app.post('/submit', data=dict(
+                msg="This is a test.",
+                fh=(StringIO(''), ''),
+            ), follow_redirects=True)
+            assert resp.status_code == 200
+            assert async_genkey.called
 
-            with source_app.test_client() as app:
-                new_codename(app, session)
-                _dummy_submission(app)
-                resp = app.post('/submit', data=dict(
-                    msg="This is a test.",
-                    fh=(StringIO(''), ''),
-                ), follow_redirects=True)
-                assert resp.status_code == 200
-                assert not async_genkey.called
 
+def _start_upload(app, filename, size):
+    resp = app.post('/upload', data=dict(filename=filename, size=size))
+    assert resp.status_code == 200
+    return json.loads(resp.data)
 
-def test_submit_message_with_enough_entropy(source_app):
-    with patch.object(source_app_main, 'async_genkey') as async_genkey:
-        with patch.object(source_app_main, 'get_entropy_estimate') \
-                as get_entropy_estimate:
-            get_entropy_estimate.return_value = 2400
 
-            with source_app.test_client() as app:
-                new_codename(app, session)
-                _dummy_submission(app)
-                resp = app.post('/submit', data=dict(
-                    msg="This is a test.",
-                    fh=(StringIO(''), ''),
-                ), follow_redirects=True)
+def _append_upload(app, upload, chunk, offset=None):
+    return app.post('/upload/{}?offset={}'.format(
+        upload['id'], upload['offset'] if offset is None else offset),
+        data=chunk, content_type='application/octet-stream')
+
+
+def test_chunked_upload(source_app):
+    data = os.urandom(1024 * 10)
+    with source_app.test_client() as app:
+        new_codename(app, session)
+        upload = _start_upload(app, 'leak.pdf', len(data))
+        assert upload['offset'] == 0
+        assert upload['size'] == len(data)
+        upload_path = os.path.join(source_app_uploads.UPLOAD_DIR,
+                                   '{}.aes'.format(upload['id']))
+        assert os.path.exists(upload_path)
+
+        for start in range(0, len(data), 4096):
+            resp = _append_upload(app, upload, data[start:start + 4096])
+            assert resp.status_code == 200
+            upload = json.loads(resp.data)
+            assert upload['offset'] == min(start + 4096, len(data))
+
+        resp = app.post('/submit', data=dict(msg='', upload_id=upload['id']),
+                        follow_redirects=True)
+        assert resp.status_code == 200
+        assert 'upload' not in session
+        assert not os.path.exists(upload_path)
+
+        source = Source.query.filter_by(
+            filesystem_id=session['filesystem_id']).one()
+        submission, = source.submissions
+        assert submission.filename.endswith('-doc.gz.gpg')
+        with open(current_app.storage.path(source.filesystem_id,
+                                           submission.filename)) as f:
+            plaintext = current_app.crypto_util.gpg.decrypt(f.read()).data
+        assert gzip.GzipFile(fileobj=StringIO(plaintext)).read() == data
+        assert 'leak.pdf\x00' in plaintext[:32]
+
+
+def test_chunked_upload_resumes(source_app):
+    data = os.urandom(1024 * 10)
+    with source_app.test_client() as app:
+        new_codename(app, session)
+        upload = _start_upload(app, 'leak.pdf', len(data))
+        upload = json.loads(_append_upload(app, upload, data[:4096]).data)
+
+        # The circuit dropped, so the browser didn't hear back about this
+        # chunk and asks again where to carry on from
+        resp = _append_upload(app, upload, data[4096:8192], offset=0)
+        assert resp.status_code == 409
+        assert json.loads(resp.data)['offset'] == 4096
+        assert _start_upload(app, 'leak.pdf', len(data)) == upload
+
+        resp = _append_upload(app, upload, data[4096:])
+        assert json.loads(resp.data)['offset'] == len(data)
+
+        upload_id = upload['id']
+        filename, f = source_app_uploads.finish(upload_id)
+        assert filename == 'leak.pdf'
+        assert f.read() == data
+        f.close()
+
+
+def test_unfinished_chunked_upload_is_not_submitted(source_app):
+    with source_app.test_client() as app:
+        new_codename(app, session)
+        upload = _start_upload(app, 'leak.pdf', 8192)
+        _append_upload(app, upload, os.urandom(4096))
+
+        resp = app.post('/submit', data=dict(msg='', upload_id=upload['id']),
+                        follow_redirects=True)
+        assert resp.status_code == 200
+        assert ("You must enter a message or choose a file to submit."
+                in resp.data.decode('utf-8'))
+
+
+def test_chunked_upload_too_large(source_app):
+    max_size = source_app.config['MAX_CONTENT_LENGTH']
+    with source_app.test_client() as app:
+        new_codename(app, session)
+        resp = app.post('/upload', data=dict(filename='leak.pdf',
+                                             size=max_size + 1))
+        assert resp.status_code == 400
+
+        upload = _start_upload(app, 'leak.pdf', 10)
+        resp = _append_upload(app, upload, os.urandom(11))
+        assert resp.status_code == 400
+
+
+def test_too_many_unfinished_uploads(source_app, tmpdir):
+    source_app.config['MAX_UNFINISHED_UPLOADS'] = 1
+    with patch.object(source_app_uploads, 'UPLOAD_DIR', str(tmpdir)):
+        with source_app.test_client() as app:
+            new_codename(app, session)
+            _start_upload(app, 'leak.pdf', 8192)
+            # Starting another file replaces the source's own upload
+            _start_upload(app, 'other.pdf', 8192)
+
+        with source_app.test_client() as app:
+            new_codename(app, session)
+            resp = app.post('/upload', data=dict(filename='leak.pdf',
+                                                 size=8192))
+            assert resp.status_code == 503
+            assert 'upload' not in session
+
+
+def test_logout_discards_chunked_upload(source_app):
+    with source_app.test_client() as app:
+        new_codename(app, session)
+        upload = _start_upload(app, 'leak.pdf', 8192)
+        app.get('/logout')
+        assert not os.path.exists(os.path.join(
+            source_app_uploads.UPLOAD_DIR, '{}.aes'.format(upload['id'])))
+
+
+def test_lookup_pages_replies(config, source_app):
+    config.REPLIES_PER_PAGE = 2
+    with source_app.app_context():
+        journalist, _ = utils.db_helper.init_journalist()
+        source, codename = utils.db_helper.init_source()
+        utils.db_helper.reply(journalist, source, 3)
+
+    with source_app.test_client() as app:
+        app.post('/login', data=dict(codename=codename),
+                 follow_redirects=True)
+        with patch.object(source_app.crypto_util, 'decrypt_many',
+                          wraps=source_app.crypto_util.decrypt_many) \
+                as decrypt_many:
+            resp = app.get('/lookup')
+            assert resp.status_code == 200
+            text = resp.data.decode('utf-8')
+            assert text.count('class="reply"') == 2
+            assert 'id="older-replies"' in text
+            assert len(decrypt_many.call_args[0][1]) == 2
+
+            resp = app.get('/lookup?page=2')
+            assert resp.status_code == 200
+            text = resp.data.decode('utf-8')
+            assert text.count('class="reply"') == 1
+            assert 'id="newer-replies"' in text
+
+
+def test_gpg_passphrase_derived_once_per_request(source_app):
+    with source_app.app_context():
+        journalist, _ = utils.db_helper.init_journalist()
+        source, codename = utils.db_helper.init_source()
+        utils.db_helper.reply(journalist, source, 2)
+
+    with patch.object(source_app.crypto_util, 'derive_passphrase',
+                      wraps=source_app.crypto_util.derive_passphrase) \
+            as derive_passphrase:
+        with source_app.test_client() as app:
+            app.post('/login', data=dict(codename=codename))
+            for _ in range(3):
+                resp = app.get('/lookup')
                 assert resp.status_code == 200
-                assert async_genkey.called
+                assert resp.data.decode('utf-8').count('class="reply"') == 2
+                # Never sent back to the browser
+                assert 'gpg_passphrase' not in session
+            assert derive_passphrase.call_count == 3
 
 
 def test_delete_all_successfully_deletes_replies(source_app):
@@ -489,6 +742,16 @@ def test_login_with_overly_long_codename(source_app):
                 "Called hash_codename for codename w/ invalid length"
 
 
+def test_login_when_scrypt_pool_is_saturated(source_app):
+    with patch('scrypt_pool.hash', side_effect=ScryptPoolSaturated()):
+        with source_app.test_client() as app:
+            resp = app.post('/login',
+                            data=dict(codename='ignored codename'),
+                            follow_redirects=True)
+            assert resp.status_code == 503
+            assert 'logged_in' not in session
+
+
 def test_failed_normalize_timestamps_logs_warning(source_app):
     """If a normalize timestamps event fails, the subprocess that calls
     touch will fail and exit 1. When this happens, the submission should
@@ -1,4 +1,5 @@
 # -*- coding: utf-8 -*-
+import gzip
 import os
 import pytest
 import re
@@ -14,7 +15,9 @@ from sdconfig import config
 import journalist_app
 import utils
 
-from store import Storage
+from cStringIO import StringIO
+from store import (Storage, GzipStream, COMPRESS_FAST, COMPRESS_MAX,
+                   COMPRESS_NONE, compression_level)
 
 
 class TestStore(unittest.TestCase):
@@ -135,8 +138,8 @@ class TestStore(unittest.TestCase):
                                   submission.filename)
                      for submission in submissions]
 
-        archive = zipfile.ZipFile(
-            current_app.storage.get_bulk_archive(submissions))
+        archive = zipfile.ZipFile(StringIO(''.join(
+            current_app.storage.get_bulk_archive(submissions))))
         archivefile_contents = archive.namelist()
 
         for archived_file, actual_file in zip(archivefile_contents, filenames):
@@ -165,3 +168,74 @@ class TestStore(unittest.TestCase):
         # None of the above files exist, so we expect the attempt to rename
         # the submission to fail and the original filename to be returned.
         self.assertEquals(original_filename, returned_filename)
+
+    def test_gzip_stream(self):
+        data = os.urandom(GzipStream.CHUNK_SIZE * 3 + 17) + 'A' * 4096
+        stream = GzipStream(StringIO(data), 'leak.pdf')
+
+        compressed = []
+        while True:
+            buf = stream.read(1024)
+            if not buf:
+                break
+            self.assertLessEqual(len(buf), 1024)
+            compressed.append(buf)
+
+        compressed = ''.join(compressed)
+        self.assertEqual(gzip.GzipFile(fileobj=StringIO(compressed)).read(),
+                         data)
+        # the original filename is recorded in the gzip header
+        self.assertIn('leak.pdf\x00', compressed[:32])
+
+    def test_save_file_submission(self):
+        source, _ = utils.db_helper.init_source()
+        data = os.urandom(1024 * 100)
+        filename = current_app.storage.save_file_submission(
+            source.filesystem_id, 1, source.journalist_filename,
+            'leak.pdf', StringIO(data))
+
+        self.assertEqual(filename,
+                         '1-{}-doc.gz.gpg'.format(source.journalist_filename))
+        ciphertext = open(current_app.storage.path(source.filesystem_id,
+                                                   filename)).read()
+        plaintext = current_app.crypto_util.gpg.decrypt(ciphertext).data
+        self.assertEqual(gzip.GzipFile(fileobj=StringIO(plaintext)).read(),
+                         data)
+
+    def test_save_compressed_file_submission(self):
+        source, _ = utils.db_helper.init_source()
+        data = b'\xff\xd8\xff\xe0' + 'A' * 1024 * 100
+        filename = current_app.storage.save_file_submission(
+            source.filesystem_id, 1, source.journalist_filename,
+            'leak.jpg', StringIO(data))
+
+        ciphertext = open(current_app.storage.path(source.filesystem_id,
+                                                   filename)).read()
+        plaintext = current_app.crypto_util.gpg.decrypt(ciphertext).data
+        # the JPEG was stored rather than compressed, and still has its name
+        self.assertGreater(len(plaintext), len(data))
+        self.assertIn('leak.jpg\x00', plaintext[:32])
+        self.assertEqual(gzip.GzipFile(fileobj=StringIO(plaintext)).read(),
+                         data)
+
+    def test_compression_level(self):
+        text = 'All work and no play makes Jack a dull boy. ' * 1000
+        self.assertEqual(compression_level(text), COMPRESS_MAX)
+        self.assertEqual(compression_level(os.urandom(1024)), COMPRESS_NONE)
+        self.assertEqual(compression_level(text[:512] + os.urandom(512)),
+                         COMPRESS_FAST)
+        self.assertEqual(compression_level(''), COMPRESS_NONE)
+        for magic in ('PK\x03\x04', '\x1f\x8b', '\xff\xd8\xff\xe0',
+                      '\x00\x00\x00\x18ftypmp42',
+                      'RIFF\x00\x00\x00\x00WEBPVP8 '):
+            self.assertEqual(compression_level(magic + text), COMPRESS_NONE)
+
+    def test_gzip_stream_head(self):
+        data = 'A' * 4096 + os.urandom(GzipStream.CHUNK_SIZE)
+        stream = StringIO(data)
+        head = stream.read(100)
+        compressed = GzipStream(stream, 'leak.txt',
+                                compresslevel=COMPRESS_NONE, head=head).read()
+
+        self.assertEqual(gzip.GzipFile(fileobj=StringIO(compressed)).read(),
+                         data)
@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+import os
+
+from mock import patch
+from redis.exceptions import ConnectionError as RedisConnectionError
+
+import worker
+
+
+def test_queues_are_kept_apart_when_testing():
+    for name in worker.QUEUES:
+        queue = worker.get_queue(name)
+        assert queue.name == 'test_' + name
+        assert worker.get_queue(name) is queue
+
+
+def test_connections_share_a_pool():
+    assert (worker.get_connection().connection_pool is
+            worker.get_queue(worker.DELETION).connection.connection_pool)
+
+
+def test_enqueue_runs_job_in_process_without_redis():
+    with patch.object(worker, 'get_queue') as get_queue, \
+            patch.object(worker, 'get_local_worker') as get_local_worker:
+        get_queue.return_value.enqueue.side_effect = \
+            RedisConnectionError('Connection refused')
+        job = worker.enqueue(worker.DELETION, os.mkdir, '/tmp/x',
+                             timeout=60, durable=False)
+
+    assert job == get_local_worker.return_value.enqueue.return_value
+    get_local_worker.return_value.enqueue.assert_called_once_with(
+        worker.DELETION, os.mkdir, ('/tmp/x',), {}, dict(timeout=60),
+        durable=False)
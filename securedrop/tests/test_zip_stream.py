@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+import os
+import pytest
+import zipfile
+
+from cStringIO import StringIO
+from mock import patch
+
+from zip_stream import ZipStream
+
+
+def _make_files(tmpdir, contents):
+    members = []
+    for i, content in enumerate(contents):
+        path = tmpdir.join('{}-doc.gpg'.format(i))
+        path.write(content, mode='wb')
+        members.append((str(path),
+                        os.path.join('source', str(i), path.basename)))
+    return members
+
+
+def test_zip_stream_round_trip(tmpdir):
+    contents = [os.urandom(ZipStream.CHUNK_SIZE * 2 + 5), '', 'short']
+    members = _make_files(tmpdir, contents)
+
+    archive = zipfile.ZipFile(StringIO(''.join(ZipStream(members))))
+
+    assert archive.testzip() is None
+    assert archive.namelist() == [arcname for _, arcname in members]
+    for (_, arcname), content in zip(members, contents):
+        assert archive.getinfo(arcname).compress_type == zipfile.ZIP_STORED
+        assert archive.read(arcname) == content
+
+
+def test_zip_stream_unicode_arcname(tmpdir):
+    path = tmpdir.join('1-doc.gpg')
+    path.write('data')
+
+    archive = zipfile.ZipFile(StringIO(''.join(
+        ZipStream([(str(path), u'señora/1-doc.gpg')]))))
+
+    assert archive.read(u'señora/1-doc.gpg') == 'data'
+
+
+def test_zip_stream_zip64_offsets(tmpdir):
+    """Archives whose members start beyond 4GiB need ZIP64 records. Lower
+    the limit so we don't have to write that much data to exercise them."""
+    contents = [os.urandom(40) for _ in range(5)]
+    members = _make_files(tmpdir, contents)
+
+    with patch('zipfile.ZIP64_LIMIT', 100):
+        data = ''.join(ZipStream(members))
+
+    assert zipfile.stringEndArchive64 in data
+    archive = zipfile.ZipFile(StringIO(data))
+    for (_, arcname), content in zip(members, contents):
+        assert archive.read(arcname) == content
+
+
+def test_zip_stream_refuses_large_members(tmpdir):
+    members = _make_files(tmpdir, ['x' * 200])
+
+    with patch('zipfile.ZIP64_LIMIT', 100):
+        with pytest.raises(zipfile.LargeZipFile):
+            ''.join(ZipStream(members))
@@ -48,21 +48,27 @@ def reply(journalist, source, num_replies):
     :returns: A list of the :class:`models.Reply`s submitted.
     """
     assert num_replies >= 1
-    replies = []
+    recipients = [current_app.crypto_util.getkey(source.filesystem_id),
+                  config.JOURNALIST_KEY]
+    fnames = []
+    messages = []
     for _ in range(num_replies):
         source.interaction_count += 1
         fname = "{}-{}-reply.gpg".format(source.interaction_count,
                                          source.journalist_filename)
-        current_app.crypto_util.encrypt(
-            str(os.urandom(1)),
-            [current_app.crypto_util.getkey(source.filesystem_id),
-             config.JOURNALIST_KEY],
-            current_app.storage.path(source.filesystem_id, fname))
-
+        fnames.append(fname)
+        messages.append(
+            (str(os.urandom(1)),
+             recipients,
+             current_app.storage.path(source.filesystem_id, fname)))
+
+    # A Reply needs its file to exist, to know its size
+    current_app.crypto_util.encrypt_many(messages)
+    replies = []
+    for fname in fnames:
         reply = models.Reply(journalist, source, fname)
         replies.append(reply)
         db.session.add(reply)
-
     db.session.commit()
     return replies
 
@@ -117,14 +123,16 @@ def init_source_without_keypair():
 def init_source():
     """Initialize a source: create their database record, the
     filesystem directory that stores their submissions & replies,
-    and their GPG key encrypted with their codename. Return a source
-    object and their codename string.
+    and their GPG key encrypted with the passphrase derived from their
+    codename. Return a source object and their codename string.
 
     :returns: A 2-tuple. The first entry, the :class:`models.Source`
     initialized. The second, their codename string.
     """
     source, codename = init_source_without_keypair()
-    current_app.crypto_util.genkeypair(source.filesystem_id, codename)
+    current_app.crypto_util.genkeypair(
+        source.filesystem_id,
+        current_app.crypto_util.derive_passphrase(codename))
 
     return source, codename
 
@@ -1,14 +1,128 @@
+import logging
 import os
 
-from redis import Redis
+from redis import ConnectionPool, Redis
+from redis.exceptions import ConnectionError as RedisConnectionError
 from rq import Queue
 
-queue_name = 'test' if os.environ.get(
-    'SECUREDROP_ENV') == 'test' else 'default'
+from local_worker import LocalWorker
+from sdconfig import config
 
-# `srm` can take a long time on large files, so allow it run for up to an hour
-q = Queue(name=queue_name, connection=Redis(), default_timeout=3600)
+DEFAULT_REDIS_URL = 'redis://localhost:6379/0'
 
+# Where jobs are queued: 'rq' queues them on Redis, and only runs them in
+# process (see `local_worker`) when it can't be reached. 'local' always runs
+# them in process, which is quicker in tests and needs no worker.
+RQ = 'rq'
+LOCAL = 'local'
+DEFAULT_JOB_BACKEND = RQ
+DEFAULT_LOCAL_JOB_THREADS = 2
 
-def enqueue(*args, **kwargs):
-    return q.enqueue(*args, **kwargs)
+# The keyword arguments of `rq.Queue.enqueue` that are options of the job
+# rather than arguments of its function
+RQ_OPTIONS = ('timeout', 'description', 'result_ttl', 'ttl', 'job_id', 'meta')
+
+# Jobs are queued by what they do, so that a kind of job added later is
+# never stuck behind hour-long deletions. Each queue has workers of its own
+# in production (see securedrop_worker.conf), and a worker listening on
+# several takes jobs from the first of them that has any, so the queues are
+# listed from the highest priority to the lowest. Reply keypairs aren't
+# generated on a queue, see `keygen`.
+DELETION = 'deletion'
+QUEUES = [DELETION]
+
+# The queue every job went on before there was one for each kind of job.
+# Nothing listens on it any more, see `manage.py migrate-worker-queues`.
+LEGACY_QUEUE = 'default'
+
+# How long a job may run for by default. `srm` can take a long time on large
+# files, so deletions are allowed to run for longer (see `deletion`).
+DEFAULT_TIMEOUTS = {
+    DELETION: 60 * 60,
+}
+
+_pool = None
+_queues = {}
+_local_worker = None
+
+
+def queue_name(name):
+    """Return the name of the Redis queue `name` from `QUEUES`, which is
+    kept apart from production's when testing."""
+    if os.environ.get('SECUREDROP_ENV') == 'test':
+        return 'test_{}'.format(name)
+    return name
+
+
+def get_connection():
+    """Return a connection to the Redis server at `REDIS_URL`. They all
+    share one pool, which isn't created until it's needed, so that importing
+    this doesn't need Redis to be reachable."""
+    global _pool
+    if _pool is None:
+        _pool = ConnectionPool.from_url(
+            getattr(config, 'REDIS_URL', DEFAULT_REDIS_URL))
+    return Redis(connection_pool=_pool)
+
+
+def get_queue(name):
+    """Return the queue `name` from `QUEUES`, or `LEGACY_QUEUE`."""
+    if name not in _queues:
+        _queues[name] = Queue(name=queue_name(name),
+                              connection=get_connection(),
+                              default_timeout=DEFAULT_TIMEOUTS.get(name))
+    return _queues[name]
+
+
+def _hand_back(name, func, args, kwargs, options):
+    # Queue a job that was run locally on Redis after all
+    get_queue(name).enqueue_call(func, args=args, kwargs=kwargs, **options)
+
+
+def _local_jobs_file():
+    return getattr(config, 'LOCAL_JOBS_FILE',
+                   os.path.join(config.SECUREDROP_DATA_ROOT, 'jobs.sqlite'))
+
+
+def get_local_worker():
+    """Return this process's :class:`LocalWorker`, which hands the jobs it
+    has back to Redis when it's reachable again unless `JOB_BACKEND` is
+    'local'."""
+    global _local_worker
+    if _local_worker is None:
+        backend = getattr(config, 'JOB_BACKEND', DEFAULT_JOB_BACKEND)
+        _local_worker = LocalWorker(
+            _local_jobs_file(),
+            threads=getattr(config, 'LOCAL_JOB_THREADS',
+                            DEFAULT_LOCAL_JOB_THREADS),
+            hand_back=_hand_back if backend == RQ else None)
+    return _local_worker
+
+
+def enqueue(name, f, *args, **kwargs):
+    """Queue a job running `f` on the queue `name` from `QUEUES`. The rest of
+    the arguments are those of :meth:`rq.Queue.enqueue`, and `durable`: if
+    it's False and the job is run in process, it isn't written to the disk.
+
+    Returns the job, or None if it's run in process and a job with the same
+    `job_id` is already waiting or running there.
+    """
+    durable = kwargs.pop('durable', True)
+    if getattr(config, 'JOB_BACKEND', DEFAULT_JOB_BACKEND) == RQ:
+        try:
+            job = get_queue(name).enqueue(f, *args, **kwargs)
+        except RedisConnectionError as e:
+            logging.getLogger(__name__).warning(
+                "Redis is unavailable, running {} in process: {}".format(
+                    f.__name__, e))
+        else:
+            if _local_worker is None and \
+                    os.path.exists(_local_jobs_file()):
+                # Have jobs left from when Redis was unavailable handed back
+                get_local_worker()
+            return job
+
+    options = dict((option, kwargs.pop(option))
+                   for option in RQ_OPTIONS if option in kwargs)
+    return get_local_worker().enqueue(name, f, args, kwargs, options,
+                                      durable=durable)
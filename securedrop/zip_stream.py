@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+import os
+import struct
+import time
+import zipfile
+import zlib
+
+
+class ZipStream(object):
+    """A ZIP archive of existing files, produced as an iterator over its
+    bytes.
+
+    :class:`zipfile.ZipFile` needs to seek back over each member's header
+    once the member has been written, so it can only write to a real file.
+    This writer never seeks: every member's CRC and size follow its data in
+    a data descriptor, so the archive can be sent to the client while it's
+    being read from disk, with nothing written to a temporary file.
+
+    Members are stored uncompressed. Individual members must be smaller
+    than 4GiB, but the archive as a whole may be larger.
+    """
+
+    CHUNK_SIZE = 1024 * 64
+
+    def __init__(self, members):
+        """
+        :param list members: (path, arcname) pairs for the files to put
+                             in the archive, in order.
+        """
+        self.members = members
+
+    def __iter__(self):
+        offset = 0
+        written = []
+        for path, arcname in self.members:
+            st = os.stat(path)
+            if st.st_size >= zipfile.ZIP64_LIMIT:
+                raise zipfile.LargeZipFile(
+                    "{} is too large to be streamed".format(arcname))
+
+            zinfo = zipfile.ZipInfo(arcname,
+                                    time.localtime(st.st_mtime)[:6])
+            zinfo.compress_type = zipfile.ZIP_STORED
+            zinfo.external_attr = (st.st_mode & 0xFFFF) << 16
+            zinfo.flag_bits = 0x08  # CRC and sizes follow the data
+            zinfo.header_offset = offset
+
+            header = zinfo.FileHeader()
+            offset += len(header)
+            yield header
+
+            crc = 0
+            size = 0
+            with open(path, 'rb') as f:
+                while True:
+                    buf = f.read(self.CHUNK_SIZE)
+                    if not buf:
+                        break
+                    crc = zlib.crc32(buf, crc)
+                    size += len(buf)
+                    yield buf
+            offset += size
+
+            zinfo.CRC = crc & 0xFFFFFFFF
+            zinfo.compress_size = zinfo.file_size = size
+            descriptor = struct.pack('<4L', 0x08074b50, zinfo.CRC, size, size)
+            offset += len(descriptor)
+            yield descriptor
+
+            written.append(zinfo)
+
+        central_directory = ''.join(self.__central_directory_header(zinfo)
+                                    for zinfo in written)
+        yield central_directory
+        yield self.__end_records(len(written), len(central_directory),
+                                 offset)
+
+    def __central_directory_header(self, zinfo):
+        filename, flag_bits = zinfo._encodeFilenameFlags()
+        extract_version = zinfo.extract_version
+        header_offset = zinfo.header_offset
+        extra = ''
+        if header_offset >= zipfile.ZIP64_LIMIT:
+            extra = struct.pack('<HHQ', 1, 8, header_offset)
+            header_offset = 0xFFFFFFFF
+            extract_version = max(45, extract_version)
+
+        dt = zinfo.date_time
+        dosdate = (dt[0] - 1980) << 9 | dt[1] << 5 | dt[2]
+        dostime = dt[3] << 11 | dt[4] << 5 | (dt[5] // 2)
+        return struct.pack(zipfile.structCentralDir,
+                           zipfile.stringCentralDir,
+                           zinfo.create_version, zinfo.create_system,
+                           extract_version, zinfo.reserved, flag_bits,
+                           zinfo.compress_type, dostime, dosdate,
+                           zinfo.CRC, zinfo.compress_size, zinfo.file_size,
+                           len(filename), len(extra), 0, 0,
+                           zinfo.internal_attr, zinfo.external_attr,
+                           header_offset) + filename + extra
+
+    def __end_records(self, count, size, offset):
+        records = ''
+        if (count >= 0xFFFF or size >= zipfile.ZIP64_LIMIT or
+                offset >= zipfile.ZIP64_LIMIT):
+            records += struct.pack(zipfile.structEndArchive64,
+                                   zipfile.stringEndArchive64,
+                                   44, 45, 45, 0, 0, count, count,
+                                   size, offset)
+            records += struct.pack(zipfile.structEndArchive64Locator,
+                                   zipfile.stringEndArchive64Locator,
+                                   0, offset + size, 1)
+            count = min(count, 0xFFFF)
+            size = min(size, 0xFFFFFFFF)
+            offset = min(offset, 0xFFFFFFFF)
+        records += struct.pack(zipfile.structEndArchive,
+                               zipfile.stringEndArchive,
+                               0, 0, count, count, size, offset, 0)
+        return records
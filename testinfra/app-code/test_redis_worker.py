@@ -6,26 +6,46 @@ securedrop_test_vars = pytest.securedrop_test_vars
 
 
 @pytest.mark.parametrize('config_line', [
-  '[program:securedrop_worker]',
-  'command=/usr/local/bin/rqworker',
+  '[group:securedrop_worker]',
+  'programs=securedrop_worker_deletion',
+])
+def test_redis_worker_group(File, config_line):
+    """
+    Ensure the SecureDrop Redis workers for all the queues are managed
+    by supervisor as one group.
+    """
+    f = File('/etc/supervisor/conf.d/securedrop_worker.conf')
+    regex = re.escape(config_line)
+    assert f.contains('^{}$'.format(regex))
+
+
+@pytest.mark.parametrize('queue,workers,nice', [
+  ('deletion', 1, 19),
+])
+@pytest.mark.parametrize('config_line', [
+  '[program:securedrop_worker_{queue}]',
+  'command=/usr/bin/nice -n {nice} /usr/local/bin/rqworker {queue}',
+  'process_name=%(program_name)s_%(process_num)s',
+  'numprocs={workers}',
   "directory={}".format(securedrop_test_vars.securedrop_code),
   'autostart=true',
   'autorestart=true',
   'startretries=3',
-  'stderr_logfile=/var/log/securedrop_worker/err.log',
-  'stdout_logfile=/var/log/securedrop_worker/out.log',
+  'stderr_logfile=/var/log/securedrop_worker/{queue}-%(process_num)s-err.log',
+  'stdout_logfile=/var/log/securedrop_worker/{queue}-%(process_num)s-out.log',
   "user={}".format(securedrop_test_vars.securedrop_user),
   'environment=HOME="/tmp/python-gnupg"',
 ])
-def test_redis_worker_configuration(File, config_line):
+def test_redis_worker_configuration(File, queue, workers, nice, config_line):
     """
     Ensure SecureDrop Redis worker config for supervisor service
-    management is configured correctly.
+    management is configured correctly, for each of the queues.
     """
     f = File('/etc/supervisor/conf.d/securedrop_worker.conf')
     # Config lines may have special characters such as [] which will
     # throw off the regex matching, so let's escape those chars.
-    regex = re.escape(config_line)
+    regex = re.escape(config_line.format(queue=queue, workers=workers,
+                                         nice=nice))
     assert f.contains('^{}$'.format(regex))
 
 
@@ -70,6 +70,15 @@ def test_securedrop_tmp_clean_cron(Command, Sudo):
         assert cronjob in cronlist
 
 
+def test_securedrop_uploads_clean_cron(Command, Sudo):
+    """ Ensure unfinished uploads clean cron job in place """
+    with Sudo():
+        cronlist = Command("crontab -l").stdout
+        cronjob = "@hourly {}/manage.py clean-uploads".format(
+            sdvars.securedrop_code)
+        assert cronjob in cronlist
+
+
 def test_app_workerlog_dir(File, Sudo):
     """ ensure directory for worker logs is present """
     f = File('/var/log/securedrop_worker')